@@ -0,0 +1,231 @@
+import gzip
+import json
+import os
+from datetime import datetime, time as dt_time, timedelta
+from pathlib import Path
+from collections import deque
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .pagination import LogPagination
+from .models import LogModel
+
+
+def archive_dir():
+    return Path(getattr(settings, "LOG_ARCHIVE_DIR", settings.BASE_DIR / "log_archive"))
+
+
+def retention_days():
+    return getattr(settings, "LOG_RETENTION_DAYS", 90)
+
+
+def horizon(days=None):
+    """Start of the oldest day still kept in the database."""
+    day = timezone.localdate() - timedelta(days=retention_days() if days is None else days)
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+def archive_path(day):
+    return archive_dir() / f"{day:%Y}" / f"{day:%m}" / f"logs-{day:%Y-%m-%d}.jsonl.gz"
+
+
+def archive_logs(days=None, batch_size=5000):
+    """
+    Move every log row older than the horizon into one gzipped JSON lines
+    file per day and delete it from the database, `batch_size` rows at a
+    time, oldest first. Each batch is appended to its files before the rows
+    are deleted, so a crash in between leaves duplicates (dropped on read and
+    by `compact`) and never loses a row. Returns the number of rows moved.
+    `days` can only push the horizon further back: LogView reads the archive
+    only past LOG_RETENTION_DAYS, anything newer archived would vanish.
+    """
+    if days is not None and days < retention_days():
+        raise ValueError(f"days can't be less than LOG_RETENTION_DAYS ({retention_days()}).")
+    cutoff = horizon(days)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                LogModel.objects.filter(timestamp__lt=cutoff)
+                .order_by("timestamp", "id")
+                .values_list("id", "user_id", "user__username", "action", "timestamp", "details")[:batch_size]
+            )
+            if not rows:
+                return moved
+            by_day = {}
+            for row in rows:
+                by_day.setdefault(timezone.localdate(row[4]), []).append(row)
+            for day, day_rows in by_day.items():
+                path = archive_path(day)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Appending adds a new gzip member, gzip.open reads them all back.
+                with gzip.open(path, "at", encoding="utf-8") as archive:
+                    for log_id, user_id, username, action, timestamp, details in day_rows:
+                        archive.write(json.dumps({
+                            "id": log_id,
+                            "user_id": user_id,
+                            "username": username,
+                            "action": action,
+                            "timestamp": timestamp.isoformat(),
+                            "details": details,
+                        }) + "\n")
+            LogModel.objects.filter(id__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+
+
+def read_day(day):
+    """Archived entries of one day, without duplicates, newest first."""
+    path = archive_path(day)
+    if not path.exists():
+        return []
+    entries = {}
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            entry = json.loads(line)
+            entries[entry["id"]] = entry
+    return sorted(entries.values(), key=lambda entry: (entry["timestamp"], entry["id"]), reverse=True)
+
+
+def compact(days=None):
+    """Rewrite the archive files of the last `days` days (all of them by default) as single sorted, deduplicated members."""
+    root = archive_dir()
+    if not root.exists():
+        return 0
+    oldest = None if days is None else timezone.localdate() - timedelta(days=days)
+    rewritten = 0
+    for path in sorted(root.glob("*/*/logs-*.jsonl.gz")):
+        day = datetime.strptime(path.name[5:15], "%Y-%m-%d").date()
+        if oldest is not None and day < oldest:
+            continue
+        entries = reversed(read_day(day))
+        tmp = path.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as archive:
+            for entry in entries:
+                archive.write(json.dumps(entry) + "\n")
+        os.replace(tmp, path)
+        rewritten += 1
+    return rewritten
+
+
+def user_order(user_id):
+    # Logs of deleted users (user set to NULL) come last.
+    return (user_id is None, user_id or 0)
+
+
+def day_users(day):
+    """{user_id: (username, {actions})} of the entries archived on `day`."""
+    path = archive_path(day)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return {}
+    # Keyed on mtime and size: archiving more rows or compacting reads the file again.
+    return read_users(path, stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=1024)
+def read_users(path, mtime_ns, size):
+    users = {}
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            entry = json.loads(line)
+            users.setdefault(entry["user_id"], (entry["username"], set()))[1].add(entry["action"])
+    return users
+
+
+def archive_days(since, newer=False):
+    first, last = timezone.localdate(since), timezone.localdate()
+    days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+    return days if newer else days[::-1]
+
+
+def archived_users(since, action=None, username=None):
+    """Ids of the users with archived logs from `since` on, matching the filters."""
+    users = set()
+    for day in archive_days(since):
+        for user_id, (name, actions) in day_users(day).items():
+            if (action is None or action in actions) and (username is None or name == username):
+                users.add(user_id)
+    return users
+
+
+def archived_logs(since, user_id, action=None, position=None, newer=False):
+    """
+    (user_id, username, timestamp, id, action, details) of one user's
+    archived logs from `since` on, newest first, starting after `position`
+    ((timestamp, id) of the last log already read). With `newer` they go the
+    other way: oldest first, starting from the log just newer than
+    `position`. Only the files of the days the user has logs on are read.
+    """
+    for day in archive_days(since, newer):
+        if position is not None and (day < timezone.localdate(position[0]) if newer else day > timezone.localdate(position[0])):
+            continue
+        if user_id not in day_users(day):
+            continue
+        entries = read_day(day)
+        if newer:
+            entries.reverse()
+        for entry in entries:
+            if entry["user_id"] != user_id or (action is not None and entry["action"] != action):
+                continue
+            key = (datetime.fromisoformat(entry["timestamp"]), entry["id"])
+            if key[0] < since:
+                continue
+            if position is not None and (key <= position if newer else key >= position):
+                continue
+            yield user_id, entry["username"], key[0], key[1], entry["action"], entry["details"]
+
+
+class ArchivedLogPagination(LogPagination):
+    """
+    LogPagination over the database rows with each user's archived logs
+    after theirs when the window reaches past the retention horizon. Every
+    archived log is older than the user's rows left in the database, so the
+    archive simply continues each user's (-timestamp, -id) run. A user's
+    archive files are only read once the page gets to that user.
+    """
+
+    def __init__(self, since, action=None, username=None):
+        self.since = since
+        self.action = action
+        self.username = username
+
+    def rows(self, queryset, position, reverse):
+        rows = super().rows(queryset, position, reverse)
+        if self.since >= horizon():
+            return rows
+        return self.merge(rows, position, reverse)
+
+    def merge(self, rows, position, reverse):
+        def earlier(user_id, other):
+            # Which of the two users the page gets to first.
+            return user_order(user_id) > user_order(other) if reverse else user_order(user_id) < user_order(other)
+
+        def archived(user_id):
+            after = position[1:] if position is not None and user_id == position[0] else None
+            return archived_logs(self.since, user_id, self.action, after, newer=reverse)
+
+        users = archived_users(self.since, self.action, self.username)
+        if position is not None:
+            users = [user_id for user_id in users if not earlier(user_id, position[0])]
+        pending = deque(sorted(users, key=user_order, reverse=reverse))
+
+        for user_id, group in groupby(rows, key=itemgetter(0)):
+            while pending and earlier(pending[0], user_id):
+                yield from archived(pending.popleft())
+            if pending and pending[0] == user_id:
+                pending.popleft()
+                # Backwards a user's archived logs, the oldest, come before their rows.
+                if reverse:
+                    yield from archived(user_id)
+                    yield from group
+                else:
+                    yield from group
+                    yield from archived(user_id)
+            else:
+                yield from group
+        while pending:
+            yield from archived(pending.popleft())
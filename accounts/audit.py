@@ -0,0 +1,190 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DataError, IntegrityError, connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import LogModel
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogSink:
+    """
+    Collects LogModel rows in memory and writes them with one bulk_create,
+    either when `batch_size` events are waiting or every `flush_interval`
+    seconds, from a background thread, plus a last flush at interpreter exit.
+
+    Events are queued on commit, so a rolled back transaction logs nothing
+    and the request's own transaction never waits on the log INSERT. In
+    "sync" mode (tests, management shells) every event is written straight
+    away inside the caller's transaction, like before.
+
+    A buffer that grows past `max_buffer` (the database is down or too slow)
+    drops the newest events and counts them in `stats()["dropped"]`. So do
+    single events the database refuses to store.
+    """
+
+    def __init__(self, mode="buffered", batch_size=500, flush_interval=2.0, max_buffer=10_000, background=True):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.background = background
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._counters = {"flushed": 0, "dropped": 0, "flush_failures": 0}
+        self._last_flush_lag = 0.0
+        self._max_flush_lag = 0.0
+
+    def log(self, user, action, details=""):
+        event = LogModel(user=user, action=action, details=details, timestamp=timezone.now())
+        if self.mode == "sync":
+            event.save()
+            return
+        transaction.on_commit(lambda: self._enqueue(event))
+
+    def log_many(self, user, action, details):
+        """One event per entry of `details`, written with a single INSERT in "sync" mode."""
+        now = timezone.now()
+        events = [LogModel(user=user, action=action, details=detail, timestamp=now) for detail in details]
+        if not events:
+            return
+        if self.mode == "sync":
+            LogModel.objects.bulk_create(events)
+            return
+        transaction.on_commit(lambda: self._enqueue(*events))
+
+    def _enqueue(self, *events):
+        with self._lock:
+            room = max(self.max_buffer - len(self._events), 0)
+            self._counters["dropped"] += max(len(events) - room, 0)
+            if not room:
+                return
+            queued = time.monotonic()
+            self._events.extend((queued, event) for event in events[:room])
+            full = len(self._events) >= self.batch_size
+        if self.background:
+            self._ensure_thread()
+            if full:
+                self._wakeup.set()
+
+    def _ensure_thread(self):
+        # A forked worker inherits the parent's sink but not its thread.
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close()
+
+    def flush(self):
+        """Write every buffered event, `batch_size` rows per INSERT. Returns the number written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+                if not batch:
+                    return written
+                try:
+                    with transaction.atomic():
+                        LogModel.objects.bulk_create([event for _, event in batch])
+                    saved, unsaved = len(batch), []
+                except Exception:
+                    logger.exception("Could not write %d audit log events", len(batch))
+                    with self._lock:
+                        self._counters["flush_failures"] += 1
+                    saved, unsaved = self._write_each(batch)
+                if saved:
+                    lag = time.monotonic() - batch[0][0]
+                    with self._lock:
+                        self._counters["flushed"] += saved
+                        self._last_flush_lag = lag
+                        self._max_flush_lag = max(self._max_flush_lag, lag)
+                    written += saved
+                if unsaved:
+                    with self._lock:
+                        room = self.max_buffer - len(self._events)
+                        self._events.extendleft(reversed(unsaved[:max(room, 0)]))
+                        self._counters["dropped"] += max(len(unsaved) - room, 0)
+                    return written
+
+    def _write_each(self, batch):
+        """
+        Insert the events of a failed batch one at a time, so one the
+        database can never take (its user deleted meanwhile, say) doesn't
+        hold back the others. Those are logged and dropped. Any other error
+        means the database is unavailable: the events not written yet are
+        returned to be put back. Returns (number written, unwritten events).
+        """
+        saved = 0
+        for index, (_, event) in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    LogModel.objects.bulk_create([event])
+            except (IntegrityError, DataError):
+                logger.exception("Dropped audit log event %s of user %s at %s: %r", event.action, event.user_id, event.timestamp, event.details)
+                with self._lock:
+                    self._counters["dropped"] += 1
+            except Exception:
+                return saved, batch[index:]
+            else:
+                saved += 1
+        return saved, []
+
+    def stats(self):
+        with self._lock:
+            oldest = self._events[0][0] if self._events else None
+            return {
+                "mode": self.mode,
+                "pending": len(self._events),
+                **self._counters,
+                "oldest_pending_s": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+                "last_flush_lag_s": round(self._last_flush_lag, 3),
+                "max_flush_lag_s": round(self._max_flush_lag, 3),
+            }
+
+
+audit_log = AuditLogSink(
+    mode=getattr(settings, "AUDIT_LOG_MODE", "sync"),
+    batch_size=getattr(settings, "AUDIT_LOG_BATCH_SIZE", 500),
+    flush_interval=getattr(settings, "AUDIT_LOG_FLUSH_INTERVAL", 2.0),
+    max_buffer=getattr(settings, "AUDIT_LOG_MAX_BUFFER", 10_000),
+)
+
+
+@receiver(setting_changed)
+def _follow_mode_setting(setting, **kwargs):
+    # The sink is built at import, override_settings (and the test runner) switch it here.
+    if setting == "AUDIT_LOG_MODE":
+        audit_log.mode = getattr(settings, "AUDIT_LOG_MODE", "sync")
+
+
+@atexit.register
+def _flush_at_exit():
+    if audit_log.mode != "sync":
+        try:
+            audit_log.flush()
+        except Exception:
+            logger.exception("Could not flush the audit log at shutdown")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts import archive
+
+
+class Command(BaseCommand):
+    help = "Move log rows older than the retention horizon into gzipped daily archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None, help="Horizon in days, LOG_RETENTION_DAYS or more (default: LOG_RETENTION_DAYS).")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows archived and deleted per transaction.")
+        parser.add_argument(
+            "--compact", nargs="?", type=int, const=0, default=None, metavar="DAYS",
+            help="Afterwards rewrite the archive files (only those of the last DAYS days if given) without duplicates.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            moved = archive.archive_logs(days=options["days"], batch_size=options["batch_size"])
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f"{moved} log rows archived to {archive.archive_dir()}."))
+        if options["compact"] is not None:
+            rewritten = archive.compact(days=options["compact"] or None)
+            self.stdout.write(self.style.SUCCESS(f"{rewritten} archive files compacted."))
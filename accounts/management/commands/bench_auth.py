@@ -0,0 +1,59 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from accounts.authentication import CachedTokenAuthentication, token_cache
+from accounts.permission import IsStaffOrManagerOrAdmin
+from analytics.benchmarks import bench_database, seed_catalog, measure
+
+
+class Command(BaseCommand):
+    help = "Compare TokenAuthentication and CachedTokenAuthentication plus the role check (runs on a throwaway database)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=2000)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        permission = IsStaffOrManagerOrAdmin()
+        results = []
+
+        with bench_database():
+            user, _ = seed_catalog(0, role="staff")
+            key = Token.objects.get(user=user).key
+
+            def make_call(authentication, cold=False):
+                def call():
+                    if cold:
+                        token_cache.clear()
+                    request = Request(factory.post("/wine-list-api/sale/", HTTP_AUTHORIZATION=f"Token {key}"))
+                    request.user, request.auth = authentication.authenticate(request)
+                    assert permission.has_permission(request, None)
+                return call
+
+            cases = [
+                ("TokenAuthentication", make_call(TokenAuthentication())),
+                ("CachedTokenAuthentication (cold)", make_call(CachedTokenAuthentication(), cold=True)),
+                ("CachedTokenAuthentication (warm)", make_call(CachedTokenAuthentication())),
+            ]
+            for name, call in cases:
+                call()
+                with CaptureQueriesContext(connection) as queries:
+                    call()
+                row = {"authentication": name, "queries": len(queries)}
+                row.update(measure(call, options["repeat"]))
+                results.append(row)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results:
+            self.stdout.write(
+                f"{row['authentication']:<34} queries={row['queries']}  "
+                f"p50={row['p50_ms'] * 1000:>8.1f}us  p95={row['p95_ms'] * 1000:>8.1f}us"
+            )
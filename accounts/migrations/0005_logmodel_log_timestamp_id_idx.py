@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_logmodel_action'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logmodel',
+            index=models.Index(fields=['timestamp', 'id'], name='log_timestamp_id_idx'),
+        ),
+    ]
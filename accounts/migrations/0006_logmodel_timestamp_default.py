@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_logmodel_log_timestamp_id_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logmodel',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_logmodel_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='logmodel',
+            index=models.Index(fields=['user', 'timestamp'], name='log_user_timestamp_idx'),
+        ),
+    ]
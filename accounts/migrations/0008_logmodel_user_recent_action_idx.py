@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_logmodel_user_timestamp_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='logmodel',
+            name='log_user_timestamp_idx',
+        ),
+        migrations.AddIndex(
+            model_name='logmodel',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='log_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='logmodel',
+            index=models.Index(fields=['action', 'timestamp'], name='log_action_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_logmodel_user_recent_action_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='logmodel',
+            name='action',
+            field=models.CharField(choices=[('sale_created', 'Sale Created'), ('user_logged_in', 'User Logged In'), ('user_logged_out', 'User Logged Out'), ('user_registered', 'User Registered'), ('wine_deleted', 'Wine Deleted'), ('restock', 'Restock'), ('refund', 'Refund'), ('wine_import', 'Wine Import')], max_length=50),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class UserProfile(models.Model):
     ROLE = {
@@ -22,10 +23,20 @@ class LogModel(models.Model):
         ('user_registered', 'User Registered'),
         ('wine_deleted', 'Wine Deleted'),
         ("restock", "Restock"),
-        ("refund", "Refund")
+        ("refund", "Refund"),
+        ("wine_import", "Wine Import")
     ]
     
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens, not when the buffered row is written.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     details = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["timestamp", "id"], name="log_timestamp_id_idx"),
+            # LogView reads one user after the other, newest first.
+            models.Index(fields=["user", "-timestamp", "-id"], name="log_user_recent_idx"),
+            models.Index(fields=["action", "timestamp"], name="log_action_timestamp_idx"),
+        ]
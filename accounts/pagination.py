@@ -0,0 +1,93 @@
+from datetime import datetime
+from itertools import islice
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.urls import remove_query_param
+from inventory_api.pagination import KeysetPagination
+
+
+class LogPagination(KeysetPagination):
+    """
+    Keyset pagination over log rows ordered by (user, -timestamp, -id), the
+    order LogView groups them in, logs of deleted users (user NULL) last.
+    The page is a lazy iterator of (user_id, username, timestamp, id,
+    action, details) tuples meant to be streamed, so the links are only
+    known once it has been read to the end.
+    """
+    ordering = ("user", "-timestamp", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        self.first = self.last = None
+        self.has_next = self.has_previous = False
+
+        self.cursor = self.decode_cursor(request)
+        position = None
+        if self.cursor is not None:
+            try:
+                user_id, timestamp, pk = self.cursor["position"]
+                position = (None if user_id is None else int(user_id), datetime.fromisoformat(timestamp), int(pk))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        reverse = bool(self.cursor and self.cursor["reverse"])
+        return self.read_page(self.rows(queryset, position, reverse), reverse)
+
+    def rows(self, queryset, position, reverse):
+        if position is not None:
+            queryset = queryset.filter(self.seek(position, after=not reverse))
+        if reverse:
+            queryset = queryset.order_by(F("user_id").desc(nulls_first=True), "timestamp", "id")
+        else:
+            queryset = queryset.order_by(F("user_id").asc(nulls_last=True), "-timestamp", "-id")
+        return iter(queryset.values_list("user_id", "user__username", "timestamp", "id", "action", "details")[:self.page_size + 1])
+
+    def read_page(self, rows, reverse):
+        if reverse:
+            # Read backwards from the cursor, the page is turned around before it goes out.
+            page = list(islice(rows, self.page_size + 1))
+            self.has_previous = len(page) > self.page_size
+            self.has_next = True
+            page = page[:self.page_size][::-1]
+            if page:
+                self.first, self.last = page[0], page[-1]
+            yield from page
+            return
+        self.has_previous = self.cursor is not None
+        for count, row in enumerate(rows):
+            if count == self.page_size:
+                self.has_next = True
+                return
+            if self.first is None:
+                self.first = row
+            self.last = row
+            yield row
+
+    def seek(self, position, after):
+        """Rows strictly after (or before) `position` in (user, -timestamp, -id) order."""
+        user_id, timestamp, pk = position
+        lookup = "lt" if after else "gt"
+        same_user = Q(user_id=user_id) if user_id is not None else Q(user_id__isnull=True)
+        condition = same_user & (Q(**{f"timestamp__{lookup}": timestamp}) | Q(timestamp=timestamp, **{f"id__{lookup}": pk}))
+        if user_id is None:
+            return condition if after else condition | Q(user_id__isnull=False)
+        if after:
+            return condition | Q(user_id__gt=user_id) | Q(user_id__isnull=True)
+        return condition | Q(user_id__lt=user_id)
+
+    def position(self, row):
+        return [row[0], row[2], row[3]]
+
+    def get_next_link(self):
+        if not self.has_next or self.last is None:
+            return None
+        return self.encode_cursor({"position": self.position(self.last), "reverse": False})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.first is None:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({"position": self.position(self.first), "reverse": True})
@@ -1,9 +1,13 @@
 from django.conf import settings
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import UserProfile, LogModel
+from .models import UserProfile
 from inventory_api.models import SaleModel, WineModel
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
+from .audit import audit_log
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -14,22 +18,43 @@ def user_role(sender, instance=None, created=False, **kwargs):
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def log_user_registeration(sender, instance=None, created=False, **kwargs):
     if created:
-        LogModel.objects.create(user=instance, action="user_registered")
+        audit_log.log(instance, "user_registered")
 
 @receiver(post_save, sender=SaleModel)
 def log_sale_created(sender, instance=None, created=False, **kwargs):
     if created:
-        LogModel.objects.create(user=instance.user, action="sale_created")
+        audit_log.log(instance.user, "sale_created")
 
 @receiver(post_delete, sender=WineModel)
 def log_wine_deleted(sender, instance=None, created=False, **kwargs):
     if instance.added_by:
-        LogModel.objects.create(user=instance.added_by, action="wine_deleted", details=f"deleted wine: {instance.name}")
+        audit_log.log(instance.added_by, "wine_deleted", f"deleted wine: {instance.name}")
 
 @receiver(user_logged_in)
 def log_login(sender, request, user, **kwargs):
-    LogModel.objects.create(user=user, action="user_logged_in", details=f"{user.username} Logged in.")
+    audit_log.log(user, "user_logged_in", f"{user.username} Logged in.")
 
 @receiver(user_logged_out)
 def log_logout(sender, request, user, **kwargs):
-    LogModel.objects.create(user=user, action="out", details=f"{user.username} Logged out.")
+    audit_log.log(user, "out", f"{user.username} Logged out.")
+
+
+def _invalidate_user(user_id):
+    # Now for this process, and again on commit in case a request cached
+    # the old row in between.
+    token_cache.invalidate_user(user_id)
+    transaction.on_commit(lambda: token_cache.invalidate_user(user_id))
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def invalidate_cached_role(sender, instance=None, **kwargs):
+    _invalidate_user(instance.user_id)
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance=None, created=False, **kwargs):
+    if not created:
+        _invalidate_user(instance.pk)
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance=None, **kwargs):
+    token_cache.invalidate_token(instance.key)
+    transaction.on_commit(lambda: token_cache.invalidate_token(instance.key))
@@ -1,8 +1,21 @@
-from django.test import TestCase
+import json
+import tempfile
+from io import StringIO
+from datetime import timedelta
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from accounts.authentication import token_cache
+from accounts.audit import AuditLogSink
+from accounts.models import LogModel
+from accounts import archive
 
 class UserCreationsTest(TestCase):
     
@@ -31,4 +44,255 @@ class UserCreationsTest(TestCase):
         # Password
         self.assertNotEqual(user.password, "Password123")
         self.assertTrue(user.password.startswith("pbkdf2_sha256$"))
-        self.assertTrue(user.check_password("Password123"))
\ No newline at end of file
+        self.assertTrue(user.check_password("Password123"))
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.client = APIClient()
+        self.url = "/accounts/logs/"
+        self.user = User.objects.create_user(username="Marco", password="Password123")
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def auth_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        auth = [q for q in queries if "authtoken_token" in q["sql"] or "accounts_userprofile" in q["sql"]]
+        return response, len(auth)
+
+    def test_single_query_then_cached(self):
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+
+        # Token, user and role in one query
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 1)
+
+        # Warm cache: no authentication query at all
+        response, queries = self.auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(queries, 0)
+
+    def test_role_change_invalidates(self):
+        # Default role is staff
+        response, _ = self.auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        profile = self.user.userprofile
+        profile.role = "manager"
+        profile.save()
+        response, _ = self.auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # A deleted token stops working straight away
+        self.token.delete()
+        response, _ = self.auth_queries()
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class AuditLogSinkTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="Marco", password="Password123")
+        LogModel.objects.all().delete()
+        self.sink = AuditLogSink(mode="buffered", batch_size=2, max_buffer=3, background=False)
+
+    def test_buffered_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.log(self.user, "sale_created")
+            self.sink.log(self.user, "refund", "2 bottles refunded")
+        # Queued on commit, nothing written yet
+        self.assertEqual(LogModel.objects.count(), 0)
+        self.assertEqual(self.sink.stats()["pending"], 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sink.flush(), 2)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith("INSERT")]), 1)
+        self.assertEqual(list(LogModel.objects.order_by("id").values_list("action", flat=True)), ["sale_created", "refund"])
+        stats = self.sink.stats()
+        self.assertEqual((stats["pending"], stats["flushed"], stats["dropped"]), (0, 2, 0))
+
+    def test_rollback_and_overflow(self):
+        # Rolled back: never queued
+        with self.captureOnCommitCallbacks(execute=False):
+            self.sink.log(self.user, "sale_created")
+        self.assertEqual(self.sink.stats()["pending"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(5):
+                self.sink.log(self.user, "sale_created")
+        stats = self.sink.stats()
+        self.assertEqual((stats["pending"], stats["dropped"]), (3, 2))
+
+    def test_bad_event_dropped_alone(self):
+        # An event the database refuses fails its batch, the others are still written one by one
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.log(self.user, "sale_created")
+            self.sink.log(self.user, None)
+            self.sink.log(self.user, "refund")
+        with self.assertLogs("accounts.audit", "ERROR"):
+            self.assertEqual(self.sink.flush(), 2)
+        self.assertEqual(list(LogModel.objects.order_by("id").values_list("action", flat=True)), ["sale_created", "refund"])
+        stats = self.sink.stats()
+        self.assertEqual((stats["pending"], stats["flushed"], stats["dropped"], stats["flush_failures"]), (0, 2, 1, 1))
+
+        # Later events keep flowing
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sink.log(self.user, "sale_created")
+        self.assertEqual(self.sink.flush(), 1)
+
+class LogArchiveTest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = override_settings(LOG_ARCHIVE_DIR=self.tmp.name, LOG_RETENTION_DAYS=10)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        token_cache.clear()
+        self.user = User.objects.create_user(username="Marco", password="Password123")
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get(user=self.user).key}")
+
+        LogModel.objects.all().delete()
+        now = timezone.now()
+        for days in (1, 2, 3, 15, 16, 17, 40):
+            LogModel.objects.create(user=self.user, action="sale_created", details=f"{days} days ago", timestamp=now - timedelta(days=days))
+
+    def details(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [entry["details"] for entry in json.loads(b"".join(response.streaming_content))["results"]["Marco"]]
+
+    def pages(self, url):
+        """details of each page following the next links, then those of the previous links back."""
+        forward, backward = [], []
+        page = {"next": url}
+        while page["next"]:
+            page = json.loads(b"".join(self.client.get(page["next"]).streaming_content))
+            forward.append([entry["details"] for entries in page["results"].values() for entry in entries])
+        while page["previous"]:
+            page = json.loads(b"".join(self.client.get(page["previous"]).streaming_content))
+            backward.append([entry["details"] for entries in page["results"].values() for entry in entries])
+        return forward, backward
+
+    def test_archive_and_read_back(self):
+        call_command("archive_logs", stdout=StringIO())
+        self.assertEqual(LogModel.objects.count(), 3)
+        self.assertEqual(len(archive.read_day(timezone.localdate() - timedelta(days=15))), 1)
+
+        # A crash after writing but before deleting archives the row twice
+        archived = archive.read_day(timezone.localdate() - timedelta(days=15))[0]
+        LogModel.objects.create(id=archived["id"], user=self.user, action="sale_created", details="15 days ago", timestamp=timezone.now() - timedelta(days=15))
+        archive.archive_logs()
+        self.assertEqual(len(archive.read_day(timezone.localdate() - timedelta(days=15))), 1)
+        call_command("archive_logs", "--compact", stdout=StringIO())
+
+        # A horizon inside the retention would hide rows LogView no longer reads from the table
+        with self.assertRaises(CommandError):
+            call_command("archive_logs", "--days", "5", stdout=StringIO())
+        self.assertEqual(LogModel.objects.count(), 3)
+        call_command("archive_logs", "--days", "30", stdout=StringIO())
+        self.assertEqual(LogModel.objects.count(), 3)
+
+        # Inside the horizon only the database is read
+        self.assertEqual(self.details("/accounts/logs/?days=5"), ["1 days ago", "2 days ago", "3 days ago"])
+
+        # Past it the archived entries follow the table's
+        self.assertEqual(
+            self.details("/accounts/logs/?days=30"),
+            ["1 days ago", "2 days ago", "3 days ago", "15 days ago", "16 days ago", "17 days ago"],
+        )
+
+    def test_pages_run_on_into_the_archive(self):
+        other = User.objects.create_user(username="Luca", password="Password123")
+        LogModel.objects.filter(user=other).delete()
+        LogModel.objects.create(user=other, action="refund", details="Luca 20 days ago", timestamp=timezone.now() - timedelta(days=20))
+        LogModel.objects.create(user=other, action="refund", details="Luca 1 days ago", timestamp=timezone.now() - timedelta(days=1))
+        archive.archive_logs()
+
+        forward, backward = self.pages("/accounts/logs/?days=30&page_size=2")
+        self.assertEqual(forward, [
+            ["1 days ago", "2 days ago"],
+            ["3 days ago", "15 days ago"],
+            ["16 days ago", "17 days ago"],
+            ["Luca 1 days ago", "Luca 20 days ago"],
+        ])
+        self.assertEqual(backward, forward[-2::-1])
+
+        # A user with only archived logs in the window still gets a page
+        LogModel.objects.filter(user=other).delete()
+        forward, _ = self.pages("/accounts/logs/?days=30&page_size=4&action=refund")
+        self.assertEqual(forward, [["Luca 20 days ago"]])
+
+class LogViewTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.manager = User.objects.create_user(username="Marco", password="Password123")
+        self.manager.userprofile.role = "manager"
+        self.manager.userprofile.save()
+        self.staff = User.objects.create_user(username="Luca", password="Password123")
+        self.gone = User.objects.create_user(username="Paolo", password="Password123")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.get(user=self.manager).key}")
+
+        LogModel.objects.all().delete()
+        now = timezone.now()
+        for user in (self.manager, self.staff, self.gone):
+            for hours, action in ((1, "sale_created"), (2, "refund"), (3, "sale_created")):
+                LogModel.objects.create(user=user, action=action, details=f"{hours}h", timestamp=now - timedelta(hours=hours))
+        LogModel.objects.create(user=self.staff, action="sale_created", details="old", timestamp=now - timedelta(days=60))
+        # Logs keep their rows with user NULL once the user is deleted
+        self.gone.delete()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = json.loads(b"".join(response.streaming_content))
+        return data["results"], len(queries)
+
+    def test_grouped_by_user_in_one_query(self):
+        self.get("/accounts/logs/")
+        data, queries = self.get("/accounts/logs/")
+        self.assertEqual(queries, 1)
+        self.assertEqual(list(data), ["Marco", "Luca", "(deleted user)"])
+        self.assertEqual([entry["details"] for entry in data["Luca"]], ["1h", "2h", "3h"])
+        self.assertEqual(data["Marco"][1], {"action": "refund", "timestamp": data["Marco"][1]["timestamp"], "details": "2h"})
+
+    def test_filters(self):
+        data, _ = self.get("/accounts/logs/?action=refund")
+        self.assertEqual({name: len(entries) for name, entries in data.items()}, {"Marco": 1, "Luca": 1, "(deleted user)": 1})
+
+        data, _ = self.get("/accounts/logs/?user=Luca&days=90")
+        self.assertEqual([entry["details"] for entry in data["Luca"]], ["1h", "2h", "3h", "old"])
+        self.assertEqual(list(data), ["Luca"])
+
+        response = self.client.get("/accounts/logs/?days=abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_keyset_pages(self):
+        response = self.client.get("/accounts/logs/?page_size=4")
+        page = json.loads(b"".join(response.streaming_content))
+        self.assertEqual({name: len(entries) for name, entries in page["results"].items()}, {"Marco": 3, "Luca": 1})
+        self.assertIsNone(page["previous"])
+
+        # The second page picks Luca up where the first one stopped, deleted users last
+        page = json.loads(b"".join(self.client.get(page["next"]).streaming_content))
+        self.assertEqual({name: len(entries) for name, entries in page["results"].items()}, {"Luca": 2, "(deleted user)": 2})
+        page = json.loads(b"".join(self.client.get(page["next"]).streaming_content))
+        self.assertEqual(page["results"], {"(deleted user)": page["results"]["(deleted user)"]})
+        self.assertEqual(len(page["results"]["(deleted user)"]), 1)
+        self.assertIsNone(page["next"])
+
+        page = json.loads(b"".join(self.client.get(page["previous"]).streaming_content))
+        self.assertEqual({name: len(entries) for name, entries in page["results"].items()}, {"Luca": 2, "(deleted user)": 2})
+
+        response = self.client.get("/accounts/logs/?cursor=bad")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
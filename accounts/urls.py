@@ -3,5 +3,6 @@ from . import views
 
 urlpatterns = [
     path("register/", views.RegisterView.as_view(), name="Register"),
-    path("logs/", views.LogView.as_view(), name="logs")
+    path("logs/", views.LogView.as_view(), name="logs"),
+    path("logs/audit-stats/", views.AuditLogStatsView.as_view(), name="audit-stats"),
 ]
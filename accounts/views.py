@@ -4,11 +4,21 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.authtoken.models import Token
-from datetime import datetime, timedelta
+import json
+from datetime import timedelta
+from itertools import chain, groupby, islice
+from operator import itemgetter
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from drf_yasg import openapi
 from .models import LogModel
-from accounts.permission import IsManagerOrAdmin
-from rest_framework.authentication import TokenAuthentication
+from accounts.permission import IsManagerOrAdmin, IsAdmin
+from accounts.audit import audit_log
+from accounts.authentication import CachedTokenAuthentication
 from drf_yasg.utils import swagger_auto_schema
+from .archive import ArchivedLogPagination
+from .pagination import LogPagination
 
 
 class RegisterView(APIView):
@@ -24,30 +34,95 @@ class RegisterView(APIView):
                              "token": token.key}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+DELETED_USER = "(deleted user)"
+
+encoder = DjangoJSONEncoder()
+
+def log_entry(action, timestamp, details):
+    # Format the timestamp here so whole batches go through the C JSON encoder.
+    return {"action": action, "timestamp": encoder.default(timestamp), "details": details if details else None}
+
+def log_groups(rows):
+    """(username, entries) per user from (user_id, username, timestamp, id, action, details) rows grouped by user."""
+    for _, group in groupby(rows, key=itemgetter(0)):
+        first = next(group)
+        yield first[1] or DELETED_USER, (log_entry(row[4], row[2], row[5]) for row in chain([first], group))
+
+def stream_json_groups(groups, batch=1000):
+    """Write {"name": [entry, ...], ...} `batch` entries at a time."""
+    yield "{"
+    for index, (name, entries) in enumerate(groups):
+        yield ("," if index else "") + json.dumps(name) + ":["
+        separator = ""
+        while chunk := list(islice(entries, batch)):
+            yield separator + json.dumps(chunk)[1:-1]
+            separator = ","
+        yield "]"
+    yield "}"
+
+def stream_json_page(page, paginator):
+    # The links go last: they are known once the page has been read.
+    yield '{"results":'
+    yield from stream_json_groups(log_groups(page))
+    yield f',"next":{json.dumps(paginator.get_next_link())},"previous":{json.dumps(paginator.get_previous_link())}}}'
+
+action_param = openapi.Parameter(
+    name="action",
+    in_=openapi.IN_QUERY,
+    description="Only logs with this action.",
+    type=openapi.TYPE_STRING,
+    enum=[choice for choice, _ in LogModel.ACTION_CHOICES],
+    required=False,
+)
+
+user_param = openapi.Parameter(
+    name="user",
+    in_=openapi.IN_QUERY,
+    description="Only logs of this username.",
+    type=openapi.TYPE_STRING,
+    required=False,
+)
+
+days_param = openapi.Parameter(
+    name="days",
+    in_=openapi.IN_QUERY,
+    description="Logs of the last days (default 30, 0 for everything in the database).",
+    type=openapi.TYPE_INTEGER,
+    required=False,
+    default=30,
+)
+
 class LogView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
+    @swagger_auto_schema(manual_parameters=[days_param, action_param, user_param])
     def get(self, request):
-        
         try:
-            data = {}
             days: int = int(request.query_params.get("days", 30))
-            start_date = datetime.now() - timedelta(days=days)
-            logs = LogModel.objects.all()
-            if days:
-                logs = logs.filter(timestamp__gte=start_date)
-            for log in logs:
-                user = log.user.username
-                entry = {
-                    "action": log.action,
-                    "timestamp": log.timestamp,
-                    "details" : log.details if log.details else None
-                }
-                if user not in data:
-                    data[user] = []
-                data[user].append(entry)
-            return Response(data, status=status.HTTP_200_OK)
         except (ValueError, TypeError):
             return Response({"message": "Bad request, check the parameter or data format."}, status=status.HTTP_400_BAD_REQUEST)
-                
\ No newline at end of file
+        action = request.query_params.get("action")
+        username = request.query_params.get("user")
+
+        logs = LogModel.objects.all()
+        if days:
+            start_date = timezone.now() - timedelta(days=days)
+            logs = logs.filter(timestamp__gte=start_date)
+        if action:
+            logs = logs.filter(action=action)
+        if username:
+            logs = logs.filter(user__username=username)
+        # Keyset pages over the (user, -timestamp, -id) index, the username joined in.
+        # Past the retention horizon each user's older logs come from the archive files.
+        paginator = ArchivedLogPagination(start_date, action, username) if days else LogPagination()
+        page = paginator.paginate_queryset(logs, request, view=self)
+        return StreamingHttpResponse(stream_json_page(page, paginator), content_type="application/json")
+
+class AuditLogStatsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdmin]
+
+    @swagger_auto_schema(operation_summary="Audit log buffer counters for this worker")
+    def get(self, request):
+        return Response(audit_log.stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,114 @@
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from accounts.audit import audit_log
+from inventory_api.models import (
+    RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel, SaleModel
+)
+
+
+@contextmanager
+def bench_database(on_disk=False):
+    """
+    Run the benchmark against a throwaway copy of the configured database.
+    SQLite test databases live in memory unless `on_disk`, which concurrent
+    benchmarks want so writers wait on the file lock instead of failing.
+    """
+    old_name = connection.settings_dict["NAME"]
+    old_test_name = connection.settings_dict["TEST"].get("NAME")
+    old_options = dict(connection.settings_dict["OPTIONS"])
+    if on_disk and connection.vendor == "sqlite":
+        connection.settings_dict["TEST"]["NAME"] = old_test_name or os.path.join(tempfile.gettempdir(), "wine_hub_bench.sqlite3")
+        # Take the write lock when the transaction starts, or two writers that
+        # both read first deadlock and one fails at once instead of waiting.
+        connection.settings_dict["OPTIONS"].update(transaction_mode="IMMEDIATE", timeout=30)
+    # Log rows are written inline so no flusher thread competes for the database.
+    old_mode, audit_log.mode = audit_log.mode, "sync"
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        audit_log.mode = old_mode
+        connection.settings_dict["TEST"]["NAME"] = old_test_name
+        connection.settings_dict["OPTIONS"] = old_options
+
+
+def seed_catalog(wines, username="bench", role="admin"):
+    user = User.objects.create_user(username=username, password="bench-password")
+    user.userprofile.role = role
+    user.userprofile.save()
+
+    region, _ = RegionModel.objects.get_or_create(country="Italy", region="Tuscany")
+    wine_type, _ = WineTypeModel.objects.get_or_create(type="red")
+    style, _ = WineStyleModel.objects.get_or_create(style="dry", body="full")
+    appellation, _ = AppellationModel.objects.get_or_create(name="DOCG")
+
+    WineModel.objects.bulk_create(
+        [
+            WineModel(
+                name=f"Bench wine {i}", year=2020, region=region, type=wine_type, style=style,
+                appellation=appellation, added_by=user, price=10, retail_price=20, stock=1_000_000,
+            )
+            for i in range(wines)
+        ],
+        batch_size=1000,
+    )
+    return user, list(WineModel.objects.values_list("id", flat=True))
+
+
+def seed_sales(user, wine_ids, count, per_day=1000, days_back=0, batch_size=5000):
+    """
+    Insert `count` sales, `per_day` of them on each day going back in time from
+    `days_back` days ago. Returns the next free day offset so successive calls
+    keep extending the history instead of piling up on the same days.
+    """
+    now = timezone.now()
+    created = 0
+    while created < count:
+        size = min(per_day, count - created)
+        timestamp = now - timedelta(days=days_back)
+        SaleModel.objects.bulk_create(
+            [
+                SaleModel(
+                    user=user, wine_id=wine_ids[(created + i) % len(wine_ids)], quantity_sold=1 + i % 3, timestamp=timestamp,
+                    unit_price=20, unit_cost=10,  # seed_catalog's prices
+                )
+                for i in range(size)
+            ],
+            batch_size=batch_size,
+        )
+        created += size
+        days_back += 1
+    # Keep the wines' lifetime counters in line with their sales.
+    sold = SaleModel.objects.filter(wine=OuterRef("pk")).order_by().values("wine").annotate(total=Sum("quantity_sold")).values("total")
+    WineModel.objects.filter(id__in=wine_ids).update(quantity_sold=Coalesce(Subquery(sold), 0))
+    # Fresh planner statistics, as a production database would have.
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    return days_back
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "max_ms": round(timings[-1], 3),
+    }
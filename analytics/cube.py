@@ -0,0 +1,93 @@
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db.models import Count, DateField, DecimalField, F, Sum
+from django.db.models.functions import Trunc
+from inventory_api.models import SaleModel, WineModel, RegionModel, WineTypeModel, WineStyleModel, AppellationModel
+from .queries import ranking_label
+
+# dimension -> (path from a sale, model labelling the values or None when the value is its own label)
+DIMENSIONS = {
+    "region": ("wine__region_id", RegionModel),
+    "type": ("wine__type_id", WineTypeModel),
+    "style": ("wine__style_id", WineStyleModel),
+    "appellation": ("wine__appellation_id", AppellationModel),
+    "wine": ("wine_id", WineModel),
+    "vintage": ("wine__year", None),
+    "seller": ("user_id", User),
+}
+# Time buckets of the sale timestamp, also usable as dimensions.
+TIME_BUCKETS = ("day", "week", "month", "quarter", "year")
+MAX_DIMENSIONS = 4
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal("0.01")
+# quantity_sold is net of refunds, so the bottles handed over are quantity_sold + refund_qty.
+MEASURES = {
+    "sales": Count("id"),
+    "bottles": Sum(F("quantity_sold") + F("refund_qty")),
+    "net_bottles": Sum("quantity_sold"),
+    "refunded_bottles": Sum("refund_qty"),
+    # At the prices of the sale, not the wine's current ones.
+    "revenue": Sum(F("quantity_sold") * F("unit_price"), output_field=MONEY),
+    "cost": Sum(F("quantity_sold") * F("unit_cost"), output_field=MONEY),
+    "margin": Sum(F("quantity_sold") * (F("unit_price") - F("unit_cost")), output_field=MONEY),
+}
+
+
+def label(instance):
+    if isinstance(instance, User):
+        return instance.username
+    return ranking_label(instance)
+
+
+def cube(dimensions, measures, filters=None, window=None, order_by=None, limit=1000):
+    """
+    Sales grouped by any mix of `dimensions` (see DIMENSIONS and
+    TIME_BUCKETS) with the chosen `measures`, in one grouped query.
+
+    `filters` maps dimensions to the values to keep, `window` holds
+    timestamp lookups (e.g. from date_range) and `order_by` names a
+    dimension or measure, "-" first for descending. At most `limit` cells
+    are read; returns (rows, more) where `more` tells if some were left out.
+    """
+    sales = SaleModel.objects.filter(**(window or {}))
+    for dimension, values in (filters or {}).items():
+        sales = sales.filter(**{f"{DIMENSIONS[dimension][0]}__in": values})
+
+    # Aliased, "wine" would clash with the sale's own field.
+    groups = {}
+    for dimension in dimensions:
+        if dimension in TIME_BUCKETS:
+            groups[f"by_{dimension}"] = Trunc("timestamp", dimension, output_field=DateField())
+        else:
+            groups[f"by_{dimension}"] = F(DIMENSIONS[dimension][0])
+    first = (order_by or "").lstrip("-")
+    ordering = [f"by_{dimension}" for dimension in dimensions if dimension != first]
+    if order_by:
+        ordering.insert(0, ("-" if order_by.startswith("-") else "") + (f"by_{first}" if first in dimensions else first))
+    cells = list(
+        sales.values(**groups)
+        .annotate(**{measure: MEASURES[measure] for measure in measures})
+        .order_by(*ordering)[:limit + 1]
+    )
+    more = len(cells) > limit
+
+    rows = []
+    for cell in cells[:limit]:
+        row = {dimension: cell[f"by_{dimension}"] for dimension in dimensions}
+        for measure in measures:
+            value = cell[measure]
+            # SQLite hands computed decimals back unscaled.
+            row[measure] = value.quantize(CENT) if isinstance(value, Decimal) else value
+        rows.append(row)
+
+    # Label the ids of the cells shown, a query per labelled dimension.
+    for dimension in dimensions:
+        model = DIMENSIONS.get(dimension, (None, None))[1]
+        if model is None:
+            continue
+        labels = model.objects.in_bulk({row[dimension] for row in rows})
+        for row in rows:
+            pk = row[dimension]
+            row[dimension] = {"id": pk, "name": label(labels[pk]) if pk in labels else None}
+    return rows, more
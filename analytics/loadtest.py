@@ -0,0 +1,228 @@
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+
+# name -> (method, path, role, body)
+# Paths and bodies are templates filled with a random wine id and sale id.
+# Only give sale ids with bottles left to refund.
+ENDPOINTS = {
+    "sale": ("POST", "/wine-list-api/sale/", "staff", {"wine_id": "{wine}", "quantity": 1}),
+    "basket": ("POST", "/wine-list-api/sale/basket/", "staff", {"lines": [{"wine_id": "{wine}", "quantity": 1}, {"wine_id": "{wine2}", "quantity": 2}]}),
+    "wine_list": ("GET", "/wine-list-api/wines", "manager", None),
+    "wine_detail": ("GET", "/wine-list-api/detail/{wine}", "staff", None),
+    "low_stock": ("GET", "/analytics/low-stock/", "staff", None),
+    "restock": ("POST", "/wine-list-api/{wine}/restock/", "manager", {"quantity": 6}),
+    "refund": ("POST", "/wine-list-api/{sale}/sales/refund", "manager", {"refund_qty": 1}),
+    "dashboard": ("GET", "/wine-list-api/dashboard/", "staff", None),
+    "revenue": ("GET", "/analytics/revenue/?days=30&breakdown=true", "admin", None),
+    "rankings": ("GET", "/analytics/rankings/?days=30&group_by=region", "manager", None),
+    "top_selling": ("GET", "/analytics/top-selling/", "manager", None),
+    "least_selling": ("GET", "/analytics/least-selling/", "manager", None),
+    "best_employee": ("GET", "/analytics/best-employee/", "admin", None),
+    "quarter_trend": ("GET", "/analytics/quarter-trend/", "admin", None),
+    "logs": ("GET", "/accounts/logs/?days=1", "manager", None),
+    "export_sales": ("GET", "/analytics/exports/sales/?gzip=true", "admin", None),
+    "export_wines": ("GET", "/analytics/exports/wine-list/", "admin", None),
+    "export_logs": ("GET", "/analytics/exports/logs/", "admin", None),
+}
+
+# workload -> {endpoint: weight}
+WORKLOADS = {
+    "till": {"sale": 60, "basket": 10, "wine_list": 10, "wine_detail": 10, "low_stock": 8, "refund": 1, "restock": 1},
+    "dashboard": {
+        "dashboard": 20, "revenue": 15, "rankings": 15, "top_selling": 10, "least_selling": 10,
+        "best_employee": 10, "quarter_trend": 10, "logs": 10,
+    },
+    "exports": {"export_sales": 40, "export_wines": 30, "export_logs": 30},
+}
+WORKLOADS["mixed"] = {
+    **{name: weight * 6 for name, weight in WORKLOADS["till"].items()},
+    **{name: weight * 3 for name, weight in WORKLOADS["dashboard"].items()},
+    **{name: weight for name, weight in WORKLOADS["exports"].items()},
+}
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryCountingApp:
+    """
+    WSGI wrapper counting the queries each request runs, until its response
+    has been fully sent (streamed exports included), per X-Bench-Endpoint.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.queries = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        endpoint = environ.get("HTTP_X_BENCH_ENDPOINT", environ.get("PATH_INFO"))
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        connection.execute_wrappers.append(counter)
+        response = None
+        try:
+            response = self.app(environ, start_response)
+            yield from response
+        finally:
+            try:
+                if response is not None and hasattr(response, "close"):
+                    response.close()
+            finally:
+                connection.execute_wrappers.remove(counter)
+                with self.lock:
+                    self.queries[endpoint].append(count[0])
+
+
+def start_server():
+    """Serve the project on a free local port from a background thread."""
+    app = QueryCountingApp(get_wsgi_application())
+    server = make_server("127.0.0.1", 0, app, server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="loadtest-server", daemon=True).start()
+    return server, app
+
+
+def fill(template, rng, wine_ids, sale_ids):
+    values = {"wine": rng.choice(wine_ids), "wine2": rng.choice(wine_ids), "sale": rng.choice(sale_ids)}
+    if isinstance(template, str):
+        if template.startswith("{") and template.endswith("}") and template[1:-1] in values:
+            return values[template[1:-1]]
+        return template.format(**values)
+    if isinstance(template, dict):
+        return {key: fill(value, rng, wine_ids, sale_ids) for key, value in template.items()}
+    if isinstance(template, list):
+        return [fill(value, rng, wine_ids, sale_ids) for value in template]
+    return template
+
+
+def run_workload(port, tokens, wine_ids, sale_ids, workload, threads, duration, requests=None, seed=0):
+    """
+    Drive the server from `threads` clients picking endpoints by weight until
+    `duration` seconds pass (or `requests` are sent). Returns the wall time
+    and, per endpoint, the latencies in ms and the status codes.
+    """
+    weights = WORKLOADS[workload]
+    names, shares = list(weights), list(weights.values())
+    samples = defaultdict(lambda: {"latencies": [], "statuses": defaultdict(int)})
+    lock = threading.Lock()
+    budget = [requests]
+    deadline = time.perf_counter() + duration
+
+    def take():
+        with lock:
+            if budget[0] is None:
+                return time.perf_counter() < deadline
+            if budget[0] <= 0:
+                return False
+            budget[0] -= 1
+            return True
+
+    def client(index):
+        rng = random.Random(seed * 1000 + index)
+        local = defaultdict(lambda: {"latencies": [], "statuses": defaultdict(int)})
+        while take():
+            name = rng.choices(names, weights=shares)[0]
+            method, path, role, body = ENDPOINTS[name]
+            payload = json.dumps(fill(body, rng, wine_ids, sale_ids)) if body is not None else None
+            headers = {"Authorization": f"Token {tokens[role]}", "X-Bench-Endpoint": name}
+            if payload is not None:
+                headers["Content-Type"] = "application/json"
+            start = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+                conn.request(method, fill(path, rng, wine_ids, sale_ids), body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                conn.close()
+            except OSError:
+                status = "connection_error"
+            local[name]["latencies"].append((time.perf_counter() - start) * 1000)
+            local[name]["statuses"][status] += 1
+        with lock:
+            for name, sample in local.items():
+                samples[name]["latencies"] += sample["latencies"]
+                for status, count in sample["statuses"].items():
+                    samples[name]["statuses"][status] += count
+
+    workers = [threading.Thread(target=client, args=(index,)) for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start, samples
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(elapsed, samples, queries):
+    endpoints = {}
+    for name, sample in sorted(samples.items()):
+        latencies = sorted(sample["latencies"])
+        counts = queries.get(name, [])
+        errors = sum(count for status, count in sample["statuses"].items() if not isinstance(status, int) or status >= 500)
+        endpoints[name] = {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "statuses": {str(status): count for status, count in sorted(sample["statuses"].items(), key=str)},
+            "errors": errors,
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3),
+            "queries_mean": round(statistics.mean(counts), 2) if counts else None,
+            "queries_max": max(counts) if counts else None,
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    latencies = sorted(latency for sample in samples.values() for latency in sample["latencies"])
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+        "p50_ms": round(statistics.median(latencies), 3) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95), 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 3) if latencies else None,
+        "endpoints": endpoints,
+    }
+
+
+def compare(baseline, current):
+    """Relative change of throughput and p95 per endpoint between two reports (current / baseline - 1)."""
+    def change(new, old):
+        return round(new / old - 1, 3) if old and new is not None else None
+
+    rows = {}
+    for name, endpoint in current["endpoints"].items():
+        old = baseline.get("endpoints", {}).get(name)
+        if old is None:
+            continue
+        rows[name] = {
+            "throughput_rps": change(endpoint["throughput_rps"], old["throughput_rps"]),
+            "p95_ms": change(endpoint["p95_ms"], old["p95_ms"]),
+            "queries_mean": change(endpoint["queries_mean"], old["queries_mean"]),
+        }
+    return rows
@@ -0,0 +1,51 @@
+import json
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+from analytics.benchmarks import bench_database, seed_catalog, seed_sales, measure
+from analytics.views import RevenueFilterView
+
+
+class Command(BaseCommand):
+    help = "Benchmark RevenueFilterView as the sales table grows (runs on a throwaway database)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+        parser.add_argument("--wines", type=int, default=500)
+        parser.add_argument("--per-day", type=int, default=1_000, help="Sales inserted per day of history.")
+        parser.add_argument("--days", type=int, default=30, help="Window queried by the endpoint.")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = RevenueFilterView.as_view()
+        results = []
+
+        with bench_database():
+            user, wine_ids = seed_catalog(options["wines"])
+            seeded, day = 0, 0
+            for size in sorted(options["sizes"]):
+                day = seed_sales(user, wine_ids, size - seeded, per_day=options["per_day"], days_back=day)
+                seeded = size
+
+                for breakdown in ("false", "true"):
+                    def call():
+                        request = factory.get("/analytics/revenue/", {"days": options["days"], "breakdown": breakdown})
+                        force_authenticate(request, user=user)
+                        return view(request)
+
+                    with CaptureQueriesContext(connection) as queries:
+                        call()
+                    row = {"sales": size, "breakdown": breakdown == "true", "queries": len(queries)}
+                    row.update(measure(call, options["repeat"]))
+                    results.append(row)
+                    if not options["json"]:
+                        self.stdout.write(
+                            f"{size:>10} sales  breakdown={row['breakdown']!s:<5}  "
+                            f"p50={row['p50_ms']:>8.2f}ms  p95={row['p95_ms']:>8.2f}ms  queries={row['queries']}"
+                        )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,87 @@
+import json
+import platform
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from analytics import loadtest
+from analytics.benchmarks import bench_database, seed_catalog, seed_sales
+from inventory_api.models import SaleModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the app over HTTP on a seeded throwaway database and drive weighted workloads against it, "
+        "reporting throughput, p50/p95/p99 latency and queries per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workload", choices=sorted(loadtest.WORKLOADS), default="mixed")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent clients.")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to run (ignored with --requests).")
+        parser.add_argument("--requests", type=int, default=None, help="Stop after this many requests instead.")
+        parser.add_argument("--warmup", type=float, default=2, help="Seconds of the same traffic before measuring.")
+        parser.add_argument("--wines", type=int, default=500)
+        parser.add_argument("--sales", type=int, default=100_000)
+        parser.add_argument("--seed", type=int, default=0, help="Random seed of the clients.")
+        parser.add_argument("--output", help="Also write the report to this file.")
+        parser.add_argument("--compare", help="Previous report to compare against.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as file:
+                    baseline = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Can't read {options['compare']}: {error}")
+
+        with bench_database(on_disk=True):
+            admin, wine_ids = seed_catalog(options["wines"], username="bench-admin", role="admin")
+            tokens = {"admin": Token.objects.get(user=admin).key}
+            for role in ("manager", "staff"):
+                user = User.objects.create_user(username=f"bench-{role}", password="bench-password")
+                user.userprofile.role = role
+                user.userprofile.save()
+                tokens[role] = Token.objects.get(user=user).key
+            seed_sales(admin, wine_ids, options["sales"])
+            # Refunding a sale's last bottle breaks its constraints, keep to the larger sales.
+            sale_ids = list(SaleModel.objects.filter(quantity_sold__gte=2).order_by("-id").values_list("id", flat=True)[:10_000])
+
+            server, app = loadtest.start_server()
+            port = server.server_address[1]
+            try:
+                if options["warmup"]:
+                    loadtest.run_workload(port, tokens, wine_ids, sale_ids, options["workload"], options["threads"], options["warmup"], seed=options["seed"] + 1)
+                    app.queries.clear()
+                elapsed, samples = loadtest.run_workload(
+                    port, tokens, wine_ids, sale_ids, options["workload"], options["threads"],
+                    options["duration"], requests=options["requests"], seed=options["seed"],
+                )
+            finally:
+                server.shutdown()
+                server.server_close()
+
+            report = {
+                "started_at": timezone.now().isoformat(),
+                "workload": options["workload"],
+                "weights": loadtest.WORKLOADS[options["workload"]],
+                "threads": options["threads"],
+                "database": connection.vendor,
+                "seed": {"wines": options["wines"], "sales": options["sales"]},
+                "versions": {"python": platform.python_version(), "django": django.get_version()},
+                **loadtest.summarize(elapsed, samples, app.queries),
+            }
+            if baseline is not None:
+                report["compared_to"] = {
+                    "started_at": baseline.get("started_at"),
+                    "endpoints": loadtest.compare(baseline, report),
+                }
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from analytics.rollup import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollup from scratch out of SaleModel."
+
+    def handle(self, *args, **options):
+        created = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Daily sales rollup rebuilt: {created} rows."))
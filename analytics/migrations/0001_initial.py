@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:57
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('inventory_api', '0011_salemodel_sale_timestamp_wine_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('bottles', models.IntegerField(default=0, verbose_name='bottles sold')),
+                ('refunded_bottles', models.IntegerField(default=0, verbose_name='bottles refunded')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('wine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inventory_api.winemodel', verbose_name='Wine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'user'], name='rollup_day_user_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'wine', 'user'), name='unique-rollup-day-wine-user')],
+            },
+        ),
+    ]
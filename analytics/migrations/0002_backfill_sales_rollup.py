@@ -0,0 +1,61 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:10
+
+from datetime import datetime, time, timedelta
+from django.db import migrations, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+DAYS_PER_BATCH = 7
+
+
+def backfill_sales_rollup(apps, schema_editor):
+    """
+    Build the rollup out of the existing sales, DAYS_PER_BATCH days per
+    grouped SELECT, bulk INSERT and transaction. A rollup row belongs to
+    one day, so a batch only ever inserts rows. Any row already recorded
+    is replaced, like rebuild_sales_rollup does.
+    """
+    alias = schema_editor.connection.alias
+    SaleModel = apps.get_model("inventory_api", "SaleModel")
+    DailySalesRollup = apps.get_model("analytics", "DailySalesRollup")
+    sales = SaleModel.objects.using(alias)
+    rollup = DailySalesRollup.objects.using(alias)
+    rollup.all().delete()
+
+    first = sales.order_by("timestamp").values_list("timestamp", flat=True).first()
+    if first is None:
+        return
+    last = sales.order_by("-timestamp").values_list("timestamp", flat=True).first()
+    revenue = ExpressionWrapper(
+        F("quantity_sold") * Coalesce(F("unit_price"), Value(0), output_field=DecimalField()),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    day = timezone.localdate(first)
+    while day <= timezone.localdate(last):
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=DAYS_PER_BATCH), time.min))
+        groups = (
+            sales.filter(timestamp__gte=start, timestamp__lt=end)
+            .annotate(day=TruncDate("timestamp"))
+            .values("day", "wine_id", "user_id")
+            .annotate(bottles=Sum("quantity_sold"), refunded_bottles=Sum("refund_qty"), revenue=Sum(revenue))
+            .order_by()
+        )
+        with transaction.atomic(using=alias):
+            rollup.bulk_create([DailySalesRollup(**group) for group in groups], batch_size=1000)
+        day += timedelta(days=DAYS_PER_BATCH)
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('inventory_api', '0017_salemodel_unit_prices'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sales_rollup, migrations.RunPython.noop),
+    ]
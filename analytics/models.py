@@ -1,3 +1,22 @@
 from django.db import models
+from django.contrib.auth.models import User
+from inventory_api.models import WineModel
 
-# Create your models here.
+class DailySalesRollup(models.Model):
+    day = models.DateField()
+    wine = models.ForeignKey(WineModel, on_delete=models.CASCADE, verbose_name="Wine")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
+    bottles = models.IntegerField(default=0, verbose_name="bottles sold")
+    refunded_bottles = models.IntegerField(default=0, verbose_name="bottles refunded")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "wine", "user"], name="unique-rollup-day-wine-user")
+        ]
+        indexes = [
+            models.Index(fields=["day", "user"], name="rollup_day_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.wine_id}/{self.user_id}: {self.bottles}"
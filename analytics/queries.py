@@ -0,0 +1,175 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, FilteredRelation, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, Rank
+from django.utils import timezone
+from inventory_api.models import SaleModel, WineModel, RegionModel, WineTypeModel, AppellationModel
+
+REVENUE = ExpressionWrapper(
+    F("quantity_sold") * F("unit_price"),
+    output_field=DecimalField(max_digits=14, decimal_places=2),
+)
+
+
+def sales_window(days=None, wine_id=None):
+    sales = SaleModel.objects.all()
+    if wine_id:
+        sales = sales.filter(wine_id=wine_id)
+    if days:
+        sales = sales.filter(timestamp__gte=timezone.now() - timedelta(days=days))
+    return sales
+
+
+def revenue_summary(sales, breakdown=False):
+    """
+    Revenue and bottles sold for the given sales at the prices they were
+    sold at, skipping sales without a retail price. Both are summed on the
+    sales table alone, which the (timestamp, wine) and (wine, timestamp)
+    indexes cover; with `breakdown` only the names of the wines in the
+    result are fetched afterwards.
+    """
+    sales = sales.filter(unit_price__isnull=False)
+    if not breakdown:
+        totals = sales.aggregate(revenue=Sum(REVENUE), bottles_sold=Sum("quantity_sold"))
+        return {
+            "revenue": totals["revenue"] or 0,
+            "bottles_sold": totals["bottles_sold"] or 0,
+        }
+
+    rows = list(sales.order_by().values("wine_id").annotate(bottles_sold=Sum("quantity_sold"), revenue=Sum(REVENUE)))
+    names = dict(WineModel.objects.filter(id__in=[row["wine_id"] for row in rows]).values_list("id", "name"))
+    wines = sorted(
+        (
+            {
+                "wine_id": row["wine_id"],
+                "name": names.get(row["wine_id"]),
+                "bottles_sold": row["bottles_sold"],
+                "revenue": row["revenue"],
+            }
+            for row in rows
+        ),
+        key=lambda wine: (-wine["revenue"], wine["wine_id"]),
+    )
+    return {
+        "revenue": sum((wine["revenue"] for wine in wines), 0),
+        "bottles_sold": sum(wine["bottles_sold"] for wine in wines),
+        "wines": wines,
+    }
+
+
+# group_by -> (model, path from the model to its sales, path from a sale to the model's id)
+RANKING_GROUPS = {
+    "wine": (WineModel, "salemodel", "wine_id"),
+    "region": (RegionModel, "winemodel__salemodel", "wine__region_id"),
+    "type": (WineTypeModel, "winemodel__salemodel", "wine__type_id"),
+    "appellation": (AppellationModel, "winemodel__salemodel", "wine__appellation_id"),
+}
+
+
+def ranking_label(instance):
+    return instance.name if isinstance(instance, WineModel) else str(instance)
+
+
+def rankings(group_by="wine", days=None, limit=10, least=False):
+    """
+    Wines (or regions, types, appellations) ranked by bottles sold in the
+    last `days` days. quantity_sold is already net of refunds.
+
+    Top sellers are grouped on the sales of the window alone, read through
+    the (timestamp, wine) index. Least sellers have to include what did not
+    sell at all, so they start from the grouped model and join only the
+    window's sales (through the (wine, timestamp) index), counting 0 when
+    there are none.
+    """
+    model, sales_path, sale_key = RANKING_GROUPS[group_by]
+
+    if not least:
+        rows = list(
+            sales_window(days)
+            .values(key=F(sale_key))
+            .annotate(bottles=Sum("quantity_sold"))
+            .annotate(rank=Window(Rank(), order_by=F("bottles").desc()))
+            .order_by("-bottles", "key")[:limit]
+        )
+        labels = model.objects.in_bulk([row["key"] for row in rows])
+        return [
+            {"rank": row["rank"], "id": row["key"], "name": ranking_label(labels[row["key"]]), "bottles_sold": row["bottles"]}
+            for row in rows
+        ]
+
+    queryset = model.objects.all()
+    if days:
+        since = timezone.now() - timedelta(days=days)
+        queryset = queryset.alias(period_sales=FilteredRelation(sales_path, condition=Q(**{f"{sales_path}__timestamp__gte": since})))
+        sales_path = "period_sales"
+    ranked = (
+        queryset.annotate(bottles=Coalesce(Sum(f"{sales_path}__quantity_sold"), 0))
+        .annotate(rank=Window(Rank(), order_by=F("bottles").asc()))
+        .order_by("bottles", "id")[:limit]
+    )
+    return [
+        {"rank": instance.rank, "id": instance.id, "name": ranking_label(instance), "bottles_sold": instance.bottles}
+        for instance in ranked
+    ]
+
+
+# dimension -> (WineModel foreign key, model labelling it)
+VALUATION_GROUPS = {
+    "region": ("region_id", RegionModel),
+    "type": ("type_id", WineTypeModel),
+    "appellation": ("appellation_id", AppellationModel),
+}
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal("0.01")
+NO_STOCK = {"wines": 0, "bottles": 0, "cost_value": Decimal("0.00"), "retail_value": Decimal("0.00")}
+STOCK_VALUES = {
+    "wines": Count("id"),
+    "bottles": Coalesce(Sum("stock"), 0),
+    "cost_value": Coalesce(Sum(F("stock") * F("price"), output_field=MONEY), Value(Decimal(0)), output_field=MONEY),
+    "retail_value": Coalesce(Sum(F("stock") * F("retail_price"), output_field=MONEY), Value(Decimal(0)), output_field=MONEY),
+}
+
+
+def valuation(group_by=("region", "type", "appellation"), subtotals=False):
+    """
+    Bottles on the shelves and their value at cost (stock x price) and at
+    retail (stock x retail_price), grouped in SQL by the given dimensions
+    and read off wine_valuation_idx. Wines without a price count in the
+    bottles but add nothing to the values.
+
+    With `subtotals` the rows of every leading subset of `group_by` are
+    added too, like GROUP BY ROLLUP: they are summed from the grouped rows,
+    so they cost nothing more than the groups themselves.
+    """
+    keys = [VALUATION_GROUPS[dimension][0] for dimension in group_by]
+    rows = list(WineModel.objects.values(*keys).annotate(**STOCK_VALUES).order_by(*keys))
+    for row in rows:
+        # SQLite hands computed decimals back unscaled.
+        row["cost_value"] = row["cost_value"].quantize(CENT)
+        row["retail_value"] = row["retail_value"].quantize(CENT)
+    labels = {
+        dimension: {pk: str(instance) for pk, instance in model.objects.in_bulk({row[key] for row in rows}).items()}
+        for dimension, (key, model) in VALUATION_GROUPS.items() if dimension in group_by
+    }
+
+    def labelled(row, dimensions):
+        out = {}
+        for dimension in dimensions:
+            pk = row[VALUATION_GROUPS[dimension][0]]
+            out[dimension] = {"id": pk, "name": labels[dimension].get(pk)}
+        return {**out, **{measure: row[measure] for measure in STOCK_VALUES}}
+
+    total = {measure: sum((row[measure] for row in rows), NO_STOCK[measure]) for measure in STOCK_VALUES}
+    result = {"group_by": list(group_by), "groups": [labelled(row, group_by) for row in rows], "total": total}
+    if subtotals:
+        result["subtotals"] = []
+        for level in range(len(group_by) - 1, 0, -1):
+            prefix = keys[:level]
+            sums = {}
+            for row in rows:
+                key = tuple(row[k] for k in prefix)
+                summed = sums.setdefault(key, {**dict(zip(prefix, key)), **NO_STOCK})
+                for measure in STOCK_VALUES:
+                    summed[measure] += row[measure]
+            result["subtotals"] += [labelled(row, group_by[:level]) for row in sums.values()]
+    return result
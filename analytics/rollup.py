@@ -0,0 +1,125 @@
+from collections import defaultdict
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from inventory_api.models import SaleModel
+from .models import DailySalesRollup
+
+
+def _apply(day, wine_id, user_id, bottles=0, refunded_bottles=0, revenue=0):
+    row = DailySalesRollup.objects.filter(day=day, wine_id=wine_id, user_id=user_id)
+    changes = {
+        "bottles": F("bottles") + bottles,
+        "refunded_bottles": F("refunded_bottles") + refunded_bottles,
+        "revenue": F("revenue") + revenue,
+    }
+    if row.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(
+                day=day, wine_id=wine_id, user_id=user_id,
+                bottles=bottles, refunded_bottles=refunded_bottles, revenue=revenue,
+            )
+    except IntegrityError:
+        # Another transaction created the row between our UPDATE and INSERT.
+        row.update(**changes)
+
+
+def share(values):
+    """
+    (day, wine_id, user_id) and the (bottles, refunded bottles, revenue) a
+    sale adds to that rollup row, from its SaleModel.rollup_values().
+    """
+    timestamp, wine_id, user_id, quantity_sold, refund_qty, unit_price = values
+    return (timezone.localdate(timestamp), wine_id, user_id), (quantity_sold, refund_qty, quantity_sold * (unit_price or 0))
+
+
+def record_change(old, new):
+    """
+    Move a sale's share of the rollup from its `old` rollup_values() to the
+    `new` ones, None for a sale just created or deleted. A refund moves
+    bottles to refunded_bottles on the same row, an edit of the wine, the
+    seller or the time moves the whole share to another row.
+    """
+    changes = defaultdict(lambda: [0, 0, 0])
+    for values, sign in ((old, -1), (new, 1)):
+        if values is not None:
+            key, amounts = share(values)
+            for index, amount in enumerate(amounts):
+                changes[key][index] += sign * amount
+    for (day, wine_id, user_id), (bottles, refunded_bottles, revenue) in changes.items():
+        if not (bottles or refunded_bottles or revenue):
+            continue
+        if new is None:
+            # A deleted sale's row may have gone with it (its user deleted), never recreate it.
+            DailySalesRollup.objects.filter(day=day, wine_id=wine_id, user_id=user_id).update(
+                bottles=F("bottles") + bottles, refunded_bottles=F("refunded_bottles") + refunded_bottles, revenue=F("revenue") + revenue,
+            )
+        else:
+            _apply(day, wine_id, user_id, bottles=bottles, refunded_bottles=refunded_bottles, revenue=revenue)
+
+
+def record_sales(sales):
+    """
+    Add many sales of the same day and user (a basket) to the rollup with a
+    fixed number of queries: one read, one UPDATE and one INSERT.
+    """
+    groups = defaultdict(dict)
+    for sale in sales:
+        key = (timezone.localdate(sale.timestamp), sale.user_id)
+        bottles, revenue = groups[key].get(sale.wine_id, (0, 0))
+        groups[key][sale.wine_id] = (
+            bottles + sale.quantity_sold,
+            revenue + sale.quantity_sold * (sale.unit_price or 0),
+        )
+
+    for (day, user_id), wines in groups.items():
+        rows = DailySalesRollup.objects.filter(day=day, user_id=user_id)
+        existing = set(rows.filter(wine_id__in=list(wines)).values_list("wine_id", flat=True))
+        if existing:
+            def per_wine(index):
+                return Case(
+                    *[When(wine_id=wine_id, then=Value(wines[wine_id][index])) for wine_id in existing],
+                    output_field=DecimalField(max_digits=14, decimal_places=2) if index else IntegerField(),
+                )
+            rows.filter(wine_id__in=list(existing)).update(bottles=F("bottles") + per_wine(0), revenue=F("revenue") + per_wine(1))
+
+        missing = [wine_id for wine_id in wines if wine_id not in existing]
+        try:
+            with transaction.atomic():
+                DailySalesRollup.objects.bulk_create([
+                    DailySalesRollup(day=day, wine_id=wine_id, user_id=user_id, bottles=wines[wine_id][0], revenue=wines[wine_id][1])
+                    for wine_id in missing
+                ])
+        except IntegrityError:
+            for wine_id in missing:
+                _apply(day, wine_id, user_id, bottles=wines[wine_id][0], revenue=wines[wine_id][1])
+
+
+def rebuild():
+    """
+    Replace the rollup with one INSERT ... SELECT grouping every sale, so the
+    rows never round-trip through Python. Returns the number of rows written.
+    """
+    revenue = ExpressionWrapper(
+        F("quantity_sold") * Coalesce(F("unit_price"), Value(0), output_field=DecimalField()),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    rows = (
+        SaleModel.objects.annotate(day=TruncDate("timestamp"))
+        .values("day", "wine_id", "user_id")
+        .annotate(bottles=Sum("quantity_sold"), refunded_bottles=Sum("refund_qty"), revenue=Sum(revenue))
+        .order_by()
+    )
+    select, params = rows.query.sql_with_params()
+    names = ["day", "wine_id", "user_id", "bottles", "refunded_bottles", "revenue"]
+    meta = DailySalesRollup._meta
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(meta.get_field(name).column) for name in names)
+    aliases = ", ".join(quote(name) for name in names)
+    with transaction.atomic(), connection.cursor() as cursor:
+        DailySalesRollup.objects.all().delete()
+        cursor.execute(f"INSERT INTO {quote(meta.db_table)} ({columns}) SELECT {aliases} FROM ({select}) grouped", params)
+        return cursor.rowcount
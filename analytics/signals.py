@@ -0,0 +1,21 @@
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from inventory_api.models import SaleModel
+from . import rollup
+
+
+@receiver(post_save, sender=SaleModel)
+def update_sales_rollup(sender, instance, created, **kwargs):
+    # Saved with F() expressions (a refund): the rollup needs the values they gave.
+    pending = [name for name in SaleModel.ROLLUP_FIELDS if isinstance(instance.__dict__.get(name), Combinable)]
+    if pending:
+        instance.refresh_from_db(fields=pending)
+    values = instance.rollup_values()
+    rollup.record_change(None if created else instance._rolled_up, values)
+    instance._rolled_up = values
+
+
+@receiver(post_delete, sender=SaleModel)
+def remove_from_sales_rollup(sender, instance, **kwargs):
+    rollup.record_change(getattr(instance, "_rolled_up", None) or instance.rollup_values(), None)
@@ -4,10 +4,26 @@ from django.contrib.auth.models import User
 from inventory_api.models import (
     RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel, SaleModel
 )
+from analytics.models import DailySalesRollup
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import csv
+import gzip
+import time
+from importlib import import_module
+from types import SimpleNamespace
+from unittest.mock import patch
+from django.apps import apps
 
 class AnalyticsTest(APITestCase):
 
@@ -137,11 +153,46 @@ class AnalyticsTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
         response = self.client.get("/analytics/unsold-wines/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("Brunello di Montalcino", [wine["name"] for wine in response.data])
+        self.assertIn("Brunello di Montalcino", [wine["name"] for wine in response.data["results"]])
 
         # sold wine not in list
-        self.assertNotIn("Chianti Classico", [wine["name"] for wine in response.data])
+        self.assertNotIn("Chianti Classico", [wine["name"] for wine in response.data["results"]])
     
+    def test_low_stock(self):
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Sasha"]}")
+        response = self.client.get("/analytics/low-stock/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Default threshold of the type is 10, ties broken newest first
+        self.assertEqual(
+            [(wine["name"], wine["stock"], wine["threshold"], wine["shortfall"]) for wine in response.data["wines"]],
+            [("Barolo", 2, 10, 8), ("Chianti Classico", 2, 10, 8)],
+        )
+
+        # Per-wine override, and a new default for the type
+        self.wine4.reorder_threshold = 25
+        self.wine4.save()
+        self.wtype.default_reorder_threshold = 2
+        self.wtype.save()
+        response = self.client.get("/analytics/low-stock/")
+        self.assertEqual(
+            [(wine["name"], wine["shortfall"]) for wine in response.data["wines"]],
+            [("Brunello di Montalcino", 5), ("Barolo", 0), ("Chianti Classico", 0)],
+        )
+
+        # A restock keeps the reorder point without looking the type up
+        wine = WineModel.objects.get(pk=self.wine1.pk)
+        with CaptureQueriesContext(connection) as queries:
+            wine.stock = F("stock") + 1
+            wine.save()
+        self.assertFalse([q for q in queries if WineTypeModel._meta.db_table in q["sql"]])
+        wine.refresh_from_db()
+        self.assertEqual(wine.reorder_point, 2)
+
+        response = self.client.get("/analytics/low-stock/?limit=1")
+        self.assertEqual(len(response.data["wines"]), 1)
+        self.assertTrue(response.data["more"])
+
     def test_top_selling(self):
 
         self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
@@ -153,27 +204,268 @@ class AnalyticsTest(APITestCase):
         # not top selling
         self.assertNotEqual("Chianti Classico", data["name"])
 
+    def test_rankings(self):
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Marco"]}")
+        response = self.client.get("/analytics/rankings/?days=0&limit=3")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row["rank"], row["name"], row["bottles_sold"]) for row in response.data["results"]],
+            [(1, "Montepulciano d'Abruzzo", 19), (2, "Barolo", 9), (3, "Chianti Classico", 8)],
+        )
+
+        # Least sellers include what never sold
+        response = self.client.get("/analytics/rankings/?days=0&limit=2&order=least")
+        self.assertEqual(
+            [(row["rank"], row["name"], row["bottles_sold"]) for row in response.data["results"]],
+            [(1, "Brunello di Montalcino", 0), (2, "Chianti Classico", 8)],
+        )
+
+        # Refunds are netted out
+        sale = SaleModel.objects.filter(wine=self.wine3).first()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+        self.client.post(f"/wine-list-api/{sale.id}/sales/refund", {"refund_qty": 2}, format="json")
+        response = self.client.get("/analytics/rankings/?group_by=region&days=0")
+        self.assertEqual(response.data["results"], [{"rank": 1, "id": self.region.id, "name": "Italy-Tuscany", "bottles_sold": 34}])
+
+        response = self.client.get("/analytics/rankings/?group_by=grape")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_valuation(self):
+
+        cache.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Marco"]}")
+        response = self.client.get("/analytics/valuation/?group_by=region")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Stock left 2 + 2 + 30 + 20, at cost 2*8 + 2*20 + 30*6 + 20*25
+        tuscany = {"region": {"id": self.region.id, "name": "Italy-Tuscany"}, "wines": 4, "bottles": 54, "cost_value": "736.00", "retail_value": "1670.00"}
+        self.assertEqual(response.data["groups"], [tuscany])
+        self.assertEqual(response.data["total"], {key: value for key, value in tuscany.items() if key != "region"})
+
+        # A sale invalidates the cached report once committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/wine-list-api/sale/", {"wine_id": self.wine2.id, "quantity": 1}, format="json")
+        response = self.client.get("/analytics/valuation/?group_by=region")
+        self.assertEqual(response.data["total"]["bottles"], 53)
+        self.assertEqual(response.data["total"]["cost_value"], "716.00")
+
+        # A stock change whose bump this worker never sees shows once the report expires
+        WineModel.objects.filter(pk=self.wine2.pk).update(stock=F("stock") + 1)
+        self.assertEqual(self.client.get("/analytics/valuation/?group_by=region").data["total"]["bottles"], 53)
+        with patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + settings.CACHE_PAYLOAD_TTL + 1):
+            self.assertEqual(self.client.get("/analytics/valuation/?group_by=region").data["total"]["bottles"], 54)
+        WineModel.objects.filter(pk=self.wine2.pk).update(stock=F("stock") - 1)
+        cache.clear()
+
+        # Subtotals per leading dimension
+        region2 = RegionModel.objects.create(country="France", region="Loire")
+        with self.captureOnCommitCallbacks(execute=True):
+            WineModel.objects.create(
+                name="Sancerre", year=2022, region=region2, type=self.wtype, style=self.wstyle,
+                appellation=self.appellation, price=10, retail_price=20, stock=10, added_by=self.user1,
+            )
+        response = self.client.get("/analytics/valuation/?group_by=region,type&subtotals=true")
+        self.assertEqual(
+            [(row["region"]["name"], row["type"]["name"], row["bottles"]) for row in response.data["groups"]],
+            [("Italy-Tuscany", "red", 53), ("France-Loire", "red", 10)],
+        )
+        self.assertEqual(
+            [(row["region"]["name"], row["bottles"], row["cost_value"]) for row in response.data["subtotals"]],
+            [("Italy-Tuscany", 53, "716.00"), ("France-Loire", 10, "100.00")],
+        )
+        self.assertEqual(response.data["total"]["bottles"], 63)
+
+        response = self.client.get("/analytics/valuation/?group_by=grape")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Sasha"]}")
+        response = self.client.get("/analytics/valuation/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cube(self):
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Marco"]}")
+        response = self.client.get("/analytics/cube/?dimensions=wine&measures=net_bottles,revenue,margin&order_by=-revenue")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(row["wine"]["name"], row["net_bottles"], row["revenue"], row["margin"]) for row in response.data["rows"]],
+            [("Barolo", 9, Decimal(360), Decimal(180)), ("Montepulciano d'Abruzzo", 19, Decimal(228), Decimal(114)), ("Chianti Classico", 8, Decimal(120), Decimal(56))],
+        )
+        self.assertFalse(response.data["more"])
+
+        response = self.client.get("/analytics/cube/?dimensions=region,vintage&measures=sales,bottles")
+        self.assertEqual(
+            [(row["region"]["name"], row["vintage"], row["sales"], row["bottles"]) for row in response.data["rows"]],
+            [("Italy-Tuscany", 2019, 3, 9), ("Italy-Tuscany", 2020, 3, 8), ("Italy-Tuscany", 2021, 2, 19)],
+        )
+
+        # Filters on any dimension
+        response = self.client.get(f"/analytics/cube/?dimensions=type&measures=net_bottles&vintage=2020&wine={self.wine1.id},{self.wine2.id}")
+        self.assertEqual([(row["type"]["name"], row["net_bottles"]) for row in response.data["rows"]], [("red", 8)])
+
+        response = self.client.get("/analytics/cube/?dimensions=wine&limit=2")
+        self.assertEqual(len(response.data["rows"]), 2)
+        self.assertTrue(response.data["more"])
+
+        for query in ("dimensions=grape", "measures=profit", "dimensions=wine&order_by=cost", "limit=0", "region=abc", "dimensions=day,week,month,quarter,year"):
+            response = self.client.get(f"/analytics/cube/?{query}")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, query)
+
+        # Per seller figures are for admins
+        response = self.client.get("/analytics/cube/?dimensions=seller")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+        response = self.client.get("/analytics/cube/?dimensions=seller&measures=net_bottles&order_by=-net_bottles")
+        self.assertEqual(
+            [(row["seller"]["name"], row["net_bottles"]) for row in response.data["rows"]],
+            [("Marco", 17), ("Giorgio", 13), ("Sasha", 6)],
+        )
+
     def test_revenue_filter(self):
 
         # No filters (30 days default)
         self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
         response = self.client.get("/analytics/revenue/")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIn("30", response.data["message"])
-        
+        self.assertEqual(response.data["days"], 30)
+        self.assertEqual(response.data["bottles_sold"], 35)
+        self.assertEqual(response.data["revenue"], 668)
+        self.assertNotIn("wines", response.data)
+
         # filter days 
         response = self.client.get("/analytics/revenue/?days=45")
-        self.assertIn("45", response.data["message"])
+        self.assertEqual(response.data["days"], 45)
+        self.assertEqual(response.data["bottles_sold"], 36)
+        self.assertEqual(response.data["revenue"], 708)
 
         #filter wine id 
-        response = self.client.get("/analytics/revenue/?wine_id=4")
-        # bottole of the specific wine sold
-        self.assertIn("0", response.data["message"])
+        response = self.client.get(f"/analytics/revenue/?wine_id={self.wine4.id}")
+        # bottles of the specific wine sold
+        self.assertEqual(response.data["bottles_sold"], 0)
+        self.assertEqual(response.data["revenue"], 0)
 
         #filters wine id and days
-        response = self.client.get("/analytics/revenue/?days=20&wine_id=4")
-        self.assertIn("20", response.data["message"])
-        # bottles of the wine id 4 sold
-        self.assertIn("0", response.data["message"])
+        response = self.client.get(f"/analytics/revenue/?days=20&wine_id={self.wine1.id}")
+        self.assertEqual(response.data["days"], 20)
+        self.assertEqual(response.data["wine_id"], self.wine1.id)
+        self.assertEqual(response.data["bottles_sold"], 8)
+        self.assertEqual(response.data["revenue"], 120)
+
+        # per wine breakdown
+        response = self.client.get("/analytics/revenue/?breakdown=true")
+        wines = {wine["wine_id"]: wine for wine in response.data["wines"]}
+        self.assertEqual(wines[self.wine2.id]["bottles_sold"], 8)
+        self.assertEqual(wines[self.wine2.id]["revenue"], 320)
+        self.assertNotIn(self.wine4.id, wines)
+        self.assertEqual(response.data["revenue"], 668)
+
+        # bad parameters
+        response = self.client.get("/analytics/revenue/?days=abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_revenue_at_sale_prices(self):
+
+        # A new retail price applies to the next sales only
+        self.wine2.retail_price = 50
+        self.wine2.save()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+        self.client.post("/wine-list-api/sale/", {"wine_id": self.wine2.id, "quantity": 1}, format="json")
+
+        response = self.client.get(f"/analytics/revenue/?wine_id={self.wine2.id}")
+        self.assertEqual(response.data["bottles_sold"], 9)
+        self.assertEqual(response.data["revenue"], 8 * 40 + 50)
+        self.assertEqual(list(SaleModel.objects.filter(wine=self.wine2).order_by("id").values_list("unit_price", "unit_cost"))[-2:], [(40, 20), (50, 20)])
+
+        call_command("rebuild_sales_rollup", stdout=StringIO())
+        response = self.client.get("/analytics/best-employee/")
+        self.assertEqual(response.data["Top employees"][0], {"user": "Giorgio", "revenue": 3 * 15 + 3 * 40 + 3 * 15 + 4 * 12 + 50})
+
+    def test_best_employee_rollup(self):
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+
+        # Sales created directly on the model are in the rollup too (Sasha's is too old to count)
+        response = self.client.get("/analytics/best-employee/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        top = response.data["Top employees"]
+        self.assertEqual([row["user"] for row in top], ["Giorgio", "Marco", "Sasha"])
+        self.assertEqual(top[0]["revenue"], 258)
+
+        # Rebuilding finds the same
+        call_command("rebuild_sales_rollup", stdout=StringIO())
+        response = self.client.get("/analytics/best-employee/")
+        self.assertEqual(response.data["Top employees"], top)
+
+    def rollup_rows(self):
+        # Rows a sale moved away from stay behind empty, rebuilding leaves them out
+        rows = DailySalesRollup.objects.exclude(bottles=0, refunded_bottles=0, revenue=0)
+        return sorted(rows.values_list("day", "wine_id", "user_id", "bottles", "refunded_bottles", "revenue"))
+
+    def test_rollup_follows_model_writes(self):
+
+        # Edits and deletes outside the API (admin, shell) reach the rollup
+        sale = SaleModel.objects.get(wine=self.wine3, user=self.user1)
+        sale.quantity_sold = 6
+        sale.save()
+        sale = SaleModel.objects.get(pk=sale.pk)
+        sale.user = self.user2
+        sale.save()
+        SaleModel.objects.filter(wine=self.wine1, user=self.user1).order_by("timestamp").first().delete()
+        # A sale saved without having been loaded
+        other = SaleModel.objects.filter(wine=self.wine2, user=self.user3).order_by("timestamp").first()
+        SaleModel(pk=other.pk, wine=other.wine, user=other.user, quantity_sold=2, timestamp=other.timestamp, unit_price=other.unit_price).save()
+        rows = self.rollup_rows()
+
+        call_command("rebuild_sales_rollup", stdout=StringIO())
+        self.assertEqual(self.rollup_rows(), rows)
+
+    def test_rollup_backfill_migration(self):
+
+        migration = import_module("analytics.migrations.0002_backfill_sales_rollup")
+        expected = self.rollup_rows()
+        DailySalesRollup.objects.all().delete()
+        DailySalesRollup.objects.create(day=timezone.localdate(), wine=self.wine1, user=self.user1, bottles=99)
+        with patch.object(migration, "DAYS_PER_BATCH", 1):
+            migration.backfill_sales_rollup(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(self.rollup_rows(), expected)
+
+    def test_quarter_trend_rollup(self):
+
+        call_command("rebuild_sales_rollup", stdout=StringIO())
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+        response = self.client.get("/analytics/quarter-trend/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        now = timezone.now()
+        expected = {}
+        # (days ago, revenue) of every sale in setUpTestData
+        for days, revenue in ((0, 45), (0, 120), (0, 200), (0, 180), (5, 45), (0, 30), (40, 40), (2, 48)):
+            day = now - timedelta(days=days)
+            quarter = f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+            expected[quarter] = expected.get(quarter, 0) + revenue
+        for quarter, revenue in expected.items():
+            self.assertEqual(response.data[quarter], revenue)
+        self.assertEqual(response.data[f"{now.year - 1}-Q1"], 0)
+
+    def test_export_sales_streaming(self):
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens["Giorgio"]}")
+        response = self.client.get("/analytics/exports/sales/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["Date", "Wine", "User", "Quantity", "Revenue"])
+        self.assertEqual(len(rows), 1 + SaleModel.objects.count())
+        self.assertIn(["Sasha", "5", "200.00"], [row[2:] for row in rows])
+
+        # gzip
+        response = self.client.get("/analytics/exports/sales/?gzip=true")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(len(content.splitlines()), len(rows))
+
+        # date range
+        tomorrow = (timezone.now() + timedelta(days=1)).date()
+        response = self.client.get(f"/analytics/exports/sales/?from={tomorrow}")
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 1)
 
-    
\ No newline at end of file
+        response = self.client.get("/analytics/exports/logs/?to=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
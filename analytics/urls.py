@@ -9,7 +9,10 @@ urlpatterns = [
     path("least-selling/", views.LeastSellingView.as_view(), name="least-selling"),
     path("unsold-wines/", views.UnsoldWineView.as_view(), name="unsold-wines"),
     path("quarter-trend/", views.QuarterTrendSalesView.as_view(), name="quarter-trend"),
-    path("low-stock/", views.LowStockView.as_view(), name="low-stock")
+    path("low-stock/", views.LowStockView.as_view(), name="low-stock"),
+    path("rankings/", views.RankingsView.as_view(), name="rankings"),
+    path("valuation/", views.ValuationView.as_view(), name="valuation"),
+    path("cube/", views.CubeView.as_view(), name="cube"),
 ]
 
 router = DefaultRouter()
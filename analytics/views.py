@@ -3,54 +3,66 @@ from rest_framework import status, viewsets
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from inventory_api.serializers import WineSerializer
-from datetime import datetime, timedelta
+from inventory_api.pagination import LeastSellingPagination, WinePagination
+from datetime import datetime, time, timedelta
 from collections import defaultdict
 from accounts.permission import IsAdmin, IsManagerOrAdmin, IsStaffOrManagerOrAdmin
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 import csv
-from django.http import HttpResponse
+import zlib
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from rest_framework.response import Response
 from accounts.models import LogModel
+from .queries import sales_window, revenue_summary, rankings, valuation, RANKING_GROUPS, VALUATION_GROUPS
+from .models import DailySalesRollup
+from .cube import cube, DIMENSIONS, MAX_DIMENSIONS, MEASURES, TIME_BUCKETS
+from django.db.models import Sum
+from django.db.models.functions import ExtractQuarter, ExtractYear
+from django.utils import timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from inventory_api.cache import payload_timeout, versioned_key
+import json
 
 class TopSellingView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     def get(self, request):
-        data = WineModel.objects.all().order_by("-quantity_sold")
-        if not data:
+        top_selling = WineModel.objects.with_related().order_by("-quantity_sold", "id").first()
+        if top_selling is None:
             return Response({"detail": "No wines found."}, status=status.HTTP_404_NOT_FOUND)
-        top_selling = data[0]
         serializer = WineSerializer(top_selling)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 class LeastSellingView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     def get(self, request):
-        try:
-            data = WineModel.objects.all().order_by("quantity_sold") 
-            limit = int(request.query_params.get("limit", 5))
-            if limit:
-                data = data[:limit]
-            serializer = WineSerializer(data, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        except(TypeError, ValueError):
-            return Response({"detail": "No wines found."}, status=status.HTTP_404_NOT_FOUND)
+        paginator = LeastSellingPagination()
+        data = paginator.paginate_queryset(WineModel.objects.with_related(), request, view=self)
+        serializer = WineSerializer(data, many=True)
+        return paginator.get_paginated_response(serializer.data)
         
 class UnsoldWineView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     def get(self, request):
-        wines_unsold = WineModel.objects.filter(quantity_sold=0)
-        if not wines_unsold:
+        paginator = WinePagination()
+        wines_unsold = paginator.paginate_queryset(WineModel.objects.with_related().filter(quantity_sold=0), request, view=self)
+        if not wines_unsold and paginator.cursor is None:
             return Response({"message": "No wine found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = WineSerializer(wines_unsold, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return paginator.get_paginated_response(serializer.data)
+
+def is_true(value):
+    return str(value).lower() in ("1", "true", "yes")
 
 days_param = openapi.Parameter(
     name="days",
@@ -69,53 +81,113 @@ wine_id_param = openapi.Parameter(
     required=False,
 )
 
+breakdown_param = openapi.Parameter(
+    name="breakdown",
+    in_=openapi.IN_QUERY,
+    description="If true, add the revenue and bottles sold for every wine.",
+    type=openapi.TYPE_BOOLEAN,
+    required=False,
+    default=False,
+)
+
 class RevenueFilterView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAdmin]
 
     @swagger_auto_schema(
         operation_description="""
-        Get the amount of revenue for a given period of time (Default 30 days).
+        Get the amount of revenue and bottles sold for a given period of time (Default 30 days).
         **Access:** Admin only.
-        if wine_id given, the result will be the revenue for that wine only.""",
+        if wine_id given, the result will be the revenue for that wine only.
+        if breakdown is true, the result includes the revenue of every wine sold in the period.""",
         operation_summary= "Filtered Revenue.",
-        manual_parameters=[days_param, wine_id_param],
+        manual_parameters=[days_param, wine_id_param, breakdown_param],
         responses={
             200: "OK",
-            404: "Parameters not valid.",
+            400: "Parameters not valid.",
             401: "Unauthorized"
         })
     def get(self, request):
         try:
             wine_id = request.query_params.get("wine_id")
+            wine_id = int(wine_id) if wine_id else None
             days: int = int(request.query_params.get("days", 30))
-            sales = SaleModel.objects.all()
-            if wine_id:
-                sales = sales.filter(wine__id=wine_id)
-            if days:
-                start_date = datetime.now() - timedelta(days=days)
-                sales = sales.filter(timestamp__gte=start_date)
-            total_revenue = 0
-            wine_sold = 0
-            for sale in sales:
-                if sale.wine.retail_price:
-                    price = sale.wine.retail_price 
-                    quantity_sold = sale.quantity_sold
-                    total = price * quantity_sold
-                    total_revenue += total
-                    wine_sold += quantity_sold
-                else:
-                    continue
-            return Response({"message": f"The total revenue for this period of time({days} days) is: {total_revenue}£ with a total of {wine_sold} bottles sold"}, status=status.HTTP_200_OK)
+            breakdown = is_true(request.query_params.get("breakdown"))
+            sales = sales_window(days=days, wine_id=wine_id)
+            summary = revenue_summary(sales, breakdown=breakdown)
+            return Response({"days": days, "wine_id": wine_id, **summary}, status=status.HTTP_200_OK)
+        except (ValueError, TypeError):
+            return Response({"message": "Bad request, check parameters or data format."}, status=status.HTTP_400_BAD_REQUEST)
+
+group_by_param = openapi.Parameter(
+    name="group_by",
+    in_=openapi.IN_QUERY,
+    description="Rank wines, or their regions, types or appellations (default wine).",
+    type=openapi.TYPE_STRING,
+    enum=list(RANKING_GROUPS),
+    required=False,
+    default="wine",
+)
+
+order_param = openapi.Parameter(
+    name="order",
+    in_=openapi.IN_QUERY,
+    description="top: best sellers first, least: worst sellers first, unsold included (default top).",
+    type=openapi.TYPE_STRING,
+    enum=["top", "least"],
+    required=False,
+    default="top",
+)
+
+ranking_limit_param = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description="Number of ranked rows (default 10).",
+    type=openapi.TYPE_INTEGER,
+    required=False,
+    default=10,
+)
+
+class RankingsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_description="""
+        Rank by bottles sold (net of refunds) in the last days (Default 30, 0 for all time).
+        **Access:** Manager or Admin.""",
+        operation_summary="Top and least selling rankings.",
+        manual_parameters=[days_param, ranking_limit_param, group_by_param, order_param],
+        responses={
+            200: "OK",
+            400: "Parameters not valid.",
+            401: "Unauthorized"
+        })
+    def get(self, request):
+        try:
+            days: int = int(request.query_params.get("days", 30))
+            limit = int(request.query_params.get("limit", 10))
+            group_by = request.query_params.get("group_by", "wine")
+            order = request.query_params.get("order", "top")
+            if days < 0 or not 1 <= limit <= settings.API_MAX_PAGE_SIZE or group_by not in RANKING_GROUPS or order not in ("top", "least"):
+                raise ValueError
         except (ValueError, TypeError):
             return Response({"message": "Bad request, check parameters or data format."}, status=status.HTTP_400_BAD_REQUEST)
+        results = rankings(group_by=group_by, days=days, limit=limit, least=order == "least")
+        return Response({"days": days, "group_by": group_by, "order": order, "results": results}, status=status.HTTP_200_OK)
 
 class QuarterTrendSalesView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAdmin]
 
     def get(self, request):
-        sales = SaleModel.objects.all()
+        quarters = (
+            DailySalesRollup.objects
+            .annotate(year=ExtractYear("day"), quarter=ExtractQuarter("day"))
+            .values("year", "quarter")
+            .annotate(revenue=Sum("revenue"))
+            .order_by("year", "quarter")
+        )
 
         try:
             trend_by_quarter = defaultdict(float)
@@ -127,95 +199,312 @@ class QuarterTrendSalesView(APIView):
                     key = f"{year}-Q{q}"
                     trend_by_quarter[key] = 0
 
-            for sale in sales:
-                year = sale.timestamp.year
-                month = sale.timestamp.month
-                quarter = (month - 1) // 3 + 1
-                key = f"{year}-Q{quarter}"
-                trend_by_quarter[key] += sale.quantity_sold * sale.wine.retail_price
+            for row in quarters:
+                key = f"{row['year']}-Q{row['quarter']}"
+                trend_by_quarter[key] = row["revenue"]
                 
             return Response(trend_by_quarter, status=status.HTTP_200_OK)   
         except(ValueError, TypeError):
             return Response({"Message": "Bad request, check parameters or data format."}, status=status.HTTP_400_BAD_REQUEST)
 
 class BestEmployeeView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     def get(self, request):
         try:
-            revenue_per_user = {}
             days: int = int(request.query_params.get("days", 30))
-            start_date = datetime.now() - timedelta(days=days)
-            sales = SaleModel.objects.all()
+            start_date = timezone.localdate() - timedelta(days=days)
+            rollup = DailySalesRollup.objects.all()
             if days:
-                sales = sales.filter(timestamp__gte=start_date)
-            for sale in sales:
-                user = sale.user.username
-                tot_revenue = sale.quantity_sold * sale.wine.retail_price
-                revenue_per_user[user] = revenue_per_user.get(user, 0) + tot_revenue
-            sorted_revenue = sorted(revenue_per_user.items(), key=lambda x: x[1], reverse=True)
-            top_staff = [{"user": name, "revenue": revenue} for name, revenue in sorted_revenue]
+                rollup = rollup.filter(day__gte=start_date)
+            revenue_per_user = (
+                rollup.values("user__username")
+                .annotate(revenue=Sum("revenue"))
+                .order_by("-revenue", "user__username")
+            )
+            top_staff = [{"user": row["user__username"], "revenue": row["revenue"]} for row in revenue_per_user]
             return Response({"Top employees": top_staff}, status=status.HTTP_200_OK)
         except (ValueError, TypeError):
             return Response({"message": "Bad request, check the parameter or data format."}, status=status.HTTP_400_BAD_REQUEST)
 
+limit_param = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description="Most urgent wines returned (default 50).",
+    type=openapi.TYPE_INTEGER,
+    required=False,
+    default=50,
+)
+
 class LowStockView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsStaffOrManagerOrAdmin]
 
+    @swagger_auto_schema(manual_parameters=[limit_param])
     def get(self, request):
-        low_stock = {}
-        wines = WineModel.objects.all()
-        for wine in wines:
-            if wine.stock <= 10:
-                low_stock[wine.name] = wine.stock
-
-        if not low_stock: 
-                return Response({"message": "No low stock wines found"}, status=status.HTTP_200_OK)
-        
-        return Response({"message": f"Low stock wines: {low_stock}"}, status=status.HTTP_200_OK)
-    
+        try:
+            limit = min(int(request.query_params.get("limit", 50)), settings.API_MAX_PAGE_SIZE)
+            if limit < 1:
+                raise ValueError
+        except (ValueError, TypeError):
+            return Response({"message": "Bad request, check the parameter or data format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = list(
+            WineModel.objects.low_stock()
+            .values_list("id", "name", "stock", "reorder_point")[:limit + 1]
+        )
+        wines = [
+            {"wine_id": wine_id, "name": name, "stock": stock, "threshold": threshold, "shortfall": threshold - stock}
+            for wine_id, name, stock, threshold in rows[:limit]
+        ]
+        if not wines:
+            return Response({"message": "No low stock wines found", "wines": [], "more": False}, status=status.HTTP_200_OK)
+        return Response({"wines": wines, "more": len(rows) > limit}, status=status.HTTP_200_OK)
+
+valuation_group_by_param = openapi.Parameter(
+    name="group_by",
+    in_=openapi.IN_QUERY,
+    description="Comma separated dimensions, outermost first (default region,type,appellation).",
+    type=openapi.TYPE_STRING,
+    required=False,
+    default="region,type,appellation",
+)
+
+subtotals_param = openapi.Parameter(
+    name="subtotals",
+    in_=openapi.IN_QUERY,
+    description="If true, add the subtotals of every leading subset of group_by (like GROUP BY ROLLUP).",
+    type=openapi.TYPE_BOOLEAN,
+    required=False,
+    default=False,
+)
+
+class ValuationView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_description="""
+        Bottles in stock and their value at cost (stock x price) and at retail (stock x retail_price).
+        Cached until the next sale, restock, refund or catalog change, and for CACHE_PAYLOAD_TTL seconds at most.
+        **Access:** Manager or Admin.""",
+        operation_summary="Inventory valuation by region, type and appellation.",
+        manual_parameters=[valuation_group_by_param, subtotals_param],
+        responses={
+            200: "OK",
+            400: "Parameters not valid.",
+            401: "Unauthorized"
+        })
+    def get(self, request):
+        group_by = [dimension.strip() for dimension in request.query_params.get("group_by", "region,type,appellation").split(",") if dimension.strip()]
+        if not group_by or len(set(group_by)) != len(group_by) or any(dimension not in VALUATION_GROUPS for dimension in group_by):
+            return Response({"message": "Bad request, check parameters or data format."}, status=status.HTTP_400_BAD_REQUEST)
+        subtotals = is_true(request.query_params.get("subtotals"))
+
+        key = versioned_key("valuation", ",".join(group_by), subtotals)
+        payload = cache.get(key)
+        if payload is None:
+            payload = json.loads(json.dumps(valuation(group_by, subtotals), cls=DjangoJSONEncoder))
+            cache.set(key, payload, timeout=payload_timeout())
+        return Response(payload, status=status.HTTP_200_OK)
+
+class Echo:
+    """File-like object whose write() hands the value back, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+def date_range(request, field="timestamp"):
+    """
+    Filters for the ?from= and ?to= query params (ISO dates, both inclusive).
+    Raises ValueError if a date is not valid.
+    """
+    filters = {}
+    for param, lookup, shift in (("from", "gte", 0), ("to", "lt", 1)):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date for '{param}': {value}")
+        start_of_day = timezone.make_aware(datetime.combine(day + timedelta(days=shift), time.min))
+        filters[f"{field}__{lookup}"] = start_of_day
+    return filters
+
+from_param = openapi.Parameter("from", openapi.IN_QUERY, description="First day included (YYYY-MM-DD).", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, required=False)
+to_param = openapi.Parameter("to", openapi.IN_QUERY, description="Last day included (YYYY-MM-DD).", type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE, required=False)
+gzip_param = openapi.Parameter("gzip", openapi.IN_QUERY, description="If true, the CSV is gzip compressed.", type=openapi.TYPE_BOOLEAN, required=False, default=False)
+
 class BaseExportView(viewsets.ViewSet):
+    chunk_size = 2000
+
+    def export(self, filename, headers, rows, compress=False):
+        """
+        Stream the CSV while `rows` is consumed, so only one chunk of the
+        underlying queryset is in memory at any time.
+        """
+        writer = csv.writer(Echo())
 
-    def export(self, filename, headers, rows):
-        response = HttpResponse(content_type="text/csv")
-        response["Content-Disposition"] = f"attachment; filename='{filename}.csv'"
+        def lines():
+            yield writer.writerow(headers)
+            for row in rows:
+                yield writer.writerow(row)
 
-        writer = csv.writer(response)
-        writer.writerow(headers)
+        content = lines()
+        if compress:
+            content = self.gzip(content)
+            filename = f"{filename}.csv.gz"
+            content_type = "application/gzip"
+        else:
+            filename = f"{filename}.csv"
+            content_type = "text/csv"
 
-        for row in rows:
-            writer.writerow(row)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
         return response
 
+    def gzip(self, lines, flush_every=64 * 1024):
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        pending = 0
+        for line in lines:
+            data = line.encode()
+            pending += len(data)
+            chunk = compressor.compress(data)
+            if pending >= flush_every:
+                chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+                pending = 0
+            if chunk:
+                yield chunk
+        yield compressor.flush()
+
 class ExportViewSet(BaseExportView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAdmin]
 
+    @swagger_auto_schema(manual_parameters=[gzip_param])
     @action(detail=False, methods=["get"], url_path="wine-list")
     def wine_list(self, request):
-        wines = WineModel.objects.all()
-        rows = [
-            [wine.name, wine.stock, wine.price, wine.retail_price, wine.revenue()]
-            for wine in wines
-        ]
-        return self.export(filename="wines", headers=["Wine", "Quantity", "Price", "Retail Price", "Revenue"], rows=rows)
+        wines = WineModel.objects.order_by("id").values_list("name", "stock", "price", "retail_price", "quantity_sold")
+        rows = (
+            [name, stock, price, retail_price, retail_price * quantity_sold if retail_price is not None else 0]
+            for name, stock, price, retail_price, quantity_sold in wines.iterator(chunk_size=self.chunk_size)
+        )
+        return self.export(filename="wines", headers=["Wine", "Quantity", "Price", "Retail Price", "Revenue"], rows=rows,
+                           compress=is_true(request.query_params.get("gzip")))
 
+    @swagger_auto_schema(manual_parameters=[from_param, to_param, gzip_param])
     @action(detail=False, methods=["get"], url_path="sales")
     def sales(self,request):
-        sales = SaleModel.objects.all()
-        rows = [
-            [sale.timestamp.date(), sale.wine.name, sale.user.username, sale.quantity_sold, sale.quantity_sold * sale.wine.retail_price]
-            for sale in sales
-            ]
-        return self.export(filename="sales", headers=["Date","Wine","User","Quantity","Revenue"], rows=rows)
+        try:
+            sales = SaleModel.objects.filter(**date_range(request))
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        sales = sales.order_by("timestamp", "id").values_list("timestamp", "wine__name", "user__username", "quantity_sold", "unit_price")
+        rows = (
+            [timestamp.date(), wine, user, quantity, quantity * unit_price if unit_price is not None else None]
+            for timestamp, wine, user, quantity, unit_price in sales.iterator(chunk_size=self.chunk_size)
+            )
+        return self.export(filename="sales", headers=["Date","Wine","User","Quantity","Revenue"], rows=rows,
+                           compress=is_true(request.query_params.get("gzip")))
 
+    @swagger_auto_schema(manual_parameters=[from_param, to_param, gzip_param])
     @action(detail=False, methods=["get"], url_path="logs")
     def logs(self,request):
+        try:
+            logs = LogModel.objects.filter(**date_range(request))
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        logs = logs.order_by("timestamp", "id").values_list("timestamp", "action", "user__username", "details")
+        rows = ([timestamp.date(), action, user, details]
+               for timestamp, action, user, details in logs.iterator(chunk_size=self.chunk_size)
+               )
+        return self.export(filename="logs", headers=["Date","Action","User","Details"], rows=rows,
+                           compress=is_true(request.query_params.get("gzip")))
+
+dimensions_param = openapi.Parameter(
+    name="dimensions",
+    in_=openapi.IN_QUERY,
+    description=f"Comma separated, up to {MAX_DIMENSIONS} of: {', '.join([*DIMENSIONS, *TIME_BUCKETS])} (default month). seller is for admins.",
+    type=openapi.TYPE_STRING,
+    required=False,
+    default="month",
+)
+
+measures_param = openapi.Parameter(
+    name="measures",
+    in_=openapi.IN_QUERY,
+    description=f"Comma separated, any of: {', '.join(MEASURES)} (default net_bottles,revenue).",
+    type=openapi.TYPE_STRING,
+    required=False,
+    default="net_bottles,revenue",
+)
+
+cube_order_param = openapi.Parameter(
+    name="order_by",
+    in_=openapi.IN_QUERY,
+    description="A dimension or measure, prefixed with - for descending (default the dimensions in order).",
+    type=openapi.TYPE_STRING,
+    required=False,
+)
+
+cube_limit_param = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description="Cells returned, at most CUBE_MAX_CELLS (default the same).",
+    type=openapi.TYPE_INTEGER,
+    required=False,
+)
+
+cube_filter_params = [
+    openapi.Parameter(dimension, openapi.IN_QUERY, description=f"Comma separated {dimension} ids to keep." if model else f"Comma separated {dimension} values to keep.", type=openapi.TYPE_STRING, required=False)
+    for dimension, (_, model) in DIMENSIONS.items()
+]
+
+class CubeView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_description="""
+        Sales grouped by any mix of dimensions with the chosen measures, in one grouped query.
+        Filter with a dimension's name (?region=1,2&vintage=2018) and ?from= / ?to= on the sale day.
+        **Access:** Manager or Admin (seller is for admins).""",
+        operation_summary="Sales cube.",
+        manual_parameters=[dimensions_param, measures_param, cube_order_param, cube_limit_param, from_param, to_param, *cube_filter_params],
+        responses={
+            200: "OK",
+            400: "Parameters not valid.",
+            401: "Unauthorized",
+            403: "Seller asked by a non admin."
+        })
+    def get(self, request):
+        params = request.query_params
+        try:
+            dimensions = [name.strip() for name in params.get("dimensions", "month").split(",") if name.strip()]
+            measures = [name.strip() for name in params.get("measures", "net_bottles,revenue").split(",") if name.strip()]
+            if (
+                not dimensions or len(dimensions) > MAX_DIMENSIONS or len(set(dimensions)) != len(dimensions)
+                or any(name not in DIMENSIONS and name not in TIME_BUCKETS for name in dimensions)
+                or not measures or any(name not in MEASURES for name in measures)
+            ):
+                raise ValueError
+            order_by = params.get("order_by") or None
+            if order_by and order_by.lstrip("-") not in [*dimensions, *measures]:
+                raise ValueError
+            limit = int(params.get("limit", settings.CUBE_MAX_CELLS))
+            if not 1 <= limit <= settings.CUBE_MAX_CELLS:
+                raise ValueError
+            filters = {
+                dimension: [int(value) for value in params[dimension].split(",")]
+                for dimension in DIMENSIONS if params.get(dimension)
+            }
+            window = date_range(request)
+        except (ValueError, TypeError):
+            return Response({"message": "Bad request, check parameters or data format."}, status=status.HTTP_400_BAD_REQUEST)
+        # Per employee figures stay with admins, as in BestEmployeeView.
+        if ("seller" in dimensions or "seller" in filters) and not IsAdmin().has_permission(request, self):
+            return Response({"message": "Only admins can group or filter by seller."}, status=status.HTTP_403_FORBIDDEN)
 
-        logs = LogModel.objects.all()
-        rows =[[log.timestamp.date(), log.action, log.user.username, log.details]
-               for log in logs
-               ]
-        return self.export(filename="logs", headers=["Date","Action","User","Details"], rows=rows)
\ No newline at end of file
+        rows, more = cube(dimensions, measures, filters=filters, window=window, order_by=order_by, limit=limit)
+        return Response({"dimensions": dimensions, "measures": measures, "rows": rows, "more": more}, status=status.HTTP_200_OK)
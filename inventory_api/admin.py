@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import *
+from . import search
 
 class InventoryAdmin(admin.ModelAdmin):
     list_filter = ["region", "year", "type", "appellation"]
@@ -16,6 +17,13 @@ class InventoryAdmin(admin.ModelAdmin):
     "fields": ("price", "stock", "retail_price", "quantity_sold")
 })
 )
+    def get_search_results(self, request, queryset, search_term):
+        # Through the search index rather than a name icontains scan.
+        if len(search_term.strip()) < search.MIN_QUERY_LENGTH:
+            return super().get_search_results(request, queryset, search_term)
+        ids = [pk for pk, _ in WineModel.objects.search(search_term, limit=search.ADMIN_RESULTS)]
+        return queryset.filter(id__in=ids), False
+
     def save_model(self, request, obj, form, change):
         if not obj.pk:
             obj.added_by = request.user
@@ -25,11 +33,17 @@ class SaleAdmin(admin.ModelAdmin):
     list_display = ["id", "wine", "user", "quantity_sold", "timestamp"]
     readonly_fields = ["timestamp"]  
 
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ["reference", "user", "timestamp"]
+    search_fields = ["reference"]
+    readonly_fields = ["timestamp"]
+
 admin.site.register(WineModel, InventoryAdmin)
 admin.site.register(RegionModel)
 admin.site.register(WineTypeModel)
 admin.site.register(WineStyleModel)
 admin.site.register(AppellationModel)
 admin.site.register(SaleModel, SaleAdmin)
+admin.site.register(DeliveryModel, DeliveryAdmin)
 
 
@@ -0,0 +1,42 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def cache_version(namespace):
+    """
+    Current version of a cached namespace. Payloads are stored under a key
+    that includes it, so bumping the version invalidates all of them at once.
+    """
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Start from the clock so a lost version key never reuses an old payload key.
+        cache.add(_version_key(namespace), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_cache_version(namespace):
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.add(_version_key(namespace), time.time_ns(), timeout=None)
+
+
+def bump_on_commit(*namespaces):
+    # After commit, so a concurrent request can't cache the old rows under the new version.
+    transaction.on_commit(lambda: [bump_cache_version(namespace) for namespace in namespaces])
+
+
+def versioned_key(namespace, *parts):
+    return ":".join([namespace, str(cache_version(namespace)), *map(str, parts)])
+
+
+def payload_timeout():
+    # Bounded even with versioned keys: other workers may never see a bump (see settings.CACHES).
+    return getattr(settings, "CACHE_PAYLOAD_TTL", 60)
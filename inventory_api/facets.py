@@ -0,0 +1,148 @@
+import hashlib
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.db.models.functions import Cast
+from .cache import payload_timeout, versioned_key
+from .models import RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel
+
+# facet -> (wine field, lookup table labelling its ids)
+LOOKUP_FACETS = {
+    "type": ("type_id", WineTypeModel),
+    "style": ("style_id", WineStyleModel),
+    "region": ("region_id", RegionModel),
+    "appellation": ("appellation_id", AppellationModel),
+}
+# Retail price bands, lower bound included, upper bound excluded.
+PRICE_BANDS = {
+    "under-10": (None, Decimal("10")),
+    "10-20": (Decimal("10"), Decimal("20")),
+    "20-50": (Decimal("20"), Decimal("50")),
+    "50-100": (Decimal("50"), Decimal("100")),
+    "100-plus": (Decimal("100"), None),
+}
+FACETS = (*LOOKUP_FACETS, "vintage", "price_band", "in_stock")
+
+
+def band_condition(band):
+    low, high = PRICE_BANDS[band]
+    condition = Q(retail_price__isnull=False)
+    if low is not None:
+        condition &= Q(retail_price__gte=low)
+    if high is not None:
+        condition &= Q(retail_price__lt=high)
+    return condition
+
+
+PRICE_BAND = Case(*[When(band_condition(band), then=Value(band)) for band in PRICE_BANDS], output_field=CharField())
+IN_STOCK = Case(When(stock__gt=0, then=Value("true")), default=Value("false"), output_field=CharField())
+# What each facet counts, as text so all of them fit one UNION.
+VALUES = {
+    **{facet: Cast(F(field), CharField()) for facet, (field, _) in LOOKUP_FACETS.items()},
+    "vintage": Cast(F("year"), CharField()),
+    "price_band": PRICE_BAND,
+    "in_stock": IN_STOCK,
+}
+
+
+def ids(params, name):
+    try:
+        return [int(value) for value in params[name].split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"{name} must be a comma separated list of ids.")
+
+
+def year(params, name):
+    try:
+        return int(params[name])
+    except ValueError:
+        raise ValueError(f"{name} must be a year.")
+
+
+def parse_filters(params):
+    """
+    {facet: Q} for the filters in the query parameters, one condition per
+    facet so its own counts can be taken without it. Values of one facet
+    are alternatives, facets add up. Raises ValueError on a bad value.
+    """
+    conditions = {}
+    for facet, (field, _) in LOOKUP_FACETS.items():
+        if params.get(facet):
+            conditions[facet] = Q(**{f"{field}__in": ids(params, facet)})
+    if params.get("year_min") or params.get("year_max"):
+        vintage = Q()
+        if params.get("year_min"):
+            vintage &= Q(year__gte=year(params, "year_min"))
+        if params.get("year_max"):
+            vintage &= Q(year__lte=year(params, "year_max"))
+        conditions["vintage"] = vintage
+    if params.get("price_band"):
+        bands = [band.strip() for band in params["price_band"].split(",") if band.strip()]
+        unknown = [band for band in bands if band not in PRICE_BANDS]
+        if unknown:
+            raise ValueError(f"Unknown price band {', '.join(unknown)}, use: {', '.join(PRICE_BANDS)}.")
+        price = Q()
+        for band in bands:
+            price |= band_condition(band)
+        conditions["price_band"] = price
+    if params.get("in_stock"):
+        value = params["in_stock"].lower()
+        if value not in ("1", "true", "yes", "0", "false", "no"):
+            raise ValueError("in_stock must be true or false.")
+        conditions["in_stock"] = Q(stock__gt=0) if value in ("1", "true", "yes") else Q(stock=0)
+    return conditions
+
+
+def labels():
+    """{facet: {id: label}} of the lookup facets, cached until a lookup table changes or CACHE_PAYLOAD_TTL passes."""
+    key = versioned_key("dashboard", "facet-labels")
+    cached = cache.get(key)
+    if cached is None:
+        cached = {facet: {pk: str(row) for pk, row in model.objects.in_bulk().items()} for facet, (_, model) in LOOKUP_FACETS.items()}
+        cache.set(key, cached, timeout=payload_timeout())
+    return cached
+
+
+def facet_counts(conditions):
+    """
+    Wines per value of every facet in one query, a UNION ALL of grouped
+    counts. Each facet is counted with every filter but its own, so the
+    counts tell what picking one more value of it would give. Cached until
+    a wine, a lookup table or whether a wine is in stock changes, and for
+    CACHE_PAYLOAD_TTL seconds at most: stock that other workers sell out
+    shows up within that time.
+    """
+    key = versioned_key("facets", "counts", hashlib.sha256(repr(sorted(conditions.items())).encode()).hexdigest())
+    result = cache.get(key)
+    if result is None:
+        result = count(conditions)
+        cache.set(key, result, timeout=payload_timeout())
+    return result
+
+
+def count(conditions):
+    branches = [
+        WineModel.objects.filter(*[condition for other, condition in conditions.items() if other != facet])
+        .values(facet=Value(facet, output_field=CharField()), value=VALUES[facet])
+        .annotate(count=Count("id"))
+        .order_by()
+        for facet in FACETS
+    ]
+    rows = branches[0].union(*branches[1:], all=True)
+
+    counts = {facet: {} for facet in FACETS}
+    for row in rows:
+        if row["value"] is not None:
+            counts[row["facet"]][row["value"]] = row["count"]
+
+    names = labels()
+    result = {}
+    for facet in LOOKUP_FACETS:
+        values = [{"id": int(value), "label": names[facet].get(int(value)), "count": count} for value, count in counts[facet].items()]
+        result[facet] = sorted(values, key=lambda value: (-value["count"], value["label"] or ""))
+    result["vintage"] = sorted(
+        ({"year": int(value), "count": count} for value, count in counts["vintage"].items()), key=lambda value: -value["year"]
+    )
+    result["price_band"] = [{"band": band, "count": counts["price_band"][band]} for band in PRICE_BANDS if band in counts["price_band"]]
+    result["in_stock"] = [{"in_stock": value == "true", "count": counts["in_stock"][value]} for value in ("true", "false") if value in counts["in_stock"]]
+    return result
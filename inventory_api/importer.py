@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+from functools import reduce
+from operator import or_
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from .cache import bump_on_commit
+from .search import document
+from .models import RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel
+
+FORMATS = ("csv", "jsonl")
+REQUIRED = ("name", "year", "country", "region", "type", "style", "body", "appellation")
+# Validated with the model field, so max_length, max year and decimal places match WineModel.
+WINE_FIELDS = ("name", "year", "price", "retail_price", "stock", "reorder_threshold")
+CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+
+def choice_map(choices):
+    # Keys and labels, any case: "red", "Red" and "RED" are all WineTypeModel "red".
+    return {name.lower(): key for key, label in choices.items() for name in (key, label)}
+
+
+TYPES = choice_map(WineTypeModel.TYPE_)
+SWEETNESS = choice_map(WineStyleModel.SWETTNESS)
+BODIES = choice_map(WineStyleModel.BODY)
+
+
+def format_of(name):
+    """csv or jsonl from a file name, None when the extension says neither."""
+    extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl"}.get(extension)
+
+
+def read_rows(stream, format):
+    """
+    (line, record) for each record of a binary stream, read one line at a
+    time. A JSONL line that isn't an object comes back as a ValueError.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        missing = [column for column in REQUIRED if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError as error:
+            record = ValueError(f"Invalid JSON: {error}")
+        if not isinstance(record, (dict, ValueError)):
+            record = ValueError("Each line must be a JSON object.")
+        yield line, record
+
+
+class Dimension:
+    """
+    Ids of a lookup table by natural key, loaded once and completed as new
+    keys show up, so resolving a row costs a dict lookup and not a query.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.ids = {row[:-1]: row[-1] for row in model.objects.values_list(*fields, "id")}
+        self.created = 0
+
+    def add_missing(self, keys):
+        missing = {key for key in keys if key not in self.ids}
+        if not missing:
+            return
+        # ignore_conflicts: another import may be creating the same rows.
+        self.model.objects.bulk_create(
+            [self.model(**dict(zip(self.fields, key))) for key in missing], ignore_conflicts=True
+        )
+        found = self.model.objects.filter(
+            reduce(or_, (Q(**dict(zip(self.fields, key))) for key in missing))
+        ).values_list(*self.fields, "id")
+        for row in found:
+            self.ids[row[:-1]] = row[-1]
+        self.created += len(missing)
+
+
+class WineImporter:
+    """
+    Streams wines from CSV or JSONL into WineModel. Lookup rows are
+    resolved through in-memory Dimension maps and created when missing, the
+    wines go in with one bulk_create per `chunk_size` rows, each chunk in its
+    own transaction. Invalid rows are reported with their line and skipped,
+    the rest of the file is still imported.
+    """
+
+    def __init__(self, user, chunk_size=None, max_errors=MAX_REPORTED_ERRORS):
+        self.user = user
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.max_errors = max_errors
+        self.regions = Dimension(RegionModel, ("country", "region"))
+        self.types = Dimension(WineTypeModel, ("type",))
+        self.styles = Dimension(WineStyleModel, ("style", "body"))
+        self.appellations = Dimension(AppellationModel, ("name",))
+        self.fields = {name: WineModel._meta.get_field(name) for name in WINE_FIELDS}
+        self.rows = 0
+        self.created = 0
+        self.rejected = 0
+        self.errors = []
+        self.error_count = 0
+
+    def run(self, stream, format):
+        chunk = []
+        for line, record in read_rows(stream, format):
+            self.rows += 1
+            row = self.clean(line, record)
+            if row is not None:
+                chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self.insert(chunk)
+                chunk = []
+        if chunk:
+            self.insert(chunk)
+        if self.created:
+            bump_on_commit("valuation", "facets")
+        if self.regions.created or self.types.created or self.styles.created or self.appellations.created:
+            # bulk_create skips the post_save signals that would do it.
+            bump_on_commit("dashboard", "valuation", "facets")
+        return self.report()
+
+    def error(self, line, field, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "field": field, "message": message})
+
+    def reject(self, line, problems):
+        self.rejected += 1
+        for field, message in problems:
+            self.error(line, field, message)
+        return None
+
+    def clean(self, line, record):
+        """The row ready to insert, or None once its problems are reported."""
+        if isinstance(record, ValueError):
+            return self.reject(line, [(None, str(record))])
+        # The serializer spells it "appelation".
+        if "appellation" not in record and "appelation" in record:
+            record["appellation"] = record["appelation"]
+
+        problems = []
+        text = {}
+        for name in REQUIRED:
+            value = record.get(name)
+            value = "" if value is None else str(value).strip()
+            if not value:
+                problems.append((name, "This field is required."))
+            text[name] = value
+
+        row = {}
+        for name, field in self.fields.items():
+            value = record.get(name, text.get(name))
+            if isinstance(value, str):
+                value = value.strip()
+            if value in ("", None):
+                if name in REQUIRED:
+                    continue
+                value = field.get_default() if name == "stock" else None
+            try:
+                row[name] = field.clean(value, None)
+            except ValidationError as error:
+                problems.extend((name, message) for message in error.messages)
+
+        price, retail_price = row.get("price"), row.get("retail_price")
+        if price is not None and price < 0:
+            problems.append(("price", "Price can't be negative."))
+        if price is not None and retail_price is not None and retail_price <= price:
+            problems.append(("retail_price", "Retail price must be above the price."))
+
+        wine_type = TYPES.get(text["type"].lower())
+        if text["type"] and wine_type is None:
+            problems.append(("type", f"Unknown type, expected one of: {', '.join(WineTypeModel.TYPE_)}."))
+        style = SWEETNESS.get(text["style"].lower())
+        if text["style"] and style is None:
+            problems.append(("style", f"Unknown style, expected one of: {', '.join(WineStyleModel.SWETTNESS)}."))
+        body = BODIES.get(text["body"].lower())
+        if text["body"] and body is None:
+            problems.append(("body", f"Unknown body, expected one of: {', '.join(WineStyleModel.BODY)}."))
+        for name in ("country", "region", "appellation"):
+            if len(text[name]) > 100:
+                problems.append((name, "Ensure this field has no more than 100 characters."))
+
+        if problems:
+            return self.reject(line, problems)
+        row["line"] = line
+        row["region"] = (text["country"], text["region"])
+        row["type"] = (wine_type,)
+        row["style"] = (style, body)
+        row["appellation"] = (text["appellation"],)
+        return row
+
+    def insert(self, chunk):
+        # Lookups first and committed on their own, so a failing chunk can't roll back ids kept in the maps.
+        with transaction.atomic():
+            self.regions.add_missing(row["region"] for row in chunk)
+            self.types.add_missing(row["type"] for row in chunk)
+            self.styles.add_missing(row["style"] for row in chunk)
+            self.appellations.add_missing(row["appellation"] for row in chunk)
+        thresholds = dict(WineTypeModel.objects.values_list("id", "default_reorder_threshold"))
+
+        wines = []
+        for row in chunk:
+            type_id = self.types.ids[row["type"]]
+            wines.append(WineModel(
+                name=row["name"],
+                year=row["year"],
+                region_id=self.regions.ids[row["region"]],
+                type_id=type_id,
+                style_id=self.styles.ids[row["style"]],
+                appellation_id=self.appellations.ids[row["appellation"]],
+                added_by=self.user,
+                price=row["price"],
+                retail_price=row["retail_price"],
+                stock=row["stock"],
+                reorder_threshold=row["reorder_threshold"],
+                # bulk_create skips WineModel.save(), which sets it and search_document.
+                reorder_point=row["reorder_threshold"] if row["reorder_threshold"] is not None else thresholds[type_id],
+                search_document=document(row["name"], row["year"], *row["region"], *row["appellation"]),
+            ))
+        try:
+            with transaction.atomic():
+                WineModel.objects.bulk_create(wines)
+            self.created += len(wines)
+        except IntegrityError:
+            # Something the checks above missed: find the culprits one savepoint at a time.
+            for row, wine in zip(chunk, wines):
+                try:
+                    with transaction.atomic():
+                        wine.save(force_insert=True)
+                    self.created += 1
+                except IntegrityError as error:
+                    self.reject(row["line"], [(None, str(error))])
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors),
+            "lookups_created": {
+                "regions": self.regions.created,
+                "types": self.types.created,
+                "styles": self.styles.created,
+                "appellations": self.appellations.created,
+            },
+        }
@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from analytics.benchmarks import bench_database, seed_catalog
+from inventory_api.models import WineModel, SaleModel
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer RegisterSaleView on one wine from many threads and check nothing is oversold "
+        "(runs on a throwaway database, use PostgreSQL for meaningful numbers)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--requests", type=int, default=2000, help="Total sale requests across all threads.")
+        parser.add_argument("--stock", type=int, default=1000, help="Initial stock of the contended wine.")
+        parser.add_argument("--quantity", type=int, default=1, help="Bottles per sale.")
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        with bench_database():
+            user, wine_ids = seed_catalog(1, role="staff")
+            wine_id = wine_ids[0]
+            WineModel.objects.filter(id=wine_id).update(stock=options["stock"])
+            token = Token.objects.get(user=user).key
+            # Threads open their own connections, so the seed data must be committed.
+            connection.close()
+
+            counts = {"accepted": 0, "rejected": 0, "errors": 0}
+            lock = threading.Lock()
+            per_thread = [options["requests"] // options["threads"]] * options["threads"]
+            for i in range(options["requests"] % options["threads"]):
+                per_thread[i] += 1
+
+            def worker(requests):
+                # The test client's exception hook is process-wide, so let
+                # server errors come back as 500s instead of being re-raised.
+                client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f"Token {token}")
+                local = {"accepted": 0, "rejected": 0, "errors": 0}
+                try:
+                    for _ in range(requests):
+                        response = client.post(
+                            "/wine-list-api/sale/",
+                            {"wine_id": wine_id, "quantity": options["quantity"]},
+                            content_type="application/json",
+                        )
+                        if response.status_code == 202:
+                            local["accepted"] += 1
+                        elif response.status_code == 400:
+                            local["rejected"] += 1
+                        else:
+                            local["errors"] += 1
+                finally:
+                    connection.close()
+                with lock:
+                    for key, value in local.items():
+                        counts[key] += value
+
+            threads = [threading.Thread(target=worker, args=(requests,)) for requests in per_thread]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            wine = WineModel.objects.get(id=wine_id)
+            bottles_in_sales = sum(SaleModel.objects.filter(wine_id=wine_id).values_list("quantity_sold", flat=True))
+            result = {
+                "database": connection.vendor,
+                "threads": options["threads"],
+                "requests": options["requests"],
+                "initial_stock": options["stock"],
+                "elapsed_s": round(elapsed, 3),
+                "sales_per_s": round(counts["accepted"] / elapsed, 1) if elapsed else None,
+                **counts,
+                "final_stock": wine.stock,
+                "bottles_in_sales": bottles_in_sales,
+                "oversold": wine.stock < 0 or bottles_in_sales > options["stock"]
+                            or wine.stock + bottles_in_sales != options["stock"],
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        for key, value in result.items():
+            self.stdout.write(f"{key:>18}: {value}")
+        if result["oversold"]:
+            self.stderr.write(self.style.ERROR("Stock and sales do not add up: wine oversold."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No overselling."))
@@ -0,0 +1,52 @@
+import sys
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from accounts.audit import audit_log
+from inventory_api.importer import CHUNK_SIZE, FORMATS, WineImporter, format_of
+
+
+class Command(BaseCommand):
+    help = "Import wines from a CSV or JSONL file, creating the missing regions, types, styles and appellations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help='File to import, "-" for stdin.')
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--user", help="Username recorded as added_by (default: the first admin).")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Wines per bulk_create and transaction.")
+        parser.add_argument("--max-errors", type=int, default=50, help="Errors printed at most.")
+
+    def handle(self, *args, **options):
+        format = options["format"] or format_of(options["path"])
+        if format is None:
+            raise CommandError(f"Can't tell the format of {options['path']}, use --format.")
+
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+        else:
+            user = User.objects.filter(userprofile__role="admin").order_by("id").first()
+        if user is None:
+            raise CommandError("No such user." if options["user"] else "No admin to record as added_by, use --user.")
+
+        importer = WineImporter(user, chunk_size=options["chunk_size"], max_errors=options["max_errors"])
+        started = time.perf_counter()
+        try:
+            if options["path"] == "-":
+                result = importer.run(sys.stdin.buffer, format)
+            else:
+                with open(options["path"], "rb") as stream:
+                    result = importer.run(stream, format)
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        audit_log.log(user, "wine_import", f"{result['created']} wines imported from {options['path']}, {result['rejected']} rows rejected")
+
+        for error in result["errors"]:
+            field = f" {error['field']}:" if error["field"] else ""
+            self.stderr.write(f"line {error['line']}:{field} {error['message']}")
+        if result["errors_truncated"]:
+            self.stderr.write("...")
+        created = ", ".join(f"{count} {name}" for name, count in result["lookups_created"].items() if count)
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['created']} of {result['rows']} wines imported in {time.perf_counter() - started:.1f}s, "
+            f"{result['rejected']} rows rejected" + (f", created {created}." if created else ".")
+        ))
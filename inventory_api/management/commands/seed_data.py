@@ -0,0 +1,274 @@
+import multiprocessing
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework.authtoken.models import Token
+from accounts.models import UserProfile, LogModel
+from analytics import rollup
+from inventory_api.models import (
+    RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel, SaleModel
+)
+
+REGIONS = {
+    "Italy": ["Tuscany", "Piedmont", "Veneto", "Sicily", "Puglia", "Abruzzo", "Campania", "Friuli"],
+    "France": ["Bordeaux", "Burgundy", "Champagne", "Rhone", "Loire", "Alsace", "Languedoc", "Provence"],
+    "Spain": ["Rioja", "Ribera del Duero", "Priorat", "Rias Baixas", "Jerez", "Penedes"],
+    "Portugal": ["Douro", "Alentejo", "Dao", "Vinho Verde"],
+    "Germany": ["Mosel", "Rheingau", "Pfalz", "Baden"],
+    "USA": ["Napa Valley", "Sonoma", "Willamette Valley", "Paso Robles"],
+    "Australia": ["Barossa Valley", "McLaren Vale", "Margaret River", "Yarra Valley"],
+    "Argentina": ["Mendoza", "Salta", "Patagonia"],
+    "Chile": ["Maipo Valley", "Colchagua", "Casablanca"],
+    "New Zealand": ["Marlborough", "Central Otago", "Hawke's Bay"],
+}
+APPELLATIONS = ["DOCG", "DOC", "IGT", "AOC", "AOP", "IGP", "DO", "DOCa", "DOQ", "AVA", "Pradikatswein", "GI", "Grand Cru", "Premier Cru"]
+ESTATES = ["Castello", "Tenuta", "Chateau", "Domaine", "Bodega", "Quinta", "Weingut", "Cantina", "Clos", "Estate"]
+GRAPES = [
+    "Sangiovese", "Nebbiolo", "Barbera", "Montepulciano", "Merlot", "Cabernet Sauvignon", "Pinot Noir", "Syrah",
+    "Grenache", "Tempranillo", "Malbec", "Chardonnay", "Sauvignon Blanc", "Riesling", "Pinot Grigio", "Vermentino",
+    "Albarino", "Chenin Blanc", "Zinfandel", "Touriga Nacional",
+]
+# Sales by hour of day (the shop is open 10-22, busiest at lunch and after work).
+HOURS = {10: 2, 11: 4, 12: 8, 13: 8, 14: 4, 15: 3, 16: 4, 17: 7, 18: 10, 19: 10, 20: 7, 21: 3}
+# Monday first
+WEEKDAYS = [0.8, 0.8, 0.9, 1.0, 1.4, 1.7, 1.1]
+QUANTITIES = {1: 60, 2: 22, 3: 10, 6: 6, 12: 2}
+LOG_ACTIONS = {"sale_created": 40, "user_logged_in": 22, "user_logged_out": 20, "restock": 10, "refund": 6, "wine_deleted": 2}
+
+
+class Clock:
+    """Random event times: more on weekends, at lunch and after work, and growing over the history."""
+
+    def __init__(self, end, days):
+        self.first_day = end - timedelta(days=days)
+        self.days = range(days)
+        self.day_weights = list(accumulate(
+            WEEKDAYS[(self.first_day + timedelta(days=day)).weekday()] * (0.5 + day / days) for day in self.days
+        ))
+
+    def times(self, rng, count):
+        days = rng.choices(self.days, cum_weights=self.day_weights, k=count)
+        hours = rng.choices(list(HOURS), weights=list(HOURS.values()), k=count)
+        return [
+            self.first_day + timedelta(days=day, hours=hour, seconds=rng.randrange(3600))
+            for day, hour in zip(days, hours)
+        ]
+
+
+# Filled by seed_sales before the worker processes fork, they inherit it.
+_sales = {}
+
+
+def insert_sales(chunk):
+    """Generate and insert one chunk of sales, from its own generator so the rows don't depend on --workers."""
+    index, count = chunk
+    rng = random.Random(f"{_sales['seed']}-sales-{index}")
+    wines = rng.choices(_sales["ranked"], cum_weights=_sales["popularity"], k=count)
+    sellers = rng.choices(_sales["sellers"], k=count)
+    quantities = rng.choices(list(QUANTITIES), weights=list(QUANTITIES.values()), k=count)
+    sales = []
+    for wine_id, user_id, bottles, timestamp in zip(wines, sellers, quantities, _sales["clock"].times(rng, count)):
+        # quantity_sold is net of refunds and must stay above 0 and at least refund_qty.
+        refunded = rng.randint(1, bottles // 2) if bottles > 1 and rng.random() < _sales["refund_rate"] else 0
+        unit_price, unit_cost = _sales["prices"][wine_id]
+        sales.append(SaleModel(
+            user_id=user_id, wine_id=wine_id, quantity_sold=bottles - refunded, refund_qty=refunded, timestamp=timestamp,
+            unit_price=unit_price, unit_cost=unit_cost,
+        ))
+    with transaction.atomic():
+        SaleModel.objects.bulk_create(sales)
+    return count
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the configured database with synthetic regions, appellations, wines, users, sales and logs "
+        "in chunked bulk inserts. The same --seed and --end always produce the same rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--regions", type=int, default=40)
+        parser.add_argument("--appellations", type=int, default=20)
+        parser.add_argument("--wines", type=int, default=2_000)
+        parser.add_argument("--users", type=int, default=50, help="About 5%% admins, 15%% managers, the rest staff.")
+        parser.add_argument("--sales", type=int, default=1_000_000)
+        parser.add_argument("--logs", type=int, default=200_000)
+        parser.add_argument("--days", type=int, default=730, help="History length, sales grow over time.")
+        parser.add_argument("--end", help="Last day of history (YYYY-MM-DD, default today).")
+        parser.add_argument("--refund-rate", type=float, default=0.02, help="Share of multi-bottle sales partly refunded.")
+        parser.add_argument("--password", default="seed-password", help="Password of every seeded user.")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--workers", type=int, default=1,
+            help="Processes inserting sales chunks in parallel (PostgreSQL, SQLite takes one writer at a time).",
+        )
+        parser.add_argument("--skip-rollup", action="store_true", help="Don't rebuild the daily sales rollup afterwards.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.prefix = f"seed{options['seed']}"
+        if User.objects.filter(username__startswith=f"{self.prefix}_").exists():
+            raise CommandError(f"Users of seed {options['seed']} already exist, pick another --seed.")
+        end = parse_date(options["end"]) if options["end"] else timezone.localdate()
+        if end is None:
+            raise CommandError("--end must be a date as YYYY-MM-DD.")
+        if options["workers"] > 1 and connection.vendor == "sqlite":
+            raise CommandError("--workers needs a database taking concurrent writes, SQLite doesn't.")
+        self.clock = Clock(timezone.make_aware(datetime.combine(end + timedelta(days=1), dt_time.min)), options["days"])
+
+        started = time.perf_counter()
+        catalog = self.step("catalog", self.seed_catalog)
+        admins, sellers, user_ids = self.step(f"{options['users']} users", self.seed_users)
+        wine_ids = self.step(f"{options['wines']} wines", self.seed_wines, admins[0], *catalog)
+        self.step(f"{options['sales']} sales", self.seed_sales, wine_ids, sellers)
+        self.step(f"{options['logs']} logs", self.seed_logs, wine_ids, user_ids)
+
+        # Lifetime counters, the rollup and planner statistics follow the new sales.
+        sold = SaleModel.objects.filter(wine=OuterRef("pk")).order_by().values("wine").annotate(total=Sum("quantity_sold")).values("total")
+        WineModel.objects.filter(id__in=wine_ids).update(quantity_sold=Coalesce(Subquery(sold), 0))
+        if not options["skip_rollup"]:
+            self.step("rollup", rollup.rebuild)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+
+    def step(self, label, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        self.stdout.write(f"{label} in {time.perf_counter() - started:.1f}s")
+        return result
+
+    def insert(self, model, rows):
+        """bulk_create in chunks, one transaction per chunk."""
+        size = self.options["batch_size"]
+        for start in range(0, len(rows), size):
+            with transaction.atomic():
+                model.objects.bulk_create(rows[start:start + size])
+
+    def seed_catalog(self):
+        pairs = [(country, region) for country, regions in REGIONS.items() for region in regions]
+        regions = [
+            RegionModel(country=pairs[i % len(pairs)][0], region=pairs[i % len(pairs)][1] + (f" {i // len(pairs) + 1}" if i >= len(pairs) else ""))
+            for i in range(self.options["regions"])
+        ]
+        appellations = [
+            AppellationModel(name=APPELLATIONS[i % len(APPELLATIONS)] + (f" {i // len(APPELLATIONS) + 1}" if i >= len(APPELLATIONS) else ""))
+            for i in range(self.options["appellations"])
+        ]
+        # Shared with whatever is already there, so reruns just reuse them.
+        RegionModel.objects.bulk_create(regions, ignore_conflicts=True)
+        AppellationModel.objects.bulk_create(appellations, ignore_conflicts=True)
+        WineTypeModel.objects.bulk_create([WineTypeModel(type=key) for key in WineTypeModel.TYPE_], ignore_conflicts=True)
+        WineStyleModel.objects.bulk_create(
+            [WineStyleModel(style=style, body=body) for style in WineStyleModel.SWETTNESS for body in WineStyleModel.BODY],
+            ignore_conflicts=True,
+        )
+
+        existing = {(country, region): pk for country, region, pk in RegionModel.objects.values_list("country", "region", "id")}
+        region_ids = [existing[(region.country, region.region)] for region in regions]
+        appellation_ids = list(AppellationModel.objects.filter(name__in=[a.name for a in appellations]).order_by("name").values_list("id", flat=True))
+        type_ids = list(WineTypeModel.objects.order_by("type").values_list("id", flat=True))
+        style_ids = list(WineStyleModel.objects.order_by("style", "body").values_list("id", flat=True))
+        return region_ids, appellation_ids, type_ids, style_ids
+
+    def seed_wines(self, admin_id, region_ids, appellation_ids, type_ids, style_ids):
+        rng = self.rng
+        this_year = timezone.localdate().year
+        first_id = (WineModel.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+        wines = []
+        for i in range(self.options["wines"]):
+            price = round(min(max(rng.lognormvariate(2.7, 0.6), 3), 500), 2)
+            wines.append(WineModel(
+                name=f"{rng.choice(ESTATES)} {rng.choice(GRAPES)} {first_id + i}",
+                year=rng.randint(this_year - 30, this_year - 1),
+                region_id=rng.choice(region_ids),
+                type_id=rng.choice(type_ids),
+                style_id=rng.choice(style_ids),
+                appellation_id=rng.choice(appellation_ids),
+                added_by_id=admin_id,
+                price=price,
+                retail_price=round(price * rng.uniform(1.4, 2.5) + 0.01, 2),
+                stock=rng.randint(0, 300),
+            ))
+        self.insert(WineModel, wines)
+        # bulk_create skips WineModel.save(), which fills the search documents.
+        WineModel.objects.filter(id__gte=first_id).refresh_search(self.options["batch_size"])
+        return list(WineModel.objects.filter(id__gte=first_id).order_by("id").values_list("id", flat=True))
+
+    def seed_users(self):
+        count = max(self.options["users"], 1)
+        admins, managers = max(1, count // 20), count * 15 // 100
+        roles = ["admin"] * admins + ["manager"] * managers + ["staff"] * max(count - admins - managers, 0)
+        # One hash for everyone, hashing is what makes create_user slow.
+        password = make_password(self.options["password"])
+        users = [User(username=f"{self.prefix}_{role}_{i}", password=password) for i, role in enumerate(roles)]
+        # bulk_create skips post_save, so the profile and token signals are done here.
+        self.insert(User, users)
+        created = dict(User.objects.filter(username__startswith=f"{self.prefix}_").values_list("username", "id"))
+        ids = [created[user.username] for user in users]
+        self.insert(UserProfile, [UserProfile(user_id=user_id, role=role) for user_id, role in zip(ids, roles)])
+        self.insert(Token, [Token(user_id=user_id, key=Token.generate_key()) for user_id in ids])
+        admins = [user_id for user_id, role in zip(ids, roles) if role == "admin"]
+        sellers = [user_id for user_id, role in zip(ids, roles) if role != "admin"] or ids
+        return admins, sellers, ids
+
+    def seed_sales(self, wine_ids, sellers):
+        # A few wines sell most of the bottles.
+        ranked = wine_ids[:]
+        self.rng.shuffle(ranked)
+        _sales.update(
+            seed=self.options["seed"],
+            ranked=ranked,
+            popularity=list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(ranked)))),
+            sellers=sellers,
+            prices={pk: (retail_price, price) for pk, retail_price, price in WineModel.objects.filter(id__in=wine_ids).values_list("id", "retail_price", "price")},
+            refund_rate=self.options["refund_rate"],
+            clock=self.clock,
+        )
+        total, size = self.options["sales"], self.options["batch_size"]
+        chunks = [(chunk, min(size, total - start)) for chunk, start in enumerate(range(0, total, size))]
+        pool = None
+        if self.options["workers"] > 1:
+            # The children inherit _sales and open their own connections.
+            connections.close_all()
+            pool = multiprocessing.get_context("fork").Pool(self.options["workers"])
+        try:
+            done = 0
+            for count in (pool.imap_unordered if pool else map)(insert_sales, chunks):
+                done += count
+                if done % (size * 100) == 0:
+                    self.stdout.write(f"  {done} sales...")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        return total
+
+    def seed_logs(self, wine_ids, user_ids):
+        rng = self.rng
+        total, size = self.options["logs"], self.options["batch_size"]
+        for start in range(0, total, size):
+            count = min(size, total - start)
+            actions = rng.choices(list(LOG_ACTIONS), weights=list(LOG_ACTIONS.values()), k=count)
+            logs = []
+            for action, timestamp in zip(actions, self.clock.times(rng, count)):
+                details = {
+                    "restock": f"Wine {rng.choice(wine_ids)}: + {rng.choice((6, 12, 24, 48))}",
+                    "refund": f"{rng.randint(1, 3)} bottles of wine {rng.choice(wine_ids)} refunded",
+                    "wine_deleted": f"deleted wine: {rng.choice(wine_ids)}",
+                }.get(action, "")
+                logs.append(LogModel(user_id=rng.choice(user_ids), action=action, details=details, timestamp=timestamp))
+            with transaction.atomic():
+                LogModel.objects.bulk_create(logs)
+        return total
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0010_salemodel_quantity_sold_gt_0_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salemodel',
+            index=models.Index(fields=['timestamp', 'wine'], name='sale_timestamp_wine_idx'),
+        ),
+    ]
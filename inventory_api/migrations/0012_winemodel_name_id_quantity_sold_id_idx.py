@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0011_salemodel_sale_timestamp_wine_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['name', 'id'], name='wine_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['quantity_sold', 'id'], name='wine_quantity_sold_id_idx'),
+        ),
+    ]
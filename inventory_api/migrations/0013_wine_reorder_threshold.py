@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0012_winemodel_name_id_quantity_sold_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='winemodel',
+            name='reorder_point',
+            field=models.PositiveIntegerField(default=10, editable=False),
+        ),
+        migrations.AddField(
+            model_name='winemodel',
+            name='reorder_threshold',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='reorder threshold'),
+        ),
+        migrations.AddField(
+            model_name='winetypemodel',
+            name='default_reorder_threshold',
+            field=models.PositiveIntegerField(default=10, verbose_name='default reorder threshold'),
+        ),
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('reorder_point'), '-', models.F('stock')), models.F('id'), name='wine_shortfall_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0013_wine_reorder_threshold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salemodel',
+            index=models.Index(fields=['wine', 'timestamp'], include=('quantity_sold',), name='sale_wine_timestamp_idx'),
+        ),
+    ]
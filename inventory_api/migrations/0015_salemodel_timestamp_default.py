@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0014_sale_wine_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salemodel',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
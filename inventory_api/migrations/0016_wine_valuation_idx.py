@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0015_salemodel_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['region', 'type', 'appellation'], include=('stock', 'price', 'retail_price'), name='wine_valuation_idx'),
+        ),
+    ]
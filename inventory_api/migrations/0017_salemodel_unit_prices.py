@@ -0,0 +1,64 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:57
+
+from django.db import migrations, models, transaction
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 10_000
+
+
+def backfill_unit_prices(apps, schema_editor):
+    """
+    Give the existing sales their wine's current prices, the only ones
+    known, BATCH_SIZE ids per UPDATE and transaction so the sales table is
+    never locked for the whole backfill.
+    """
+    SaleModel = apps.get_model("inventory_api", "SaleModel")
+    WineModel = apps.get_model("inventory_api", "WineModel")
+    sales = SaleModel.objects.using(schema_editor.connection.alias)
+    wine = WineModel.objects.using(schema_editor.connection.alias).filter(pk=OuterRef("wine_id"))
+    last = sales.order_by("-id").values_list("id", flat=True).first() or 0
+    for start in range(0, last, BATCH_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            sales.filter(id__gt=start, id__lte=start + BATCH_SIZE, unit_price__isnull=True, unit_cost__isnull=True).update(
+                unit_price=Subquery(wine.values("retail_price")[:1]),
+                unit_cost=Subquery(wine.values("price")[:1]),
+            )
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('inventory_api', '0016_wine_valuation_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='salemodel',
+            name='sale_timestamp_wine_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='salemodel',
+            name='sale_wine_timestamp_idx',
+        ),
+        migrations.AddField(
+            model_name='salemodel',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True, verbose_name='unit cost'),
+        ),
+        migrations.AddField(
+            model_name='salemodel',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=8, null=True, verbose_name='unit retail price'),
+        ),
+        migrations.RunPython(backfill_unit_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='salemodel',
+            index=models.Index(fields=['timestamp', 'wine'], include=('user', 'quantity_sold', 'unit_price', 'unit_cost'), name='sale_timestamp_wine_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salemodel',
+            index=models.Index(fields=['wine', 'timestamp'], include=('quantity_sold', 'unit_price', 'unit_cost'), name='sale_wine_timestamp_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0017_salemodel_unit_prices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100, unique=True)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, editable=False)),
+                ('lines', models.JSONField()),
+                ('note', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL, verbose_name='received by')),
+            ],
+        ),
+    ]
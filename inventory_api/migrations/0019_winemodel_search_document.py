@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:08
+
+from django.db import migrations, models, transaction
+from inventory_api import search
+
+BATCH_SIZE = 2_000
+
+
+def backfill_search_documents(apps, schema_editor):
+    """The document of every existing wine, BATCH_SIZE wines per UPDATE and transaction."""
+    WineModel = apps.get_model("inventory_api", "WineModel")
+    wines = WineModel.objects.using(schema_editor.connection.alias).order_by("id")
+    last = 0
+    while True:
+        rows = list(
+            wines.filter(id__gt=last)
+            .values_list("id", "name", "year", "region__country", "region__region", "appellation__name")[:BATCH_SIZE]
+        )
+        if not rows:
+            return
+        with transaction.atomic(using=schema_editor.connection.alias):
+            wines.bulk_update(
+                [WineModel(id=pk, search_document=search.document(name, year, country, region, appellation))
+                 for pk, name, year, country, region, appellation in rows],
+                ["search_document"],
+            )
+        last = rows[-1][0]
+
+
+def install_search_index(apps, schema_editor):
+    # pg_trgm GIN index on PostgreSQL, FTS5 table and triggers on SQLite.
+    search.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    search.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    # Every backfill batch commits on its own.
+    atomic = False
+
+    dependencies = [
+        ('inventory_api', '0018_deliverymodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='winemodel',
+            name='search_document',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
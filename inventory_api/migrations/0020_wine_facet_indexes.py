@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory_api', '0019_winemodel_search_document'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['type', 'name', 'id'], name='wine_type_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['type', 'style', 'year'], name='wine_type_style_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='winemodel',
+            index=models.Index(fields=['retail_price', 'stock'], name='wine_price_stock_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import connections, models, transaction
 from django.core.validators import MaxValueValidator
 from datetime import datetime
 from django.contrib.auth.models import User
-from django.db.models import CheckConstraint, Q, F
+from django.utils import timezone
+from django.db.models import Case, CheckConstraint, Q, F, Value, When
+from . import search
 
 class RegionModel(models.Model):
     country = models.CharField(max_length=100)
@@ -27,6 +29,7 @@ class WineTypeModel(models.Model):
     }
 
     type = models.CharField(max_length=50, choices= TYPE_, unique=True)
+    default_reorder_threshold = models.PositiveIntegerField(default=10, verbose_name="default reorder threshold")
 
     def __str__(self):
         return self.type
@@ -61,6 +64,119 @@ class AppellationModel(models.Model):
     def __str__(self):
         return self.name
     
+# Bottles missing to reach the reorder point; low stock when >= 0.
+SHORTFALL = F("reorder_point") - F("stock")
+
+class WineQuerySet(models.QuerySet):
+    def with_related(self):
+        # Everything WineSerializer renders through StringRelatedField.
+        return self.select_related("region", "type", "style", "appellation", "added_by")
+
+    def low_stock(self):
+        """Wines at or below their reorder point, biggest shortfall first, read off wine_shortfall_idx."""
+        return self.alias(shortfall=SHORTFALL).filter(shortfall__gte=0).order_by("-shortfall", "-id")
+
+    def sell(self, pk, quantity):
+        """
+        Take `quantity` bottles of a wine out of stock in one conditional
+        UPDATE, which is safe under concurrency because the stock check and
+        the decrement happen on the same locked row.
+        Returns (name, stock, retail_price, price) after the sale, or None
+        if the wine does not exist or has not enough stock.
+        """
+        connection = connections[self.db]
+        if connection.vendor not in ("postgresql", "sqlite"):
+            sold = self.filter(pk=pk, stock__gte=quantity).update(
+                stock=F("stock") - quantity, quantity_sold=F("quantity_sold") + quantity
+            )
+            return self.filter(pk=pk).values_list("name", "stock", "retail_price", "price").first() if sold else None
+
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(self.model._meta.db_table)} "
+                f"SET {qn('stock')} = {qn('stock')} - %s, {qn('quantity_sold')} = {qn('quantity_sold')} + %s "
+                f"WHERE {qn('id')} = %s AND {qn('stock')} >= %s "
+                f"RETURNING {qn('name')}, {qn('stock')}, {qn('retail_price')}, {qn('price')}",
+                [quantity, quantity, pk, quantity],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        name, stock, retail_price, price = row
+        field = self.model._meta.get_field("retail_price")
+        return name, stock, field.to_python(retail_price), field.to_python(price)
+
+    def adjust_stock(self, deltas, sold=False):
+        """
+        Apply {wine_id: delta} to the stock of many wines with one UPDATE.
+        With `sold`, the opposite delta is added to quantity_sold.
+        """
+        delta = Case(
+            *[When(pk=pk, then=Value(change)) for pk, change in deltas.items()],
+            default=Value(0),
+            output_field=models.IntegerField(),
+        )
+        changes = {"stock": F("stock") + delta}
+        if sold:
+            changes["quantity_sold"] = F("quantity_sold") - delta
+        return self.filter(pk__in=list(deltas)).update(**changes)
+
+    def search(self, query, limit=20):
+        """
+        Up to `limit` (id, score) pairs of the wines best matching `query`
+        on name, appellation, region and vintage, best first. Read off the
+        trigram index of search_document, so misspelled and partial words
+        match too; filters on the queryset are not applied.
+        """
+        query = search.normalize(query)
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        if connection.vendor == "postgresql":
+            with transaction.atomic(using=self.db), connection.cursor() as cursor:
+                # Only for this transaction; `<%` is what the GIN index answers.
+                cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(search.SIMILARITY_THRESHOLD)])
+                cursor.execute(
+                    f"SELECT {qn('id')}, word_similarity(%s, {qn('search_document')}) AS score "
+                    f"FROM {qn(self.model._meta.db_table)} WHERE %s <%% {qn('search_document')} "
+                    f"ORDER BY score DESC, {qn('id')} LIMIT %s",
+                    [query, query, limit],
+                )
+                return cursor.fetchall()
+        if connection.vendor == "sqlite":
+            exact, fuzzy = search.exact_expression(query), search.fuzzy_expression(query)
+            if not fuzzy:
+                return []
+            table = search.FTS_TABLE
+            with connection.cursor() as cursor:
+                # Every word as typed: no ranking in SQL, so a common word stops at the LIMIT.
+                cursor.execute(
+                    f"SELECT rowid, search_document FROM {table} WHERE {table} MATCH %s LIMIT %s",
+                    [exact, limit * search.CANDIDATES],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    # Misspelled: one shared trigram makes a candidate, bm25 (lower is better) picks the closest.
+                    cursor.execute(
+                        f"SELECT rowid, search_document FROM {table} WHERE {table} MATCH %s "
+                        f"ORDER BY bm25({table}) LIMIT %s",
+                        [fuzzy, limit * search.CANDIDATES],
+                    )
+                    rows = cursor.fetchall()
+            scored = search.rank(query, rows)
+            return [(pk, score) for pk, score in scored if score >= search.SIMILARITY_THRESHOLD][:limit]
+        words = self.filter(*[Q(search_document__contains=word) for word in query.split()])
+        return [(pk, 1.0) for pk in words.order_by("id").values_list("id", flat=True)[:limit]]
+
+    def refresh_search(self, batch_size=2000):
+        """Recompute search_document, e.g. after bulk inserts or a region or appellation rename."""
+        rows = self.order_by("id").values_list("id", "name", "year", "region__country", "region__region", "appellation__name")
+        wines = [
+            self.model(id=pk, search_document=search.document(name, year, country, region, appellation))
+            for pk, name, year, country, region, appellation in rows.iterator(chunk_size=batch_size)
+        ]
+        return self.model.objects.bulk_update(wines, ["search_document"], batch_size=batch_size)
+
 class WineModel(models.Model):
     name = models.CharField(max_length=150)
     year = models.PositiveIntegerField(validators=[MaxValueValidator(datetime.now().year)], verbose_name ="Year of Production")
@@ -73,6 +189,14 @@ class WineModel(models.Model):
     stock = models.PositiveIntegerField(default=0, verbose_name="quantity")
     retail_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, verbose_name= "retail price")
     quantity_sold = models.PositiveIntegerField(default=0, verbose_name="quantity sold")
+    # Per-wine override; without it the wine type's default applies.
+    reorder_threshold = models.PositiveIntegerField(null=True, blank=True, verbose_name="reorder threshold")
+    # The threshold in effect, kept on the row so the low-stock query needs no join.
+    reorder_point = models.PositiveIntegerField(default=10, editable=False)
+    # Name, appellation, region and vintage normalized for WineQuerySet.search, set by save().
+    search_document = models.TextField(default="", editable=False)
+
+    objects = WineQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -89,6 +213,56 @@ class WineModel(models.Model):
                 name="price_gte_0"
             )
         ]
+        indexes = [
+            models.Index(fields=["name", "id"], name="wine_name_id_idx"),
+            models.Index(fields=["quantity_sold", "id"], name="wine_quantity_sold_id_idx"),
+            models.Index(SHORTFALL, F("id"), name="wine_shortfall_idx"),
+            # Stock valuation grouped by region, type and appellation (covering on PostgreSQL).
+            models.Index(fields=["region", "type", "appellation"], include=["stock", "price", "retail_price"], name="wine_valuation_idx"),
+            # WineView filtered by type keeps seeking in page order; type, style and vintage range are the usual till filters.
+            models.Index(fields=["type", "name", "id"], name="wine_type_name_id_idx"),
+            models.Index(fields=["type", "style", "year"], name="wine_type_style_year_idx"),
+            models.Index(fields=["retail_price", "stock"], name="wine_price_stock_idx"),
+        ]
+
+    SEARCHED_FIELDS = ("name", "year", "region_id", "appellation_id")
+    REORDER_FIELDS = ("type_id", "reorder_threshold")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._searched = instance.searched_values()
+        instance._reorder = instance.reorder_values()
+        return instance
+
+    def searched_values(self):
+        # From __dict__, a deferred field must not cost a query here.
+        return tuple(self.__dict__.get(name) for name in self.SEARCHED_FIELDS)
+
+    def reorder_values(self):
+        return tuple(self.__dict__.get(name) for name in self.REORDER_FIELDS)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        # A type's new default reaches its wines through signals.update_reorder_points,
+        # so only a new type or threshold needs the reorder point here, no type query.
+        if self._state.adding or self.reorder_values() != getattr(self, "_reorder", None):
+            if self.reorder_threshold is not None:
+                self.reorder_point = self.reorder_threshold
+            elif self.type_id is not None:
+                self.reorder_point = self.type.default_reorder_threshold
+            if update_fields is not None:
+                update_fields = {*update_fields, "reorder_point"}
+        # Restocks and other saves leave the document alone, no region and appellation queries.
+        if self._state.adding or self.searched_values() != getattr(self, "_searched", None):
+            self.search_document = search.document(self.name, self.year, self.region.country, self.region.region, self.appellation.name)
+            if update_fields is not None:
+                update_fields = {*update_fields, "search_document"}
+        if update_fields is not None:
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+        self._searched = self.searched_values()
+        self._reorder = self.reorder_values()
 
     def revenue(self):
         if self.retail_price is not None:
@@ -103,8 +277,12 @@ class SaleModel(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")
     wine = models.ForeignKey(WineModel, on_delete=models.PROTECT, verbose_name="Wine")
     quantity_sold = models.PositiveIntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, so imported and seeded sales can keep their own time.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     refund_qty = models.PositiveIntegerField(default=0)
+    # The wine's prices when it was sold, so revenue needs no join and a later price change doesn't rewrite it.
+    unit_price = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False, verbose_name="unit retail price")
+    unit_cost = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, editable=False, verbose_name="unit cost")
 
     class Meta:
         constraints = [
@@ -116,6 +294,47 @@ class SaleModel(models.Model):
                 check=Q(refund_qty__lte=F("quantity_sold")),
                 name="refund_qty_lte_quantity_sold"),
         ]
+        indexes = [
+            # Period revenue and margin, by wine or seller (covering on PostgreSQL).
+            models.Index(fields=["timestamp", "wine"], include=["user", "quantity_sold", "unit_price", "unit_cost"], name="sale_timestamp_wine_idx"),
+            # Period sales of one wine, for the least-selling rankings and per wine revenue (covering on PostgreSQL).
+            models.Index(fields=["wine", "timestamp"], include=["quantity_sold", "unit_price", "unit_cost"], name="sale_wine_timestamp_idx"),
+        ]
+
+    # What the sale adds to analytics.DailySalesRollup, see analytics.signals.
+    ROLLUP_FIELDS = ("timestamp", "wine_id", "user_id", "quantity_sold", "refund_qty", "unit_price")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rolled_up = instance.rollup_values()
+        return instance
+
+    def rollup_values(self):
+        return tuple(self.__dict__.get(name) for name in self.ROLLUP_FIELDS)
+
+    def save(self, *args, **kwargs):
+        # Sales created without prices take the wine's current ones.
+        if self._state.adding and self.unit_price is None and self.unit_cost is None:
+            prices = WineModel.objects.filter(pk=self.wine_id).values_list("retail_price", "price").first()
+            if prices is not None:
+                self.unit_price, self.unit_cost = prices
+        if self.pk is not None and not hasattr(self, "_rolled_up"):
+            # Not loaded from the database: the rollup still needs what the row held, if any.
+            self._rolled_up = SaleModel.objects.filter(pk=self.pk).values_list(*self.ROLLUP_FIELDS).first()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user}"
+
+class DeliveryModel(models.Model):
+    # The supplier's delivery note number; applying it twice is a no-op.
+    reference = models.CharField(max_length=100, unique=True)
+    user = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name="received by")
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # {wine_id: bottles added}, as applied.
+    lines = models.JSONField()
+    note = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.reference
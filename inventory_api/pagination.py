@@ -0,0 +1,125 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the full ordering instead of using an
+    offset, so every page is an index range scan starting right after the
+    last row of the previous one.
+
+    `ordering` must end with a unique field (the primary key), every field
+    must be non-nullable and all of them must sort in the same direction.
+    Back every ordering with a composite index on the same fields.
+    """
+    ordering = ("id",)
+    page_size = None
+    page_size_query_param = "page_size"
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, "API_MAX_PAGE_SIZE", 500)
+
+    def get_page_size(self, request):
+        page_size = super().get_page_size(request)
+        return getattr(settings, "API_PAGE_SIZE", 50) if page_size is None else page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        descending = self.ordering[0].startswith("-")
+
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor["reverse"])
+        if reverse:
+            queryset = queryset.order_by(*[self.flip(field) for field in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if self.cursor is not None:
+            try:
+                queryset = queryset.filter(self.seek(self.cursor["position"], after=descending == reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        # Moving backwards, rows after the page exist because we came from there.
+        self.has_next = has_more if not reverse else True
+        self.has_previous = self.cursor is not None if not reverse else has_more
+        return self.page
+
+    @staticmethod
+    def flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def seek(self, position, after):
+        """Rows strictly after (or before) `position` in ordering order."""
+        lookup = "gt" if after else "lt"
+        condition = Q()
+        for depth in range(len(self.fields) - 1, -1, -1):
+            step = Q(**{f"{self.fields[depth]}__{lookup}": position[depth]})
+            for field, value in zip(self.fields[:depth], position[:depth]):
+                step &= Q(**{field: value})
+            condition |= step
+        # The redundant bound on the leading field gives the planner an index range.
+        return Q(**{f"{self.fields[0]}__{lookup}e": position[0]}) & condition
+
+    def position(self, instance):
+        return [getattr(instance, field) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor({"position": self.position(self.page[-1]), "reverse": False})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor({"position": self.position(self.page[0]), "reverse": True})
+
+    def encode_cursor(self, cursor):
+        payload = json.dumps([cursor["position"], int(cursor["reverse"])], default=str, separators=(",", ":"))
+        encoded = urlsafe_b64encode(payload.encode()).decode("ascii").rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            payload = urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            position, reverse = json.loads(payload)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        return {"position": position, "reverse": bool(reverse)}
+
+
+class WinePagination(KeysetPagination):
+    ordering = ("name", "id")
+
+
+class LeastSellingPagination(KeysetPagination):
+    ordering = ("quantity_sold", "id")
+    page_size = 5
+    page_size_query_param = "limit"
@@ -0,0 +1,123 @@
+import re
+import unicodedata
+
+# Wines are searched on WineModel.search_document, one normalized string
+# per wine, indexed with trigrams: a GIN gin_trgm_ops index on PostgreSQL,
+# an FTS5 trigram table kept in sync by triggers on SQLite. Trigrams match
+# parts of words and survive most typos.
+WINE_TABLE = "inventory_api_winemodel"
+FTS_TABLE = "inventory_api_winesearch"
+TRGM_INDEX = "wine_search_trgm_idx"
+MIN_QUERY_LENGTH = 3
+RESULTS = 20
+MAX_RESULTS = 100
+ADMIN_RESULTS = 1000
+# pg_trgm word similarity a wine needs to match; the default 0.6 misses most typos.
+SIMILARITY_THRESHOLD = 0.3
+# Candidates read from the SQLite index per result wanted, then ranked in Python.
+CANDIDATES = 5
+
+FTS_TRIGGERS = {
+    "wine_search_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS wine_search_insert AFTER INSERT ON {WINE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+        END""",
+    "wine_search_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS wine_search_delete AFTER DELETE ON {WINE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) VALUES ('delete', old.id, old.search_document);
+        END""",
+    "wine_search_update": f"""
+        CREATE TRIGGER IF NOT EXISTS wine_search_update AFTER UPDATE OF search_document ON {WINE_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_document) VALUES ('delete', old.id, old.search_document);
+            INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (new.id, new.search_document);
+        END""",
+}
+
+
+def normalize(text):
+    """Lower case, no accents, single spaces: "Côtes  du Rhône" -> "cotes du rhone"."""
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def document(name, year, country, region, appellation):
+    return normalize(f"{name} {appellation} {region} {country} {year}")
+
+
+def trigrams(text):
+    # Shorter words have no trigram to look up.
+    return list(dict.fromkeys(word[i:i + 3] for word in text.split() for i in range(len(word) - 2)))
+
+
+def quote(text):
+    return '"%s"' % text.replace('"', '""')
+
+
+def exact_expression(query):
+    """FTS5 MATCH expression for documents holding every word of 3 letters or more."""
+    return " AND ".join(quote(word) for word in query.split() if len(word) >= 3)
+
+
+def fuzzy_expression(query):
+    """FTS5 MATCH expression for any trigram of any word, so misspelled words still match some."""
+    return " OR ".join(quote(gram) for gram in trigrams(query))
+
+
+def similarity(query, text):
+    """Share of the query's trigrams found in `text`, SQLite's stand-in for pg_trgm word_similarity."""
+    grams = trigrams(query)
+    if not grams:
+        return 0.0
+    return sum(gram in text for gram in grams) / len(grams)
+
+
+def rank(query, rows):
+    """
+    (id, score) of the (id, document) rows best first: by similarity, then
+    documents holding every word as typed, then by how early the first word
+    shows up, so a match on the name, which leads the document, beats one
+    on the region.
+    """
+    words = query.split()
+    scored = []
+    for pk, text in rows:
+        position = text.find(words[0])
+        exact = all(word in text for word in words)
+        scored.append((-similarity(query, text), not exact, position if position >= 0 else len(text), pk))
+    scored.sort()
+    return [(pk, -score) for score, _, _, pk in scored]
+
+
+def install(connection):
+    """
+    Create the search index of the connection's database if it is missing.
+    Idempotent: on SQLite it also puts back the triggers a table rebuild by
+    a later migration drops, and then reindexes every wine.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON {WINE_TABLE} USING gin (search_document gin_trgm_ops)")
+        elif connection.vendor == "sqlite":
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [WINE_TABLE])
+            missing = set(FTS_TRIGGERS) - {name for name, in cursor.fetchall()}
+            if not missing:
+                return
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"search_document, content='{WINE_TABLE}', content_rowid='id', tokenize='trigram')"
+            )
+            for sql in FTS_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def uninstall(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"DROP INDEX IF EXISTS {TRGM_INDEX}")
+        elif connection.vendor == "sqlite":
+            for name in FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
@@ -5,7 +5,7 @@ class WineSerializer(serializers.ModelSerializer):
     region = serializers.StringRelatedField()
     type = serializers.StringRelatedField()
     style = serializers.StringRelatedField()
-    appelation = serializers.StringRelatedField()
+    appelation = serializers.StringRelatedField(source="appellation")
     added_by = serializers.StringRelatedField()
     revenue = serializers.SerializerMethodField()
     
@@ -14,7 +14,7 @@ class WineSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = WineModel
-        fields = "__all__"
+        exclude = ["search_document"]
         read_only_fields = ["revenue"]
     
 class RegionSerializer(serializers.ModelSerializer):
@@ -41,6 +41,13 @@ class RegisterSaleSerializer(serializers.Serializer):
     wine_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
 
+class BasketLineSerializer(serializers.Serializer):
+    wine_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class BasketSerializer(serializers.Serializer):
+    lines = BasketLineSerializer(many=True, allow_empty=False)
+
 class SaleSerializer(serializers.ModelSerializer):
     return_to_stock = serializers.BooleanField(default=False, write_only=True)
     class Meta:
@@ -49,6 +56,19 @@ class SaleSerializer(serializers.ModelSerializer):
         fields = "__all__"
         depth = 1
 
+class RefundSerializer(serializers.Serializer):
+    refund_qty = serializers.IntegerField(min_value=1)
+    return_to_stock = serializers.BooleanField(default=False)
+
 class RestockSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1, required=True)
     note = serializers.CharField(required=False, allow_blank=True)
+
+class DeliveryLineSerializer(serializers.Serializer):
+    wine_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1)
+
+class DeliverySerializer(serializers.Serializer):
+    reference = serializers.CharField(max_length=100)
+    lines = DeliveryLineSerializer(many=True, allow_empty=False)
+    note = serializers.CharField(required=False, allow_blank=True)
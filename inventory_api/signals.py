@@ -1,9 +1,52 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import connections
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 from rest_framework.authtoken.models import Token
+from . import search
+from .cache import bump_on_commit
+from .models import RegionModel, WineTypeModel, WineStyleModel, AppellationModel, WineModel
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
+
+@receiver([post_save, post_delete], sender=RegionModel)
+@receiver([post_save, post_delete], sender=WineTypeModel)
+@receiver([post_save, post_delete], sender=WineStyleModel)
+@receiver([post_save, post_delete], sender=AppellationModel)
+def invalidate_dashboard(sender, **kwargs):
+    # The valuation report labels its groups with these.
+    bump_on_commit("dashboard", "valuation", "facets")
+
+@receiver([post_save, post_delete], sender=WineModel)
+def invalidate_valuation(sender, **kwargs):
+    # Restocks and refunds save the wine; sales update the stock directly and bump it themselves.
+    bump_on_commit("valuation", "facets")
+
+@receiver(post_save, sender=WineTypeModel)
+def update_reorder_points(sender, instance=None, created=False, **kwargs):
+    if not created:
+        WineModel.objects.filter(type=instance, reorder_threshold__isnull=True).update(reorder_point=instance.default_reorder_threshold)
+
+@receiver(post_save, sender=RegionModel)
+@receiver(post_save, sender=AppellationModel)
+def refresh_search_documents(sender, instance=None, created=False, **kwargs):
+    # The documents hold the region and appellation names.
+    if not created:
+        field = "region" if sender is RegionModel else "appellation"
+        WineModel.objects.filter(**{field: instance}).refresh_search()
+
+@receiver(post_migrate)
+def reinstall_search_index(sender, using="default", **kwargs):
+    # A later migration rebuilding the wine table on SQLite drops the FTS triggers with it.
+    if sender.name != "inventory_api":
+        return
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if WineModel._meta.db_table not in connection.introspection.table_names(cursor):
+            return
+        columns = {column.name for column in connection.introspection.get_table_description(cursor, WineModel._meta.db_table)}
+    if "search_document" in columns:
+        search.install(connection)
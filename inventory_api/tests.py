@@ -1,4 +1,14 @@
+import json
+import time
+from decimal import Decimal
+from unittest.mock import patch
+from django.conf import settings
 from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
+from django.core.cache import cache
 from rest_framework.authtoken.models import Token
 from django.contrib.auth.models import User
 from inventory_api.models import (
@@ -6,6 +16,9 @@ from inventory_api.models import (
 )
 from rest_framework.test import APIClient
 from rest_framework import status
+from analytics.models import DailySalesRollup
+from accounts.models import LogModel
+from accounts.authentication import token_cache
 
 class RegisterSale_Restock_Test(TestCase):
 
@@ -88,6 +101,23 @@ class RegisterSale_Restock_Test(TestCase):
         self.wine.refresh_from_db()
         self.assertEqual(self.wine.revenue(), 0)
 
+    def test_sale_exact_stock_and_missing_wine(self):
+
+        # Selling the whole stock is allowed, one more bottle is not
+        response = self.client.post(self.url, {"wine_id": self.wine.id, "quantity": 20}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(self.url, {"wine_id": self.wine.id, "quantity": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("available: 0", response.data["message"])
+        self.wine.refresh_from_db()
+        self.assertEqual((self.wine.stock, self.wine.quantity_sold), (0, 20))
+
+        # Unknown wine and invalid payload
+        response = self.client.post(self.url, {"wine_id": 999999, "quantity": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(self.url, {"wine_id": self.wine.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_refund(self):
         # refund
         data = {
@@ -114,6 +144,12 @@ class RegisterSale_Restock_Test(TestCase):
         self.wine.refresh_from_db()
         self.assertEqual(self.wine.stock, 18)
 
+        # Daily rollup updated
+        rollup = DailySalesRollup.objects.get(wine=self.wine, user=self.user)
+        self.assertEqual(rollup.bottles, 1)
+        self.assertEqual(rollup.refunded_bottles, 1)
+        self.assertEqual(rollup.revenue, 12.5)
+
     def test_refund_restock(self):
         # Refund and restock
         data = {
@@ -140,3 +176,545 @@ class RegisterSale_Restock_Test(TestCase):
         self.wine.refresh_from_db()
         self.assertEqual(self.wine.stock, 19)
         
+    def test_basket_sale(self):
+
+        other = WineModel.objects.create(
+            name="Barolo", year=2019, region=self.region, type=self.wtype, style=self.wstyle,
+            appellation=self.appellation, price=20, retail_price=40, stock=5, added_by=self.user,
+        )
+        url = "/wine-list-api/sale/basket/"
+
+        # Same wine twice plus another one
+        lines = [
+            {"wine_id": self.wine.id, "quantity": 2},
+            {"wine_id": other.id, "quantity": 1},
+            {"wine_id": self.wine.id, "quantity": 3},
+        ]
+        LogModel.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {"lines": lines}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(SaleModel.objects.count(), 2)
+        # Both sales logged with one INSERT
+        self.assertEqual(LogModel.objects.filter(action="sale_created").count(), 2)
+        self.assertEqual(len([q for q in queries if q["sql"].startswith('INSERT INTO "accounts_logmodel"')]), 1)
+        self.wine.refresh_from_db()
+        self.assertEqual((self.wine.stock, self.wine.quantity_sold), (15, 5))
+        other.refresh_from_db()
+        self.assertEqual(other.stock, 4)
+        self.assertEqual(DailySalesRollup.objects.get(wine=other).revenue, 40)
+
+        # One failing line and the whole basket is rejected
+        lines = [
+            {"wine_id": self.wine.id, "quantity": 1},
+            {"wine_id": other.id, "quantity": 10},
+            {"wine_id": 999999, "quantity": 1},
+        ]
+        response = self.client.post(url, {"lines": lines}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error["line"] for error in response.data["errors"]], [1, 2])
+        self.assertEqual(response.data["errors"][0]["available"], 4)
+        self.wine.refresh_from_db()
+        self.assertEqual(self.wine.stock, 15)
+        self.assertEqual(SaleModel.objects.count(), 2)
+
+        # Rollup rows of the day are incremented
+        response = self.client.post(url, {"lines": [{"wine_id": other.id, "quantity": 1}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(DailySalesRollup.objects.get(wine=other).revenue, 80)
+
+        # Empty basket
+        response = self.client.post(url, {"lines": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class KeysetPaginationTest(TestCase):
+
+    def setUp(self):
+
+        self.client = APIClient()
+        self.url = "/wine-list-api/wines"
+
+        # Manager token
+        self.user = User.objects.create_user(username="manager", password="pass12345")
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+        region = RegionModel.objects.create(country="Italy", region="Piedmont")
+        wtype = WineTypeModel.objects.create(type="red")
+        wstyle = WineStyleModel.objects.create(style="dry", body="full")
+        appellation = AppellationModel.objects.create(name="DOCG")
+
+        # Duplicate names so the id tie-breaker matters
+        for name in ["Barolo", "Barbera", "Barolo", "Nebbiolo", "Dolcetto", "Barolo", "Arneis"]:
+            WineModel.objects.create(
+                name=name, year=2020, region=region, type=wtype, style=wstyle,
+                appellation=appellation, price=5, retail_price=10, added_by=self.user,
+            )
+        self.expected = list(WineModel.objects.order_by("name", "id").values_list("id", flat=True))
+
+    def test_walk_forward_and_back(self):
+
+        pages = []
+        url = f"{self.url}?page_size=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([wine["id"] for wine in response.data["results"]])
+            url = response.data["next"]
+
+        # Every wine once, in (name, id) order
+        self.assertEqual([wine_id for page in pages for wine_id in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        # Previous from the last page gives back the second one
+        response = self.client.get(response.data["previous"])
+        self.assertEqual([wine["id"] for wine in response.data["results"]], pages[1])
+
+    def test_page_size_cap_and_bad_cursor(self):
+
+        with self.settings(API_MAX_PAGE_SIZE=2):
+            response = self.client.get(f"{self.url}?page_size=1000")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(f"{self.url}?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_default_page_size_and_unpaginated_lists(self):
+
+        with self.settings(API_PAGE_SIZE=4):
+            response = self.client.get(self.url)
+        self.assertEqual([wine["id"] for wine in response.data["results"]], self.expected[:4])
+
+        # Lists without a pagination class keep returning a bare array
+        response = self.client.get("/wine-list-api/region/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([region["region"] for region in response.data], ["Piedmont"])
+
+class WineQueryCountTest(TestCase):
+    """
+    Every endpoint rendering WineSerializer must run the same number of
+    queries whatever the number of wines, so an N+1 shows up as a failure.
+    """
+
+    endpoints = [
+        "/wine-list-api/wines",
+        "/wine-list-api/wines?page_size=100",
+        "/analytics/top-selling/",
+        "/analytics/least-selling/?limit=100",
+        "/analytics/unsold-wines/",
+    ]
+
+    def setUp(self):
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="admin", password="pass12345")
+        self.user.userprofile.role = "admin"
+        self.user.userprofile.save()
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.wtype = WineTypeModel.objects.create(type="red")
+        self.count = 0
+
+    def seed(self, n):
+        # A distinct related row per wine so nothing is served from a cache
+        for _ in range(n):
+            self.count += 1
+            staff = User.objects.create_user(username=f"staff{self.count}", password="pass12345")
+            WineModel.objects.create(
+                name=f"Wine {self.count}", year=2020,
+                region=RegionModel.objects.create(country="Italy", region=f"Region {self.count}"),
+                type=self.wtype,
+                style=WineStyleModel.objects.create(style="dry", body=f"body {self.count}"),
+                appellation=AppellationModel.objects.create(name=f"Appellation {self.count}"),
+                price=5, retail_price=10, added_by=staff,
+            )
+
+    def query_count(self, url):
+        # Same authentication cost for every call
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return len(queries)
+
+    def test_list_query_count_is_constant(self):
+
+        self.seed(2)
+        small = {url: self.query_count(url) for url in self.endpoints}
+        self.seed(20)
+        large = {url: self.query_count(url) for url in self.endpoints}
+        self.assertEqual(small, large)
+
+    def test_detail_query_count(self):
+
+        self.seed(1)
+        wine = WineModel.objects.get()
+        self.assertEqual(
+            self.query_count(f"/wine-list-api/detail/{wine.pk}"),
+            self.query_count(f"/wine-list-api/{wine.pk}/"),
+        )
+        response = self.client.get(f"/wine-list-api/detail/{wine.pk}")
+        self.assertEqual(response.data["appelation"], "Appellation 1")
+        self.assertEqual(response.data["region"], "Italy-Region 1")
+
+class DashboardCacheTest(TestCase):
+
+    def setUp(self):
+
+        cache.clear()
+        self.client = APIClient()
+        self.url = "/wine-list-api/dashboard/"
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        RegionModel.objects.create(country="Italy", region="Tuscany")
+
+    def test_etag_and_invalidation(self):
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertEqual(len(response.data["regions"]), 1)
+
+        # Same version: 304 and no reference data query
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse([q for q in queries if "inventory_api_regionmodel" in q["sql"]])
+
+        # A new region bumps the version
+        with self.captureOnCommitCallbacks(execute=True):
+            RegionModel.objects.create(country="France", region="Bordeaux")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(len(response.data["regions"]), 2)
+
+        # A change whose bump this process never sees (another worker's) shows up once the payload expires
+        RegionModel.objects.bulk_create([RegionModel(country="France", region="Loire")])
+        self.assertEqual(len(self.client.get(self.url).data["regions"]), 2)
+        with patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + settings.CACHE_PAYLOAD_TTL + 1):
+            self.assertEqual(len(self.client.get(self.url).data["regions"]), 3)
+
+class WineImportTest(TestCase):
+
+    def setUp(self):
+
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.url = "/wine-list-api/wines/import/"
+        self.user = User.objects.create_user(username="manager", password="pass12345")
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.region = RegionModel.objects.create(country="Italy", region="Tuscany")
+        WineTypeModel.objects.create(type="red", default_reorder_threshold=7)
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode())
+        url = self.url + ("?" + "&".join(f"{key}={value}" for key, value in params.items()) if params else "")
+        return self.client.post(url, {"file": upload}, format="multipart")
+
+    def test_csv_import_reports_bad_rows(self):
+        content = (
+            "name,year,country,region,type,style,body,appellation,price,retail_price,stock,reorder_threshold\n"
+            "Chianti,2020,Italy,Tuscany,Red,dry,full,DOCG,5,12.50,20,\n"
+            "Sancerre,2022,France,Loire,white,Dry,Light,AOC,8,15,,3\n"
+            "Broken,1900x,Italy,Tuscany,purple,dry,full,DOCG,9,4,1,\n"
+            ",2021,Italy,Tuscany,red,dry,full,DOCG,,,,\n"
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.upload("wines.csv", content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["rows"], response.data["created"], response.data["rejected"]), (4, 2, 2))
+        self.assertEqual(
+            {(error["line"], error["field"]) for error in response.data["errors"]},
+            {(4, "year"), (4, "type"), (4, "retail_price"), (5, "name")},
+        )
+        self.assertEqual(response.data["lookups_created"], {"regions": 1, "types": 1, "styles": 2, "appellations": 2})
+
+        chianti = WineModel.objects.get(name="Chianti")
+        self.assertEqual((chianti.region_id, chianti.stock, chianti.reorder_point, chianti.added_by_id), (self.region.id, 20, 7, self.user.id))
+        sancerre = WineModel.objects.select_related("region", "type", "style").get(name="Sancerre")
+        self.assertEqual((str(sancerre.region), sancerre.type.type, str(sancerre.style)), ("France-Loire", "white", "dry-light"))
+        self.assertEqual((sancerre.stock, sancerre.reorder_point), (0, 3))
+        self.assertTrue(LogModel.objects.filter(user=self.user, action="wine_import").exists())
+
+    def test_jsonl_import_in_chunks(self):
+        lines = [json.dumps({"name": f"Wine {i}", "year": 2019, "country": "Italy", "region": "Tuscany", "type": "red",
+                             "style": "dry", "body": "full", "appelation": "DOC", "price": 4.5, "retail_price": 9})
+                 for i in range(5)]
+        lines.insert(2, "not json")
+        with patch("inventory_api.importer.CHUNK_SIZE", 2), CaptureQueriesContext(connection) as queries:
+            response = self.upload("wines.txt", "\n".join(lines), file_format="jsonl")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["created"], response.data["rejected"]), (5, 1))
+        self.assertEqual(response.data["errors"][0]["line"], 3)
+        # One INSERT per chunk of wines, lookups resolved from memory
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "inventory_api_winemodel"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(WineModel.objects.filter(region=self.region, price=Decimal("4.50")).count(), 5)
+
+    def test_bad_uploads(self):
+        response = self.upload("wines.xlsx", "whatever")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.upload("wines.csv", "name,year\nChianti,2020\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("country", response.data["message"])
+        self.assertFalse(WineModel.objects.exists())
+
+class DeliveryRestockTest(TestCase):
+
+    def setUp(self):
+
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.url = "/wine-list-api/restock/"
+        self.user = User.objects.create_user(username="manager", password="pass12345")
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        region = RegionModel.objects.create(country="Italy", region="Tuscany")
+        wtype = WineTypeModel.objects.create(type="red")
+        wstyle = WineStyleModel.objects.create(style="dry", body="full")
+        appellation = AppellationModel.objects.create(name="DOC")
+        self.wines = [
+            WineModel.objects.create(
+                name=f"Wine {i}", year=2020, region=region, type=wtype, style=wstyle, appellation=appellation,
+                price=5, retail_price=10, stock=i, added_by=self.user,
+            )
+            for i in range(25)
+        ]
+
+    def deliver(self, reference, lines):
+        return self.client.post(self.url, {"reference": reference, "lines": lines}, format="json")
+
+    def test_query_count_does_not_grow_with_lines(self):
+        self.deliver("warm-up", [{"wine_id": self.wines[0].id, "quantity": 1}])
+        counts = []
+        for reference, wines in (("small", self.wines[:2]), ("large", self.wines[2:])):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.deliver(reference, [{"wine_id": wine.id, "quantity": 6} for wine in wines])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(LogModel.objects.filter(action="restock", details__contains="(delivery large)").count(), 23)
+
+    def test_delivery_applied_once(self):
+        first, second = self.wines[3], self.wines[7]
+        lines = [{"wine_id": first.id, "quantity": 4}, {"wine_id": second.id, "quantity": 10}, {"wine_id": first.id, "quantity": 1}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.deliver("DN-1", lines)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data["duplicate"])
+        self.assertEqual(
+            [(wine["wine_id"], wine["added"], wine["stock"]) for wine in response.data["wines"]],
+            [(first.id, 5, 8), (second.id, 10, 17)],
+        )
+
+        # A retried upload changes nothing
+        response = self.deliver("DN-1", lines)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data["duplicate"])
+        self.assertEqual([wine["stock"] for wine in response.data["wines"]], [8, 17])
+        self.assertEqual(WineModel.objects.get(id=first.id).stock, 8)
+
+        response = self.deliver("DN-1", [{"wine_id": first.id, "quantity": 2}])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(WineModel.objects.get(id=first.id).stock, 8)
+
+    def test_missing_wine_applies_nothing(self):
+        lines = [{"wine_id": self.wines[1].id, "quantity": 3}, {"wine_id": 999999, "quantity": 3}]
+        response = self.deliver("DN-2", lines)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data["missing"], [999999])
+        self.assertEqual(WineModel.objects.get(id=self.wines[1].id).stock, 1)
+        self.assertFalse(LogModel.objects.filter(action="restock").exists())
+
+        # The reference wasn't used up
+        response = self.deliver("DN-2", lines[:1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["wines"][0]["stock"], 4)
+
+class WineSearchTest(TestCase):
+
+    def setUp(self):
+
+        token_cache.clear()
+        self.client = APIClient()
+        self.url = "/wine-list-api/wines/search/"
+        self.user = User.objects.create_user(username="staff", password="pass12345")
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        wtype = WineTypeModel.objects.create(type="red")
+        wstyle = WineStyleModel.objects.create(style="dry", body="full")
+        self.loire = RegionModel.objects.create(country="France", region="Loire")
+        wines = [
+            ("Chianti Classico", 2019, RegionModel.objects.create(country="Italy", region="Tuscany"), "DOCG"),
+            ("Barolo Cannubi", 2016, RegionModel.objects.create(country="Italy", region="Piedmont"), "DOCG"),
+            ("Sancerre Les Monts Damnés", 2021, self.loire, "AOC"),
+            ("Côtes du Rhône", 2020, RegionModel.objects.create(country="France", region="Rhône"), "AOC"),
+        ]
+        self.wines = {}
+        for name, year, region, appellation in wines:
+            self.wines[name] = WineModel.objects.create(
+                name=name, year=year, region=region, type=wtype, style=wstyle,
+                appellation=AppellationModel.objects.get_or_create(name=appellation)[0],
+                price=5, retail_price=10, stock=3, added_by=self.user,
+            )
+
+    def first(self, query):
+        response = self.client.get(self.url, {"q": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"][0]["name"] if response.data["results"] else None
+
+    def test_ranked_partial_and_misspelled(self):
+        self.assertEqual(self.first("chianti"), "Chianti Classico")
+        self.assertEqual(self.first("chainti clasico"), "Chianti Classico")
+        self.assertEqual(self.first("baro"), "Barolo Cannubi")
+        self.assertEqual(self.first("cotes du rhone"), "Côtes du Rhône")
+        self.assertEqual(self.first("damnes 2021"), "Sancerre Les Monts Damnés")
+        self.assertEqual(self.first("piedmont 2016"), "Barolo Cannubi")
+        self.assertIsNone(self.first("xyzzy"))
+
+        response = self.client.get(self.url, {"q": "docg"})
+        self.assertEqual({wine["name"] for wine in response.data["results"]}, {"Chianti Classico", "Barolo Cannubi"})
+        self.assertNotIn("search_document", response.data["results"][0])
+        self.assertEqual(self.client.get(self.url, {"q": "ch"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {"q": "chianti", "limit": 0}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_changes(self):
+        wine = self.wines["Barolo Cannubi"]
+        wine.name = "Barbaresco Asili"
+        wine.save()
+        self.assertEqual(self.first("barbaresco"), "Barbaresco Asili")
+        self.assertIsNone(self.first("cannubi"))
+
+        self.loire.region = "Centre-Loire"
+        self.loire.save()
+        self.assertEqual(self.first("centre"), "Sancerre Les Monts Damnés")
+
+        # Stock changes don't rebuild the document
+        sancerre = WineModel.objects.get(name__startswith="Sancerre")
+        with CaptureQueriesContext(connection) as queries:
+            sancerre.stock = F("stock") + 1
+            sancerre.save()
+        self.assertFalse([q for q in queries if "inventory_api_regionmodel" in q["sql"]])
+
+        self.wines["Côtes du Rhône"].delete()
+        self.assertIsNone(self.first("rhone"))
+
+class WineFacetTest(TestCase):
+
+    def setUp(self):
+
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.url = "/wine-list-api/wines"
+        self.user = User.objects.create_user(username="manager", password="pass12345")
+        self.user.userprofile.role = "manager"
+        self.user.userprofile.save()
+        self.token = Token.objects.get(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+        self.red = WineTypeModel.objects.create(type="red")
+        self.white = WineTypeModel.objects.create(type="white")
+        self.dry = WineStyleModel.objects.create(style="dry", body="full")
+        self.tuscany = RegionModel.objects.create(country="Italy", region="Tuscany")
+        self.loire = RegionModel.objects.create(country="France", region="Loire")
+        appellation = AppellationModel.objects.create(name="DOC")
+        # (name, type, region, year, price, retail price, stock)
+        wines = [
+            ("Chianti", self.red, self.tuscany, 2018, 4, 9, 10),
+            ("Brunello", self.red, self.tuscany, 2015, 30, 60, 2),
+            ("Morellino", self.red, self.tuscany, 2020, 8, 15, 0),
+            ("Vernaccia", self.white, self.tuscany, 2021, 6, 12, 5),
+            ("Sancerre", self.white, self.loire, 2021, 12, 25, 8),
+            ("Chinon", self.red, self.loire, 2019, 7, 14, 3),
+        ]
+        self.wines = {}
+        for name, wtype, region, year, price, retail_price, stock in wines:
+            self.wines[name] = WineModel.objects.create(
+                name=name, year=year, region=region, type=wtype, style=self.dry, appellation=appellation,
+                price=price, retail_price=retail_price, stock=stock, added_by=self.user,
+            )
+
+    def names(self, response):
+        return [wine["name"] for wine in response.data["results"]]
+
+    def test_filters(self):
+        response = self.client.get(self.url, {"type": self.red.id})
+        self.assertEqual(self.names(response), ["Brunello", "Chianti", "Chinon", "Morellino"])
+        response = self.client.get(self.url, {"type": f"{self.red.id},{self.white.id}", "region": self.loire.id})
+        self.assertEqual(self.names(response), ["Chinon", "Sancerre"])
+        response = self.client.get(self.url, {"year_min": 2018, "year_max": 2020, "in_stock": "true"})
+        self.assertEqual(self.names(response), ["Chianti", "Chinon"])
+        response = self.client.get(self.url, {"price_band": "10-20,50-100"})
+        self.assertEqual(self.names(response), ["Brunello", "Chinon", "Morellino", "Vernaccia"])
+
+        # Filtered pages still walk in (name, id) order
+        response = self.client.get(self.url, {"type": self.red.id, "page_size": 2})
+        response = self.client.get(response.data["next"])
+        self.assertEqual(self.names(response), ["Chinon", "Morellino"])
+
+        for params in ({"type": "red"}, {"year_min": "old"}, {"price_band": "cheap"}, {"in_stock": "maybe"}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_facet_counts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"type": self.red.id, "in_stock": "true", "facets": "true"})
+        self.assertEqual(self.names(response), ["Brunello", "Chianti", "Chinon"])
+        self.assertEqual(len([q for q in queries if "UNION ALL" in q["sql"]]), 1)
+        facets = response.data["facets"]
+
+        # Each facet is counted without its own filter
+        self.assertEqual([(value["label"], value["count"]) for value in facets["type"]], [("red", 3), ("white", 2)])
+        self.assertEqual([(value["in_stock"], value["count"]) for value in facets["in_stock"]], [(True, 3), (False, 1)])
+        self.assertEqual([(value["label"], value["count"]) for value in facets["region"]], [("Italy-Tuscany", 2), ("France-Loire", 1)])
+        self.assertEqual([(value["year"], value["count"]) for value in facets["vintage"]], [(2019, 1), (2018, 1), (2015, 1)])
+        self.assertEqual([(value["band"], value["count"]) for value in facets["price_band"]], [("under-10", 1), ("10-20", 1), ("50-100", 1)])
+
+        # Cached until the stock changes
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"type": self.red.id, "in_stock": "true", "facets": "true"})
+        self.assertFalse([q for q in queries if "UNION ALL" in q["sql"]])
+
+        # Sales that leave some bottles don't change the counts and keep them
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/wine-list-api/sale/", {"wine_id": self.wines["Chianti"].id, "quantity": 1}, format="json")
+            self.client.post("/wine-list-api/sale/basket/", {"lines": [{"wine_id": self.wines["Chinon"].id, "quantity": 1}]}, format="json")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"type": self.red.id, "in_stock": "true", "facets": "true"})
+        self.assertFalse([q for q in queries if "UNION ALL" in q["sql"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/wine-list-api/sale/", {"wine_id": self.wines["Brunello"].id, "quantity": 2}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.get(self.url, {"type": self.red.id, "in_stock": "true", "facets": "true"})
+        self.assertEqual(self.names(response), ["Chianti", "Chinon"])
+        self.assertEqual([(value["in_stock"], value["count"]) for value in response.data["facets"]["in_stock"]], [(True, 2), (False, 2)])
+
+        # So does a delivery bringing a wine back
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/wine-list-api/restock/", {"reference": "D-1", "lines": [{"wine_id": self.wines["Morellino"].id, "quantity": 6}]}, format="json")
+        response = self.client.get(self.url, {"type": self.red.id, "in_stock": "true", "facets": "true"})
+        self.assertEqual(self.names(response), ["Chianti", "Chinon", "Morellino"])
+
+        # Sold out where this worker doesn't see the bump: the counts catch up once they expire
+        WineModel.objects.filter(pk=self.wines["Chinon"].pk).update(stock=0)
+        params = {"type": self.red.id, "in_stock": "true", "facets": "true"}
+        response = self.client.get(self.url, params)
+        self.assertEqual([(value["in_stock"], value["count"]) for value in response.data["facets"]["in_stock"]], [(True, 3), (False, 1)])
+        with patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + settings.CACHE_PAYLOAD_TTL + 1):
+            response = self.client.get(self.url, params)
+        self.assertEqual([(value["in_stock"], value["count"]) for value in response.data["facets"]["in_stock"]], [(True, 2), (False, 2)])
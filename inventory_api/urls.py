@@ -4,6 +4,8 @@ from rest_framework.authtoken.views import obtain_auth_token
 
 urlpatterns = [
     path("wine-list-api/wines", views.WineView.as_view(), name="wine-list"),
+    path("wine-list-api/wines/search/", views.WineSearchView.as_view(), name="wine-search"),
+    path("wine-list-api/wines/import/", views.WineImportView.as_view(), name="wine-import"),
     path("wine-list-api/<int:pk>/", views.WineRetrieveUpdateDestroyView.as_view(), name="wine-update"),
     path("wine-list-api/dashboard/", views.DashBoardApiView.as_view(), name="dashboard"),
     path("wine-list-api/region/", views.RegionView.as_view(), name="wine-region"),
@@ -13,6 +15,8 @@ urlpatterns = [
     path("wine-list-api/detail/<int:pk>", views.WineRetrieveView.as_view(), name="wine-detail"),
     path("api-token-auth/", obtain_auth_token, name="api_token_auth"),
     path("wine-list-api/sale/", views.RegisterSaleView.as_view(), name="sale"),
+    path("wine-list-api/sale/basket/", views.BasketSaleView.as_view(), name="sale-basket"),
     path("wine-list-api/<int:pk>/restock/", views.RestockView.as_view(), name="restock"),
+    path("wine-list-api/restock/", views.DeliveryRestockView.as_view(), name="restock-delivery"),
     path("wine-list-api/<int:pk>/sales/refund", views.RefundView.as_view(), name="sale-refund")
 ]
@@ -1,28 +1,134 @@
 from rest_framework import generics, status
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from .serializers import *
 from .models import *
-from rest_framework.authentication import TokenAuthentication
+from accounts.authentication import CachedTokenAuthentication
 from accounts.permission import *
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.db.models import F
-from accounts.models import LogModel
+from accounts.audit import audit_log
+from collections import defaultdict
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+from .cache import bump_on_commit, payload_timeout, versioned_key
+from .pagination import WinePagination
+from .importer import FORMATS, WineImporter, format_of
+from . import facets, search
+from analytics import rollup
 
 
 
+def ids_param(facet):
+    return openapi.Parameter(
+        name=facet,
+        in_=openapi.IN_QUERY,
+        description=f"Comma separated {facet} ids, any of them.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    )
+
+wine_filter_params = [
+    *[ids_param(facet) for facet in facets.LOOKUP_FACETS],
+    openapi.Parameter(name="year_min", in_=openapi.IN_QUERY, description="Oldest vintage.", type=openapi.TYPE_INTEGER, required=False),
+    openapi.Parameter(name="year_max", in_=openapi.IN_QUERY, description="Youngest vintage.", type=openapi.TYPE_INTEGER, required=False),
+    openapi.Parameter(
+        name="price_band",
+        in_=openapi.IN_QUERY,
+        description=f"Comma separated retail price bands, any of them: {', '.join(facets.PRICE_BANDS)}.",
+        type=openapi.TYPE_STRING,
+        required=False,
+    ),
+    openapi.Parameter(name="in_stock", in_=openapi.IN_QUERY, description="Only wines in stock (true) or out of stock (false).", type=openapi.TYPE_BOOLEAN, required=False),
+    openapi.Parameter(
+        name="facets",
+        in_=openapi.IN_QUERY,
+        description="Add the number of matching wines per type, style, region, appellation, vintage, price band and stock, each counted without its own filter.",
+        type=openapi.TYPE_BOOLEAN,
+        required=False,
+    ),
+]
+
 class WineView(generics.ListCreateAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
     
-    queryset = WineModel.objects.all()
+    queryset = WineModel.objects.with_related()
     serializer_class = WineSerializer
+    pagination_class = WinePagination
+
+    @swagger_auto_schema(manual_parameters=wine_filter_params)
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        try:
+            conditions = facets.parse_filters(request.query_params)
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        page = self.paginate_queryset(self.get_queryset().filter(*conditions.values()))
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        if request.query_params.get("facets", "").lower() in ("1", "true", "yes"):
+            response.data["facets"] = facets.facet_counts(conditions)
+        return response
     
+query_param = openapi.Parameter(
+    name="q",
+    in_=openapi.IN_QUERY,
+    description=f"Words of the name, appellation, region or vintage, at least {search.MIN_QUERY_LENGTH} characters; partial and misspelled words match too.",
+    type=openapi.TYPE_STRING,
+    required=True,
+)
+
+results_param = openapi.Parameter(
+    name="limit",
+    in_=openapi.IN_QUERY,
+    description=f"Number of wines (default {search.RESULTS}, max {search.MAX_RESULTS}).",
+    type=openapi.TYPE_INTEGER,
+    required=False,
+)
+
+class WineSearchView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsStaffOrManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_summary="Search wines, best match first",
+        manual_parameters=[query_param, results_param],
+        responses={
+            200: "Matching wines, each with its score.",
+            400: "Query too short or limit not valid.",
+            401: "Unauthorized."
+        })
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if len(query) < search.MIN_QUERY_LENGTH:
+            return Response({"message": f"Search for at least {search.MIN_QUERY_LENGTH} characters."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get("limit", search.RESULTS))
+        except ValueError:
+            return Response({"message": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= limit <= search.MAX_RESULTS:
+            return Response({"message": f"limit must be between 1 and {search.MAX_RESULTS}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        scores = WineModel.objects.search(query, limit=limit)
+        wines = WineModel.objects.with_related().in_bulk([pk for pk, _ in scores])
+        results = []
+        for pk, score in scores:
+            # A wine deleted since the index was read.
+            if pk in wines:
+                results.append({**WineSerializer(wines[pk]).data, "score": round(score, 4)})
+        return Response({"query": query, "results": results}, status=status.HTTP_200_OK)
+
 class RegionView(generics.ListCreateAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     queryset = RegionModel.objects.all()
@@ -30,14 +136,14 @@ class RegionView(generics.ListCreateAPIView):
     
 
 class StyleView(generics.ListCreateAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     queryset = WineStyleModel.objects.all()
     serializer_class = StyleSerializer
     
 class TypeView(generics.ListCreateAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     queryset = WineTypeModel.objects.all()
@@ -45,7 +151,7 @@ class TypeView(generics.ListCreateAPIView):
     
 
 class AppellationView(generics.ListCreateAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     queryset = AppellationModel.objects.all()
@@ -53,41 +159,49 @@ class AppellationView(generics.ListCreateAPIView):
     
 
 class DashBoardApiView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsStaffOrManagerOrAdmin]
 
     def get(self, request):
-        regions = RegionSerializer(RegionModel.objects.all(), many=True).data
-        types = TypeSerializer(WineTypeModel.objects.all(), many=True).data
-        styles = StyleSerializer(WineStyleModel.objects.all(), many=True).data
-        appelations = AppellationSerializer(AppellationModel.objects.all(), many=True).data
+        key = versioned_key("dashboard", "payload")
+        cached = cache.get(key)
+        if cached is None:
+            payload = {
+                "regions": RegionSerializer(RegionModel.objects.all(), many=True).data,
+                "wine_types": TypeSerializer(WineTypeModel.objects.all(), many=True).data,
+                "wine_styles": StyleSerializer(WineStyleModel.objects.all(), many=True).data,
+                "Appelation": AppellationSerializer(AppellationModel.objects.all(), many=True).data
+            }
+            payload = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+            etag = '"%s"' % hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+            cached = (etag, payload)
+            cache.set(key, cached, timeout=payload_timeout())
 
-        return Response({
-            "regions": regions,
-            "wine_types": types,
-            "wine_styles": styles,
-            "Appelation": appelations
-        })
+        etag, payload = cached
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(payload, headers=headers)
 
 class WineRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
     
-    queryset = WineModel.objects.all()
+    queryset = WineModel.objects.with_related()
     serializer_class = WineSerializer
     lookup_field ="pk"
     
 
 class WineRetrieveView(generics.RetrieveAPIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsStaffOrManagerOrAdmin]
 
-    queryset = WineModel.objects.all()
+    queryset = WineModel.objects.with_related()
     serializer_class = WineSerializer
     lookup_field = "pk"
 
 class RegisterSaleView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsStaffOrManagerOrAdmin]
 
     @swagger_auto_schema(
@@ -116,27 +230,98 @@ class RegisterSaleView(APIView):
     
     def post(self, request):
         serializer = RegisterSaleSerializer(data=request.data)
-        if serializer.is_valid():
-            try:
-                wine_id = serializer.validated_data["wine_id"]
-                wine = WineModel.objects.select_for_update().get(id=wine_id)
-                quantity = serializer.validated_data["quantity"]
-                if quantity > wine.stock:
-                    return Response({"message": f"Not enough bottles of {wine.name}, available: {wine.stock}"}, status=status.HTTP_400_BAD_REQUEST)
-                else:
-                    with transaction.atomic():
-                        wine.quantity_sold = F("quantity_sold") + quantity
-                        wine.stock = F("stock") - quantity
-                        wine.save()
-                        wine.refresh_from_db()
-                        SaleModel.objects.create(wine=wine, user=request.user, quantity_sold=quantity)
-                        bottle_word = "bottle" if quantity == 1 else "bottles"
-                    return Response({"message": f"{quantity} {bottle_word} of {wine.name} sold."}, status=status.HTTP_202_ACCEPTED)
-            except WineModel.DoesNotExist:
-                return Response({"message": "The wine does not exist"}, status=status.HTTP_404_NOT_FOUND)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        wine_id = serializer.validated_data["wine_id"]
+        quantity = serializer.validated_data["quantity"]
+        with transaction.atomic():
+            sold = WineModel.objects.sell(wine_id, quantity)
+            if sold is None:
+                wine = WineModel.objects.filter(id=wine_id).values("name", "stock").first()
+                if wine is None:
+                    return Response({"message": "The wine does not exist"}, status=status.HTTP_404_NOT_FOUND)
+                return Response({"message": f"Not enough bottles of {wine['name']}, available: {wine['stock']}"}, status=status.HTTP_400_BAD_REQUEST)
+            name, stock, retail_price, price = sold
+            # analytics.signals adds it to the daily rollup.
+            SaleModel.objects.create(wine_id=wine_id, user=request.user, quantity_sold=quantity, unit_price=retail_price, unit_cost=price)
+            # Facet counts only see stock through in_stock.
+            bump_on_commit("valuation", *(["facets"] if stock == 0 else []))
+        bottle_word = "bottle" if quantity == 1 else "bottles"
+        return Response({"message": f"{quantity} {bottle_word} of {name} sold."}, status=status.HTTP_202_ACCEPTED)
     
+class BasketSaleView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsStaffOrManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_description=""" \
+        "Register a basket of sales in one transaction." \
+        "**Access:** Staff, Manager, Admin." \
+        "**Required:**" \
+        "- lines: list of wine_id (int) and quantity (int)." \
+        "**Results:**" \
+        "- If every wine exists and has enough stock all the sales are registered, otherwise nothing is and the failing lines are reported.""",
+        request_body=BasketSerializer,
+        responses={
+            202: "Basket registered.",
+            400: "Data not valid, see errors for the failing lines.",
+            401: "Unauthorized."
+        })
+    def post(self, request):
+        serializer = BasketSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        lines = serializer.validated_data["lines"]
+
+        quantities = defaultdict(int)
+        for line in lines:
+            quantities[line["wine_id"]] += line["quantity"]
+
+        with transaction.atomic():
+            # Locking in primary key order means two baskets sharing wines
+            # always wait on each other in the same order and cannot deadlock.
+            wines = {
+                wine.id: wine
+                for wine in WineModel.objects.select_for_update().filter(id__in=list(quantities)).order_by("id").only("id", "name", "stock", "retail_price", "price")
+            }
+
+            errors = []
+            for index, line in enumerate(lines):
+                wine = wines.get(line["wine_id"])
+                if wine is None:
+                    errors.append({"line": index, "wine_id": line["wine_id"], "message": "The wine does not exist"})
+                elif quantities[wine.id] > wine.stock:
+                    errors.append({"line": index, "wine_id": wine.id, "message": f"Not enough bottles of {wine.name}", "available": wine.stock})
+            if errors:
+                return Response({"message": "Basket not registered.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            WineModel.objects.adjust_stock({wine_id: -qty for wine_id, qty in quantities.items()}, sold=True)
+            sold_out = any(wines[wine_id].stock == qty for wine_id, qty in quantities.items())
+            bump_on_commit("valuation", *(["facets"] if sold_out else []))
+            sales = SaleModel.objects.bulk_create([
+                SaleModel(wine_id=wine_id, user=request.user, quantity_sold=qty, unit_price=wines[wine_id].retail_price, unit_cost=wines[wine_id].price)
+                for wine_id, qty in quantities.items()
+            ])
+            # bulk_create skips post_save, so log the sales and roll them up here.
+            audit_log.log_many(request.user, "sale_created", [""] * len(sales))
+            rollup.record_sales(sales)
+
+        return Response({
+            "message": f"{len(sales)} sales registered.",
+            "sales": [
+                {
+                    "sale_id": sale.id,
+                    "wine_id": sale.wine_id,
+                    "name": wines[sale.wine_id].name,
+                    "quantity": sale.quantity_sold,
+                    "stock": wines[sale.wine_id].stock - sale.quantity_sold,
+                }
+                for sale in sales
+            ],
+        }, status=status.HTTP_202_ACCEPTED)
+
 class RestockView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     @swagger_auto_schema(request_body=RestockSerializer)
@@ -149,15 +334,80 @@ class RestockView(APIView):
                 wine.stock = F("stock") + qty
                 wine.save()
                 wine.refresh_from_db()
-                LogModel.objects.create(
-                    user = request.user,
-                    action = "restock",
-                    details = f"{wine.name}: + {qty}"
-                )
+                audit_log.log(request.user, "restock", f"{wine.name}: + {qty}")
         return Response({"wine": wine.name, "added": qty, "stock": wine.stock}, status=status.HTTP_200_OK)
 
+class DeliveryRestockView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsManagerOrAdmin]
+
+    @swagger_auto_schema(
+        operation_summary="Restock many wines from one delivery",
+        operation_description=""" \
+        "**Access:** Manager, Admin." \
+        "**Required:**" \
+        "- reference: the delivery note number, a delivery is applied once," \
+        "- lines: list of wine_id (int) and quantity (int)." \
+        "**Results:**" \
+        "- Every wine is restocked with one UPDATE and the new stock levels are returned." \
+        "- Sending the same delivery again changes nothing and returns the current stock levels." \
+        "- If a wine doesn't exist nothing is restocked.""",
+        request_body=DeliverySerializer,
+        responses={
+            200: "Delivery applied, or already applied.",
+            400: "Data not valid.",
+            404: "Some wines don't exist, see missing.",
+            409: "The reference was already used for a different delivery.",
+            401: "Unauthorized."
+        })
+    def post(self, request):
+        serializer = DeliverySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        reference = serializer.validated_data["reference"]
+
+        quantities = defaultdict(int)
+        for line in serializer.validated_data["lines"]:
+            quantities[line["wine_id"]] += line["quantity"]
+        # JSON object keys are strings, so is what comes back from the database.
+        lines = {str(wine_id): quantities[wine_id] for wine_id in sorted(quantities)}
+
+        try:
+            with transaction.atomic():
+                # The unique reference makes a concurrent retry wait for this one, then fail.
+                DeliveryModel.objects.create(reference=reference, user=request.user, lines=lines, note=serializer.validated_data.get("note", ""))
+                WineModel.objects.adjust_stock(quantities)
+                wines = list(WineModel.objects.filter(id__in=list(quantities)).order_by("id").values("id", "name", "stock"))
+                missing = sorted(set(quantities) - {wine["id"] for wine in wines})
+                if missing:
+                    transaction.set_rollback(True)
+                    return Response({"message": "Delivery not applied, some wines don't exist.", "missing": missing}, status=status.HTTP_404_NOT_FOUND)
+                audit_log.log_many(request.user, "restock", [f"{wine['name']}: + {quantities[wine['id']]} (delivery {reference})" for wine in wines])
+                back_in_stock = any(wine["stock"] == quantities[wine["id"]] for wine in wines)
+                bump_on_commit("valuation", *(["facets"] if back_in_stock else []))
+        except IntegrityError:
+            delivery = DeliveryModel.objects.filter(reference=reference).first()
+            if delivery is None:
+                raise
+            if delivery.lines != lines:
+                return Response({"message": f"Delivery {reference} was already applied with different lines."}, status=status.HTTP_409_CONFLICT)
+            wines = list(WineModel.objects.filter(id__in=list(quantities)).order_by("id").values("id", "name", "stock"))
+            return Response({
+                "message": f"Delivery {reference} was already applied, nothing changed.",
+                "reference": reference,
+                "duplicate": True,
+                "wines": [{"wine_id": wine["id"], "name": wine["name"], "added": 0, "stock": wine["stock"]} for wine in wines],
+            }, status=status.HTTP_200_OK)
+
+        return Response({
+            "message": f"{sum(quantities.values())} bottles of {len(wines)} wines restocked.",
+            "reference": reference,
+            "duplicate": False,
+            "wines": [{"wine_id": wine["id"], "name": wine["name"], "added": quantities[wine["id"]], "stock": wine["stock"]} for wine in wines],
+        }, status=status.HTTP_200_OK)
+
 class RefundView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsManagerOrAdmin]
 
     @swagger_auto_schema(
@@ -171,16 +421,17 @@ class RefundView(APIView):
         )
         )
     def post(self, request, pk):
-        serializer = SaleSerializer(data=request.data)
+        serializer = RefundSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         if serializer.is_valid():
             qty = serializer.validated_data["refund_qty"]
             return_to_stock = serializer.validated_data["return_to_stock"]
-            sale = get_object_or_404(SaleModel, pk=pk)
-            if qty <= 0 or qty > sale.quantity_sold:
-                return Response({"message": "Bad Request, check parameters."}, status=status.HTTP_400_BAD_REQUEST)
             with transaction.atomic():
+                # Locked, so the rollup share analytics.signals moves is the one this refund changes.
+                sale = get_object_or_404(SaleModel.objects.select_for_update(), pk=pk)
+                if qty <= 0 or qty > sale.quantity_sold:
+                    return Response({"message": "Bad Request, check parameters."}, status=status.HTTP_400_BAD_REQUEST)
                 sale.refund_qty= F("refund_qty") + qty
                 sale.quantity_sold = F("quantity_sold") - qty
                 sale.save()
@@ -190,11 +441,56 @@ class RefundView(APIView):
                     sale.wine.stock = F("stock") + qty
                 sale.wine.save()
                 sale.wine.refresh_from_db()
-            LogModel.objects.create(
-                user=request.user,
-                action="refund",
-                details=f"{qty} bottles of {sale.wine.name} refunded"
-            )
+            audit_log.log(request.user, "refund", f"{qty} bottles of {sale.wine.name} refunded")
         return Response({"message": f"{qty} bottles of {sale.wine.name} refunded" + (" (returned to stock)" if return_to_stock else "")}, status=status.HTTP_200_OK)
-            
-            
\ No newline at end of file
+
+
+file_param = openapi.Parameter(
+    name="file",
+    in_=openapi.IN_FORM,
+    description="CSV with a header row, or JSONL with one object per line.",
+    type=openapi.TYPE_FILE,
+    required=True,
+)
+
+file_format_param = openapi.Parameter(
+    name="file_format",
+    in_=openapi.IN_QUERY,
+    description="Format of the file when its extension doesn't tell.",
+    type=openapi.TYPE_STRING,
+    enum=list(FORMATS),
+    required=False,
+)
+
+class WineImportView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsManagerOrAdmin]
+    parser_classes = [MultiPartParser]
+
+    @swagger_auto_schema(
+        operation_summary="Import a catalog of wines",
+        operation_description=""" \
+        "**Access:** Manager, Admin." \
+        "**Columns:** name, year, country, region, type, style, body, appellation, and optionally price, retail_price, stock, reorder_threshold." \
+        "**Results:**" \
+        "- Missing regions, types, styles and appellations are created." \
+        "- Invalid rows are skipped and reported with their line, every other row is imported.""",
+        manual_parameters=[file_param, file_format_param],
+        responses={
+            200: "Import report: rows read, wines created, rows rejected and their errors.",
+            400: "No file, unknown format or missing columns.",
+            401: "Unauthorized."
+        })
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"message": "Upload the wines as file."}, status=status.HTTP_400_BAD_REQUEST)
+        format = request.query_params.get("file_format") or format_of(upload.name)
+        if format not in FORMATS:
+            return Response({"message": f"Unknown format, use one of: {', '.join(FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = WineImporter(request.user).run(upload.file, format)
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        audit_log.log(request.user, "wine_import", f"{result['created']} wines imported from {upload.name}, {result['rejected']} rows rejected")
+        return Response(result, status=status.HTTP_200_OK)
@@ -0,0 +1,237 @@
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from django.http import HttpResponse
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.views import APIView
+from accounts.authentication import CachedTokenAuthentication
+from accounts.permission import IsAdmin
+
+# Upper bounds in seconds of the request duration histogram.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED = "<unmatched>"
+
+
+def empty_row():
+    return {"count": 0, "seconds": 0.0, "buckets": [0] * len(BUCKETS), "queries": 0, "db_seconds": 0.0, "bytes": 0}
+
+
+class QueryRecorder:
+    """Execute wrapper counting the queries of one request and the time spent in them."""
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class Metrics:
+    """
+    Per route counters of one worker process, dumped every `flush_interval`
+    seconds to `<directory>/metrics-<pid>.json` so whichever worker answers
+    /metrics can add up all of them. Files stay after their worker exits,
+    the counters only ever grow; a worker losing its last `flush_interval`
+    seconds is the price of not writing on every request.
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = Path(directory) if directory else None
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._series = {}
+        self._last_flush = time.monotonic()
+
+    def observe(self, method, route, status, seconds, queries, db_seconds, size):
+        with self._lock:
+            # A forked worker starts from zero, not from the master's counters.
+            if self._pid != os.getpid():
+                self._reset()
+            key = (method, route, str(status))
+            row = self._series.get(key)
+            if row is None:
+                row = self._series[key] = empty_row()
+            row["count"] += 1
+            row["seconds"] += seconds
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    row["buckets"][index] += 1
+                    break
+            row["queries"] += queries
+            row["db_seconds"] += db_seconds
+            row["bytes"] += size
+            due = self.directory is not None and time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        if self.directory is None:
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            rows = [[*key, row] for key, row in self._series.items()]
+            self._last_flush = time.monotonic()
+            path = self.directory / f"metrics-{self._pid}.json"
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(rows))
+            os.replace(tmp, path)
+
+    def collect(self):
+        """The counters of every worker added up, per (method, route, status)."""
+        if self.directory is None:
+            with self._lock:
+                return {key: {**row, "buckets": row["buckets"][:]} for key, row in self._series.items()}
+        self.flush()
+        totals = {}
+        for path in self.directory.glob("metrics-*.json"):
+            try:
+                rows = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for method, route, status, row in rows:
+                total = totals.setdefault((method, route, status), empty_row())
+                for name in ("count", "seconds", "queries", "db_seconds", "bytes"):
+                    total[name] += row[name]
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], row["buckets"])]
+        return totals
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(series):
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    ordered = sorted(series.items())
+    labels = {key: f'method="{escape(key[0])}",route="{escape(key[1])}",status="{escape(key[2])}"' for key, _ in ordered}
+
+    family("wine_hub_http_requests_total", "counter", "Requests served.")
+    for key, row in ordered:
+        lines.append(f"wine_hub_http_requests_total{{{labels[key]}}} {row['count']}")
+
+    family("wine_hub_http_request_duration_seconds", "histogram", "Time from the first middleware to the last byte of the response.")
+    for key, row in ordered:
+        cumulative = 0
+        for bound, count in zip(BUCKETS, row["buckets"]):
+            cumulative += count
+            lines.append(f'wine_hub_http_request_duration_seconds_bucket{{{labels[key]},le="{bound}"}} {cumulative}')
+        lines.append(f'wine_hub_http_request_duration_seconds_bucket{{{labels[key]},le="+Inf"}} {row["count"]}')
+        lines.append(f"wine_hub_http_request_duration_seconds_sum{{{labels[key]}}} {row['seconds']:.6f}")
+        lines.append(f"wine_hub_http_request_duration_seconds_count{{{labels[key]}}} {row['count']}")
+
+    family("wine_hub_db_queries_total", "counter", "SQL queries run while serving the requests.")
+    for key, row in ordered:
+        lines.append(f"wine_hub_db_queries_total{{{labels[key]}}} {row['queries']}")
+
+    family("wine_hub_db_query_duration_seconds_total", "counter", "Time spent waiting on SQL queries.")
+    for key, row in ordered:
+        lines.append(f"wine_hub_db_query_duration_seconds_total{{{labels[key]}}} {row['db_seconds']:.6f}")
+
+    family("wine_hub_http_response_bytes_total", "counter", "Response body bytes sent.")
+    for key, row in ordered:
+        lines.append(f"wine_hub_http_response_bytes_total{{{labels[key]}}} {row['bytes']}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(
+    directory=getattr(settings, "METRICS_DIR", None),
+    flush_interval=getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0),
+)
+atexit.register(metrics.flush)
+
+
+@receiver(setting_changed)
+def follow_directory_setting(setting, **kwargs):
+    # Built at import like the audit log sink, override_settings switches it here.
+    if setting == "METRICS_DIR":
+        directory = getattr(settings, "METRICS_DIR", None)
+        metrics.directory = Path(directory) if directory else None
+
+
+def route_of(request):
+    # The URL pattern, not the path, so /detail/1 and /detail/2 are one series.
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None and match.route else UNMATCHED
+
+
+class MetricsMiddleware:
+    """
+    Records every request in `metrics`: count and duration histogram, SQL
+    queries and their time, response size, per method, route and status.
+    Streamed responses are measured until their last chunk has been sent.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "METRICS_ENABLED", True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        recorder = QueryRecorder()
+        connection.execute_wrappers.append(recorder)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            connection.execute_wrappers.remove(recorder)
+            raise
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, request, response, recorder, started)
+            return response
+        connection.execute_wrappers.remove(recorder)
+        self.record(request, response, recorder, started, len(response.content))
+        return response
+
+    def stream(self, content, request, response, recorder, started):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            if recorder in connection.execute_wrappers:
+                connection.execute_wrappers.remove(recorder)
+            self.record(request, response, recorder, started, size)
+
+    def record(self, request, response, recorder, started, size):
+        metrics.observe(
+            request.method, route_of(request), response.status_code,
+            time.perf_counter() - started, recorder.queries, recorder.seconds, size,
+        )
+
+
+class MetricsView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAdmin]
+
+    @swagger_auto_schema(operation_summary="Per route request, latency, SQL and size metrics of all workers (Prometheus text format)")
+    def get(self, request):
+        return HttpResponse(render(metrics.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,125 @@
+import cProfile
+import io
+import pstats
+import re
+import time
+from collections import defaultdict
+from pathlib import Path
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from accounts.authentication import CachedTokenAuthentication
+
+# ?profile=inline (or 1) answers with the report instead of the response,
+# ?profile=save keeps the response and writes the report to PROFILE_DIR.
+# The X-Profile header takes the same values.
+MODES = {"1": "inline", "true": "inline", "inline": "inline", "save": "save"}
+TOP_FUNCTIONS = 40
+TOP_STATEMENTS = 20
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "profiles"))
+
+
+class StatementRecorder:
+    """Execute wrapper keeping every SQL statement of the request with its duration."""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((sql, params, many, time.perf_counter() - started))
+
+
+def requested_mode(request):
+    value = request.GET.get("profile") or request.headers.get("X-Profile")
+    return MODES.get(value.lower()) if value else None
+
+
+def is_admin(request):
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        try:
+            user = (CachedTokenAuthentication().authenticate(request) or (None, None))[0]
+        except AuthenticationFailed:
+            return False
+    return user is not None and hasattr(user, "userprofile") and user.userprofile.role == "admin"
+
+
+def report(request, response, elapsed, profiler, statements):
+    """Plain text: totals, the slowest and the most repeated SQL, then the profile by cumulative time."""
+    db_time = sum(duration for *_, duration in statements)
+    out = io.StringIO()
+    out.write(f"{request.method} {request.get_full_path()} -> {response.status_code}\n")
+    out.write(f"total {elapsed * 1000:.1f} ms, {len(statements)} queries, db {db_time * 1000:.1f} ms\n\n")
+
+    out.write(f"Slowest SQL (top {TOP_STATEMENTS}):\n")
+    for sql, params, many, duration in sorted(statements, key=lambda statement: -statement[3])[:TOP_STATEMENTS]:
+        out.write(f"{duration * 1000:9.3f} ms  {sql}  {params!r}{' (many)' if many else ''}\n")
+
+    repeated = defaultdict(lambda: [0, 0.0])
+    for sql, _, _, duration in statements:
+        repeated[sql][0] += 1
+        repeated[sql][1] += duration
+    out.write("\nRepeated SQL:\n")
+    for sql, (count, duration) in sorted(repeated.items(), key=lambda item: -item[1][0]):
+        if count > 1:
+            out.write(f"{count:6d} x {duration * 1000:9.3f} ms  {sql}\n")
+
+    out.write(f"\nProfile (top {TOP_FUNCTIONS} by cumulative time):\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Runs a single request under cProfile, with every SQL statement and its
+    timing, when an admin asks for it with ?profile= or X-Profile. Anyone
+    else sending the flag gets the normal response.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = requested_mode(request)
+        if mode is None or not is_admin(request):
+            return self.get_response(request)
+
+        recorder = StatementRecorder()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+                # Streamed bodies run their queries while being sent.
+                if response.streaming:
+                    body = b"".join(response.streaming_content)
+                    response.close()
+                    response = HttpResponse(body, status=response.status_code, headers=response.headers)
+            finally:
+                profiler.disable()
+        elapsed = time.perf_counter() - started
+        text = report(request, response, elapsed, profiler, recorder.statements)
+
+        if mode == "inline":
+            inline = HttpResponse(text, content_type="text/plain; charset=utf-8")
+            inline["X-Profile-Status"] = response.status_code
+            return inline
+
+        name = f"{timezone.now():%Y%m%dT%H%M%S%f}-{request.method}-{re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')[:80]}"
+        directory = profile_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"{name}.txt").write_text(text)
+        # Binary stats for snakeviz / pstats.
+        profiler.dump_stats(directory / f"{name}.prof")
+        response["X-Profile-Report"] = f"{name}.txt"
+        return response
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()  
@@ -49,11 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'wine_inventory.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'wine_inventory.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,6 +96,24 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory is per process: with several gunicorn workers point this to a
+# shared backend, e.g. DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and DJANGO_CACHE_LOCATION=redis://127.0.0.1:6379.
+# A version bump only reaches the worker that made it on a per-process backend,
+# so cached payloads also expire after CACHE_PAYLOAD_TTL seconds: that bounds
+# how long another worker can serve them stale.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("DJANGO_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("DJANGO_CACHE_LOCATION", 'wine-hub'),
+    }
+}
+
+CACHE_PAYLOAD_TTL = int(os.getenv("CACHE_PAYLOAD_TTL", 60))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,12 +157,50 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ]
 }
 
+# Authenticated tokens are cached per process for this many seconds.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv("AUTH_TOKEN_CACHE_TTL", 15))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", 1024))
+
+# Audit log rows are buffered and bulk inserted after commit ("buffered"),
+# or written straight away inside the request ("sync", what TEST_RUNNER uses).
+AUDIT_LOG_MODE = os.getenv("AUDIT_LOG_MODE", "buffered")
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", 500))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", 2.0))
+AUDIT_LOG_MAX_BUFFER = int(os.getenv("AUDIT_LOG_MAX_BUFFER", 10000))
+
+# Log rows older than this many days are moved to gzipped daily files by archive_logs.
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 90))
+LOG_ARCHIVE_DIR = Path(os.getenv("LOG_ARCHIVE_DIR", BASE_DIR / "log_archive"))
+
+# Page size of the keyset paginated endpoints when the client asks for none.
+# Not DRF's PAGE_SIZE: other list endpoints stay unpaginated.
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+
+# Upper bound for the ?page_size= (or ?limit=) a client can ask for.
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 500))
+
+# Most cells /analytics/cube/ returns for one query.
+CUBE_MAX_CELLS = int(os.getenv("CUBE_MAX_CELLS", 5000))
+
+# Per route request metrics served on /metrics. Every worker dumps its counters
+# to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, /metrics adds them up;
+# an empty METRICS_DIR keeps them per process (what TEST_RUNNER uses).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_DIR = os.getenv("METRICS_DIR", str(Path(tempfile.gettempdir()) / "wine-hub-metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 1.0))
+
+# manage.py test writes audit logs inline and keeps metrics per process.
+TEST_RUNNER = "wine_inventory.test_runner.TestRunner"
+
+# Reports of the requests an admin profiles with ?profile=save (or X-Profile: save).
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "profiles"))
+
 SWAGGER_SETTINGS = {
     "USE_SESSION_AUTH": False,
     "SECURITY_DEFINITIONS": {
@@ -0,0 +1,117 @@
+import json
+import tempfile
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from accounts.authentication import token_cache
+from wine_inventory.metrics import Metrics, metrics
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        metrics._reset()
+        self.tokens = {}
+        for role in ("admin", "manager", "staff"):
+            user = User.objects.create_user(username=role.title(), password="Password123")
+            user.userprofile.role = role
+            user.userprofile.save()
+            self.tokens[role] = Token.objects.get(user=user).key
+        self.client = APIClient()
+
+    def get(self, url, role):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens[role]}")
+        return self.client.get(url)
+
+    def test_requests_recorded_per_route(self):
+        self.get("/analytics/low-stock/", "staff")
+        self.get("/analytics/low-stock/?limit=5", "staff")
+        response = self.get("/accounts/logs/", "manager")
+        body = b"".join(response.streaming_content)
+
+        series = metrics.collect()
+        low_stock = series[("GET", "analytics/low-stock/", "200")]
+        self.assertEqual(low_stock["count"], 2)
+        self.assertGreater(low_stock["queries"], 0)
+        self.assertEqual(sum(low_stock["buckets"]), 2)
+        # Streamed bodies are measured once fully sent
+        logs = series[("GET", "accounts/logs/", "200")]
+        self.assertEqual(logs["bytes"], len(body))
+        self.assertGreater(logs["queries"], 0)
+
+    def test_metrics_endpoint(self):
+        self.get("/analytics/low-stock/", "staff")
+
+        response = self.get("/metrics", "staff")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.get("/metrics", "admin")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn('wine_hub_http_requests_total{method="GET",route="analytics/low-stock/",status="200"} 1', text)
+        self.assertIn('wine_hub_http_request_duration_seconds_bucket{method="GET",route="analytics/low-stock/",status="200",le="+Inf"} 1', text)
+        self.assertIn('wine_hub_http_requests_total{method="GET",route="metrics",status="403"} 1', text)
+        self.assertIn("# TYPE wine_hub_db_queries_total counter", text)
+
+    def test_workers_added_up_through_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            worker = Metrics(directory=directory, flush_interval=60)
+            worker.observe("GET", "analytics/low-stock/", 200, 0.02, 3, 0.004, 100)
+            # What another worker process left behind
+            other = [["GET", "analytics/low-stock/", "200", {
+                "count": 2, "seconds": 0.5, "buckets": [0, 0, 0, 0, 0, 1, 1, 0, 0, 0, 0],
+                "queries": 4, "db_seconds": 0.1, "bytes": 300,
+            }]]
+            (Path(directory) / "metrics-1.json").write_text(json.dumps(other))
+
+            total = worker.collect()[("GET", "analytics/low-stock/", "200")]
+            self.assertEqual(total["count"], 3)
+            self.assertEqual(total["queries"], 7)
+            self.assertEqual(total["bytes"], 400)
+            self.assertEqual(total["buckets"][:7], [0, 0, 1, 0, 0, 1, 1])
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.tokens = {}
+        for role in ("admin", "staff"):
+            user = User.objects.create_user(username=role.title(), password="Password123")
+            user.userprofile.role = role
+            user.userprofile.save()
+            self.tokens[role] = Token.objects.get(user=user).key
+        self.client = APIClient()
+
+    def get(self, url, role, **headers):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.tokens[role]}")
+        return self.client.get(url, headers=headers)
+
+    def test_inline_report_for_admin(self):
+        response = self.get("/analytics/quarter-trend/?profile=1", "admin")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Profile-Status"], "200")
+        text = response.content.decode()
+        self.assertIn("GET /analytics/quarter-trend/?profile=1 -> 200", text)
+        self.assertIn("analytics_dailysalesrollup", text)
+        self.assertIn("Profile (top", text)
+
+    def test_flag_ignored_for_non_admin(self):
+        response = self.get("/analytics/low-stock/", "staff", X_Profile="inline")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("wines", response.json())
+        self.assertNotIn("X-Profile-Report", response)
+
+    def test_saved_report_keeps_response(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(PROFILE_DIR=directory):
+            response = self.get("/accounts/logs/", "admin", X_Profile="save")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertIn("Admin", json.loads(response.content)["results"])
+            saved = Path(directory) / response["X-Profile-Report"]
+            self.assertIn("accounts_logmodel", saved.read_text())
+            self.assertTrue(saved.with_suffix(".prof").exists())
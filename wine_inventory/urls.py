@@ -19,6 +19,7 @@ from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from .metrics import MetricsView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -44,6 +45,7 @@ urlpatterns = [
     path("", include("inventory_api.urls")),
     path("analytics/", include("analytics.urls")),
     path("accounts/", include("accounts.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     re_path(r"^swagger(?P<format>\.json|\.yaml)$", schema_view.without_ui(cache_timeout=0), name="schema-json"),
     path("", schema_view.with_ui("swagger", cache_timeout=0), name="schema-swagger-ui"),
     path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),